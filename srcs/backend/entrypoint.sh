@@ -4,11 +4,21 @@
 echo "Deploying smart contract ..."
 python3 blockchain/deploy.py
 
-# Run Django migrations
+# Run Django migrations, they are committed with the model changes
 
-python3 manage.py makemigrations
 python3 manage.py migrate
 
 # Start the application
 
-daphne -e ssl:8000:privateKey=ssl/key.pem:certKey=ssl/cert.pem backend.asgi:application
\ No newline at end of file
+# Worker i serves port 8000 + i and hosts its share of the live matches, see gameBackend/sharding.py.
+# nginx spreads the API and the friendship sockets over all of them: its conf/pong-workers.sh reads the
+# same PONG_WORKERS from .env, so set it there rather than for this container alone.
+
+WORKERS=${PONG_WORKERS:-1}
+for ((i = 1; i < WORKERS; i++)); do
+    PONG_WORKER_ID=$i daphne -e ssl:$((8000 + i)):privateKey=ssl/key.pem:certKey=ssl/cert.pem \
+        -u /tmp/pong-worker-$i.sock backend.asgi:application &
+done
+
+PONG_WORKER_ID=0 exec daphne -e ssl:8000:privateKey=ssl/key.pem:certKey=ssl/cert.pem \
+    -u /tmp/pong-worker-0.sock backend.asgi:application
\ No newline at end of file
@@ -15,15 +15,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-from gameBackend.views import games, create_new_game
-
-game_locks = {}
+from gameBackend.reaper import reaper
+from gameBackend import ai, sharding
+from gameBackend.heartbeat import Heartbeat
+from gameBackend.verification import client_seed
 
 class FriendshipConsumer(AsyncWebsocketConsumer):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.game_locks = game_locks
-
     @database_sync_to_async
     def check_wsAuth(self):
         token = self.scope["cookies"].get("token")
@@ -90,16 +87,19 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
+        reaper.start()
         self.group_name = f"friendship_group_{self.user.id}"
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         
         await self.accept()
+        self.heartbeat = Heartbeat(self, 'friendship', self.user.user_name)
+        self.heartbeat.start()
 
         try:
             self.user.online_status = True
-            await self.user.save()
+            await self.user.asave()
         except Exception as e:
-            print(f"Error during disconnect: {e}")
+            print(f"Error during connect: {e}")
 
         pending_friend_requests = await self.get_pending_friend_requests(self.user)
         if pending_friend_requests:
@@ -116,11 +116,13 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
             }))
 
     async def disconnect(self, close_code):
+        if hasattr(self, 'heartbeat'):
+            self.heartbeat.stop()
         try:
             if hasattr(self, 'group_name'):
                 await self.channel_layer.group_discard(self.group_name, self.channel_name)
             self.user.online_status = False
-            await self.user.save()
+            await self.user.asave()
         except Exception as e:
             print(f"Error during disconnect: {e}")
 
@@ -151,6 +153,8 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
                 await self.handle_accept_tournament_invite(data)
             elif message_type == "report_match_result":
                 await self.handle_match_result(data)
+            elif message_type == "pong":
+                self.heartbeat.pong(data.get('id'))
             else:
                 logger.warning(f"Unknown message type: {message_type}")
         except json.JSONDecodeError:
@@ -254,12 +258,8 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
             from_username = result['from_username']
             to_username = self.user.user_name
                 
-            lock = self.game_locks.setdefault(game_id, asyncio.Lock())
-            async with lock:
-                if game_id not in games:
-                    games[game_id] = create_new_game(to_username, from_username, 'online')
-                    games[game_id]['player1_status'] = 'online'
-                    games[game_id]['player2_status'] = 'online'
+            # Players are marked online when their game socket connects
+            await sharding.acreate_game(game_id, to_username, from_username, 'online')
 
             await self.channel_layer.group_send(
                 f"friendship_group_{from_user_id}",
@@ -387,22 +387,47 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
             }))
             return
 
+        # A local game is played by one user on both paddles, an ai one against a bot
+        game_opponent = 'ai' if data.get('opponent') == 'ai' else 'local'
+        difficulty = None
+        if game_opponent == 'ai':
+            difficulty = data.get('difficulty') or ai.DEFAULT_LEVEL
+            if ai.np is None or difficulty not in ai.LEVELS:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'user': user,
+                    'message': 'AI opponents are not available' if ai.np is None else 'Invalid difficulty'
+                }))
+                return
+
         try:
-            game = await self.create_local_game(self.user)
+            game = await self.create_local_game(self.user, game_opponent)
             game_id = str(game.id)
+
+            if game_opponent == 'local' and data.get('simulation') == 'client':
+                # The browser runs the match itself and uploads it to submit_local_match when it is over
+                await self.send(text_data=json.dumps({
+                    'type': 'local_game_created',
+                    'game_id': game_id,
+                    'user': self.user.user_name,
+                    'game_opponent': game_opponent,
+                    'simulation': 'client',
+                    'seed': client_seed(game.id),
+                    'tick_rate': settings.PONG_TICK_RATE,
+                    'message': 'Local game created successfully'
+                }))
+                return
             
-            lock = self.game_locks.setdefault(game_id, asyncio.Lock())
-            async with lock:
-                if game_id not in games:
-                    games[game_id] = create_new_game(self.user.user_name, self.user.user_name, 'local')
-                    games[game_id]['player1_status'] = 'online'
-                    games[game_id]['player2_status'] = 'online'
-                    games[game_id]['status'] = 'Playing'
+            # Both paddles are played from this browser
+            await sharding.acreate_game(game_id, self.user.user_name, self.user.user_name, game_opponent,
+                                        ai_level=difficulty, online=True)
             
             await self.send(text_data=json.dumps({
                 'type': 'local_game_created',
                 'game_id': game_id,
                 'user': self.user.user_name,
+                'game_opponent': game_opponent,
+                'difficulty': difficulty,
                 'message': 'Local game created successfully'
             }))
         except Exception as e:
@@ -480,14 +505,14 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
             }))
 
     @database_sync_to_async
-    def create_local_game(self, user):
+    def create_local_game(self, user, game_opponent='local'):
         try:
-            game_name = f"{user.user_name} (Local)"
+            game_name = f"{user.user_name} ({'AI' if game_opponent == 'ai' else 'Local'})"
             game = Match.objects.create(
                 match_name=game_name,
                 player_1=user,
                 player_2=user,
-                game_opponent='local'
+                game_opponent=game_opponent
             )
             return game
         except Exception as e:
@@ -821,14 +846,9 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
         tournament.semifinal_2 = semi2
         await database_sync_to_async(tournament.save)()
 
-        # Use per-game locks for initializing semifinals
-        semi1_lock = self.game_locks.setdefault(str(semi1.id), asyncio.Lock())
-        semi2_lock = self.game_locks.setdefault(str(semi2.id), asyncio.Lock())
-        
-        async with semi1_lock:
-            games[str(semi1.id)] = create_new_game(participants[0].user_name, participants[1].user_name, 'online')
-        async with semi2_lock:
-            games[str(semi2.id)] = create_new_game(participants[2].user_name, participants[3].user_name, 'online')
+        # Each semifinal is hosted by the worker that owns it
+        await sharding.acreate_game(str(semi1.id), participants[0].user_name, participants[1].user_name, 'online')
+        await sharding.acreate_game(str(semi2.id), participants[2].user_name, participants[3].user_name, 'online')
 
         # Notify participants to start semifinals
         logger.info(f"Tournament {tournament.id} started: Semi1 {semi1.id} ({participants[0].user_name} vs {participants[1].user_name}), Semi2 {semi2.id} ({participants[2].user_name} vs {participants[3].user_name})")
@@ -857,21 +877,21 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
         logger.info(f"Waiting for semifinals {semi1_id} and {semi2_id} to complete in tournament {tournament.id}")
 
         while True:
-            # Check in-memory status with fallback to database
-            semi1_done = games.get(semi1_id, {}).get('status', 'pending') == 'done'
-            semi2_done = games.get(semi2_id, {}).get('status', 'pending') == 'done'
-
-            # Database fallback to ensure accuracy
-            if not (semi1_done and semi2_done):
-                try:
-                    semi1 = await database_sync_to_async(Match.objects.get)(id=semi1_id)
-                    semi2 = await database_sync_to_async(Match.objects.get)(id=semi2_id)
-                    semi1_done = semi1.match_status == Match.MatchStatusChoices.DONE
-                    semi2_done = semi2.match_status == Match.MatchStatusChoices.DONE
-                except Match.DoesNotExist as e:
-                    logger.error(f"Semifinal match not found: {e}")
-                    break
+            # From the database only: a match done in the registry is recorded later by its completion job
+            try:
+                semi1 = await database_sync_to_async(Match.objects.get)(id=semi1_id)
+                semi2 = await database_sync_to_async(Match.objects.get)(id=semi2_id)
+            except Match.DoesNotExist as e:
+                logger.error(f"Semifinal match not found: {e}")
+                break
 
+            # A semifinal both players abandoned has no winner to send to the final
+            if Match.MatchStatusChoices.CANCELLED in (semi1.match_status, semi2.match_status):
+                await self.cancel_tournament(tournament, 'A semifinal was abandoned by both players')
+                return
+
+            semi1_done = semi1.match_status == Match.MatchStatusChoices.DONE and semi1.match_winner_id is not None
+            semi2_done = semi2.match_status == Match.MatchStatusChoices.DONE and semi2.match_winner_id is not None
             if semi1_done and semi2_done:
                 logger.info(f"Both semifinals {semi1_id} and {semi2_id} are done for tournament {tournament.id}")
                 break
@@ -921,9 +941,7 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
             return
 
         # Initialize the final game state
-        final_lock = self.game_locks.setdefault(str(final_match.id), asyncio.Lock())
-        async with final_lock:
-            games[str(final_match.id)] = create_new_game(winner1.user_name, winner2.user_name, 'online')
+        await sharding.acreate_game(str(final_match.id), winner1.user_name, winner2.user_name, 'online')
 
         # Notify participants to start the final
         participants = await database_sync_to_async(lambda: list(tournament.participants.all()))()
@@ -940,6 +958,20 @@ class FriendshipConsumer(AsyncWebsocketConsumer):
                 }
             )
 
+    async def cancel_tournament(self, tournament, error):
+        def sync_cancel_tournament():
+            tournament.status = 'cancelled'
+            tournament.save()
+            return list(tournament.participants.all())
+
+        participants = await database_sync_to_async(sync_cancel_tournament)()
+        logger.info(f"Tournament {tournament.id} cancelled: {error}")
+        for participant in participants:
+            await self.channel_layer.group_send(
+                f"friendship_group_{participant.id}",
+                {'type': 'tournament_error', 'error': error, 'tournament_id': str(tournament.id)}
+            )
+
     @database_sync_to_async
     def get_match_winner(self, match):
         """Safely retrieve the match winner, handling potential missing or uncached values."""
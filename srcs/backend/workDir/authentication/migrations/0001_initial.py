@@ -0,0 +1,93 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:31
+
+import authentication.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlacklistedTokens',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255)),
+                ('blacklisted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('friendship_status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected')], default='pending', max_length=15)),
+                ('friendship_date', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LoggedOutTokens',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=255)),
+                ('logged_out_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Oauth2AuthenticationData',
+            fields=[
+                ('Oauth2_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('Oauth2Token', models.CharField(max_length=255)),
+                ('Oauth2TokenExpiresIn', models.IntegerField()),
+                ('Oauth2RefreshToken', models.CharField(max_length=255)),
+                ('Oauth2CreateAt', models.IntegerField()),
+                ('Oauth2ValidUntil', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TwoFactorData',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('two_factor_digits', models.CharField(max_length=6)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Users',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('eth_address', models.CharField(blank=True, max_length=42, null=True, unique=True)),
+                ('user_name', models.CharField(max_length=255, unique=True)),
+                ('profile_picture_url', models.ImageField(blank=True, null=True, upload_to=authentication.models.user_directory_path)),
+                ('profile_pic_42', models.URLField(blank=True, null=True)),
+                ('first_name', models.CharField(max_length=128)),
+                ('last_name', models.CharField(max_length=128)),
+                ('bio_description', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('intra_url', models.URLField(blank=True, null=True)),
+                ('intra_id', models.IntegerField(blank=True, null=True, unique=True)),
+                ('password_hash', models.CharField(blank=True, max_length=128, null=True)),
+                ('otp_password', models.CharField(blank=True, max_length=6)),
+                ('otp_expiry', models.DateTimeField(blank=True, null=True)),
+                ('account_status', models.CharField(choices=[('active', 'Active'), ('banned', 'Banned'), ('deactivated', 'Deactivated')], default='active', max_length=15)),
+                ('two_factor_enabled', models.BooleanField(default=False)),
+                ('has_profile_pic', models.BooleanField(default=False)),
+                ('has_42_image', models.BooleanField(default=False)),
+                ('oauth2_authentified', models.BooleanField(default=False)),
+                ('is_Email_Verified', models.BooleanField(default=False)),
+                ('registration_date', models.DateTimeField(auto_now_add=True)),
+                ('online_status', models.BooleanField(default=False)),
+                ('last_login', models.DateTimeField(blank=True, null=True)),
+                ('last_password_change', models.DateTimeField(blank=True, null=True)),
+                ('ppp_rating', models.IntegerField(db_index=True, unique=True)),
+                ('title', models.CharField(default='NEWBIE')),
+                ('matches_played', models.IntegerField(default=0)),
+                ('matches_won', models.IntegerField(default=0)),
+                ('win_ratio', models.IntegerField(default=0)),
+                ('planet', models.URLField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+        ('gameBackend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='users',
+            name='matches_history',
+            field=models.ManyToManyField(to='gameBackend.match'),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='oauth2_data',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='authentication.oauth2authenticationdata'),
+        ),
+        migrations.AddField(
+            model_name='users',
+            name='two_factor_info',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='authentication.twofactordata'),
+        ),
+        migrations.AddField(
+            model_name='twofactordata',
+            name='user_id',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='authentication.users'),
+        ),
+        migrations.AddField(
+            model_name='oauth2authenticationdata',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='oauth2_info', to='authentication.users'),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='from_user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='user_id', to='authentication.users'),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='to_user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_id', to='authentication.users'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='friendship',
+            unique_together={('from_user', 'to_user')},
+        ),
+    ]
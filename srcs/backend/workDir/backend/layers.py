@@ -0,0 +1,476 @@
+"""
+Channel layer shared by the daphne workers of one host, without a broker.
+
+Each worker runs a ``PeerChannelLayer`` that listens on its own Unix socket and
+keeps one connection open to every other worker. Channels created by a worker
+carry its index in their name, as in ``specific..worker2!AbCd``. Their messages
+are queued in that worker only, so ``receive`` never leaves the process and a
+``send`` to another worker's channel is a single write on that connection.
+
+Group membership is kept by the worker owning each channel. A worker tells its
+peers when one of its groups gets its first member or loses its last one.
+``group_send`` then writes the message once to each worker with members in the
+group, not once per member. A group whose members all live in one worker, like
+the players of a match, costs no more than with ``InMemoryChannelLayer``.
+
+Capacity and expiry work as in the standard layers: ``send`` raises
+``ChannelFull`` when the channel's queue is full, even on another worker,
+``group_send`` skips full channels, and messages left unread for ``expiry``
+seconds are dropped with their channel's group memberships. Memberships older
+than ``group_expiry`` seconds end as well. Messages to a worker that is down are
+dropped.
+
+Frames are length-prefixed ``marshal`` dumps, which carry every type a channel
+message may hold. Connections are authenticated with a token derived from
+``secret``. The layer runs on the event loop of its first call, calls from other
+threads' loops are handed over to it.
+
+    CHANNEL_LAYERS = {'default': {
+        'BACKEND': 'backend.layers.PeerChannelLayer',
+        'CONFIG': {'worker': 0, 'workers': 4, 'path': '/tmp/pong-layer-{worker}.sock', 'secret': SECRET_KEY},
+    }}
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import logging
+import marshal
+import os
+import random
+import re
+import string
+import struct
+import time
+from copy import deepcopy
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+LENGTH = struct.Struct('<I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+RECONNECT_DELAY = 1.0 # seconds between two attempts to reach a worker that is down
+CONNECT_TIMEOUT = 1.0 # seconds a starting layer waits for each worker it connects to
+
+# Operations, the first item of every frame
+HELLO = 0 # worker, token: first frame of a connection
+GROUPS = 1 # groups: every group the sender has members in, answer to HELLO
+JOIN = 2 # group: the sender's first member joined the group
+LEAVE = 3 # group: the sender's last member left the group
+SEND = 4 # request id or None, channel, message
+ACK = 5 # request id, whether the message was queued
+GROUP_SEND = 6 # group, message
+GROUP_ADD = 7 # group, channel owned by the receiver
+GROUP_DISCARD = 8 # group, channel owned by the receiver
+
+CHANNEL_WORKER = re.compile(r'\.worker(\d+)!')
+
+
+def encode(frame):
+    data = marshal.dumps(frame)
+    return LENGTH.pack(len(data)) + data
+
+
+async def read_frame(reader):
+    """The next frame from ``reader``, None once the connection is closed."""
+    try:
+        header = await reader.readexactly(LENGTH.size)
+        (size,) = LENGTH.unpack(header)
+        if size > MAX_FRAME_SIZE:
+            raise ValueError(f"Frame of {size} bytes")
+        frame = marshal.loads(await reader.readexactly(size))
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    if not isinstance(frame, tuple) or not frame:
+        raise ValueError("Malformed frame")
+    return frame
+
+
+class Peer:
+    """The connection of this worker to another one, opened by this worker."""
+
+    def __init__(self, layer, worker):
+        self.layer = layer
+        self.worker = worker
+        self.writer = None
+        self.groups = set()
+        self.pending = {}
+        self.wake = asyncio.Event()
+        self.task = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        """Open the connection and read the worker's groups, returns its reader or None when it is down."""
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(self.layer.path.format(worker=self.worker)), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        try:
+            writer.write(encode((HELLO, self.layer.worker, self.layer.token)))
+            frame = await asyncio.wait_for(read_frame(reader), CONNECT_TIMEOUT)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            frame = None
+        if frame is None or frame[0] != GROUPS:
+            writer.close()
+            return None
+        self.groups = set(frame[1])
+        self.writer = writer
+        logger.debug(f"Channel layer of worker {self.layer.worker} connected to worker {self.worker}")
+        return reader
+
+    async def run(self, reader=None):
+        """Keep the connection open, reading the worker's answers and group changes."""
+        while True:
+            if reader is None:
+                reader = await self.connect()
+            if reader is None:
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), RECONNECT_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                while True:
+                    frame = await read_frame(reader)
+                    if frame is None:
+                        break
+                    self.handle(frame)
+            except ValueError as e:
+                logger.error(f"Channel layer: bad frame from worker {self.worker}: {e}")
+            finally:
+                self.disconnected()
+            reader = None
+
+    def handle(self, frame):
+        op = frame[0]
+        if op == ACK:
+            future = self.pending.pop(frame[1], None)
+            if future is not None and not future.done():
+                future.set_result(frame[2])
+        elif op == JOIN:
+            self.groups.add(frame[1])
+        elif op == LEAVE:
+            self.groups.discard(frame[1])
+
+    def disconnected(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.writer = None
+        self.groups = set()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_result(None)
+        self.pending.clear()
+
+    async def write(self, frame):
+        """Write a frame, returns False when the worker is down."""
+        writer = self.writer
+        if writer is None:
+            return False
+        try:
+            writer.write(encode(frame))
+            await writer.drain()
+        except (ConnectionError, RuntimeError):
+            return False
+        return True
+
+    async def request(self, frame_id, frame, timeout):
+        """Write a frame answered by an ACK and return the answer, None when there was none."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending[frame_id] = future
+        try:
+            if not await self.write(frame):
+                return None
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.pending.pop(frame_id, None)
+
+
+class PeerChannelLayer(BaseChannelLayer):
+    """
+    Channel layer for ``workers`` processes on one host, this one being ``worker``.
+
+    ``path`` is the Unix socket of a worker, formatted with its index.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, worker=0, workers=1, path='/tmp/channel-layer-{worker}.sock', secret='', expiry=60,
+                 group_expiry=86400, capacity=100, channel_capacity=None, send_timeout=5, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.worker = worker
+        self.workers = workers
+        self.path = path
+        self.token = hmac.new(secret.encode(), b'peer-channel-layer', hashlib.sha256).hexdigest()
+        self.group_expiry = group_expiry
+        self.send_timeout = send_timeout
+        self.loop = None
+        self.starting = None
+        self._reset()
+
+    def _reset(self):
+        self.channels = {}
+        self.groups = {}
+        self.peers = {}
+        self.incoming = {}
+        self.server = None
+        self.request_ids = itertools.count()
+
+    # Startup
+
+    async def _run(self, method, *args):
+        """Run ``method`` on the layer's event loop, starting the layer on the first call."""
+        loop = asyncio.get_running_loop()
+        if self.loop is None or self.loop.is_closed():
+            self.loop = loop
+            self.starting = None
+            self._reset()
+        if loop is not self.loop:
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._run(method, *args), self.loop))
+
+        if self.starting is None:
+            self.starting = asyncio.ensure_future(self._start())
+        if not self.starting.done():
+            await asyncio.shield(self.starting)
+        return await method(*args)
+
+    async def _start(self):
+        path = self.path.format(worker=self.worker)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = await asyncio.start_unix_server(self._serve, path)
+        os.chmod(path, 0o600)
+
+        peers = [Peer(self, worker) for worker in range(self.workers) if worker != self.worker]
+        readers = await asyncio.gather(*(peer.connect() for peer in peers))
+        for peer, reader in zip(peers, readers):
+            self.peers[peer.worker] = peer
+            peer.task = asyncio.ensure_future(peer.run(reader))
+        logger.info(f"Channel layer of worker {self.worker} listening on {path}, "
+                    f"{sum(peer.connected for peer in peers)}/{len(peers)} other workers up")
+
+    async def _serve(self, reader, writer):
+        """A connection opened by another worker, which sends its messages and requests on it."""
+        worker = None
+        try:
+            frame = await asyncio.wait_for(read_frame(reader), CONNECT_TIMEOUT)
+            if (frame is None or frame[0] != HELLO or len(frame) != 3 or not isinstance(frame[1], int)
+                    or not isinstance(frame[2], str) or not hmac.compare_digest(frame[2], self.token)):
+                logger.warning("Channel layer: rejected a connection without a valid token")
+                return
+            worker = frame[1]
+            previous = self.incoming.get(worker)
+            if previous is not None:
+                previous.close()
+            self.incoming[worker] = writer
+            writer.write(encode((GROUPS, list(self.groups))))
+
+            # The worker just started or came back, reach it now instead of at the next retry
+            peer = self.peers.get(worker)
+            if peer is not None and not peer.connected:
+                peer.wake.set()
+
+            while True:
+                frame = await read_frame(reader)
+                if frame is None:
+                    break
+                self._handle(writer, frame)
+        except (ValueError, asyncio.TimeoutError) as e:
+            logger.error(f"Channel layer: bad frame from worker {worker}: {e}")
+        except asyncio.CancelledError:
+            # The event loop is shutting down
+            pass
+        finally:
+            if worker is not None and self.incoming.get(worker) is writer:
+                del self.incoming[worker]
+            writer.close()
+
+    def _handle(self, writer, frame):
+        op = frame[0]
+        if op == SEND:
+            _, request_id, channel, message = frame
+            try:
+                self._put(channel, message)
+                queued = True
+            except ChannelFull:
+                queued = False
+            if request_id is not None:
+                writer.write(encode((ACK, request_id, queued)))
+        elif op == GROUP_SEND:
+            self._clean_expired()
+            self._put_group(frame[1], frame[2])
+        elif op == GROUP_ADD:
+            self._join(frame[1], frame[2])
+        elif op == GROUP_DISCARD:
+            self._leave(frame[1], frame[2])
+
+    def _announce(self, frame):
+        data = encode(frame)
+        for writer in self.incoming.values():
+            writer.write(data)
+
+    # Local channels
+
+    def owner(self, channel):
+        """Worker whose process receives on ``channel``, channels without a worker are local."""
+        match = CHANNEL_WORKER.search(channel)
+        return int(match.group(1)) if match else self.worker
+
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _put(self, channel, message):
+        try:
+            self._queue(channel).put_nowait((time.time() + self.expiry, message))
+        except asyncio.QueueFull:
+            raise ChannelFull(channel)
+
+    def _put_group(self, group, message):
+        for channel in list(self.groups.get(group, ())):
+            try:
+                self._put(channel, deepcopy(message))
+            except ChannelFull:
+                pass
+
+    def _join(self, group, channel):
+        channels = self.groups.get(group)
+        if channels is None:
+            channels = self.groups[group] = {}
+            self._announce((JOIN, group))
+        channels[channel] = time.time()
+
+    def _leave(self, group, channel):
+        channels = self.groups.get(group)
+        if channels:
+            channels.pop(channel, None)
+            if not channels:
+                del self.groups[group]
+                self._announce((LEAVE, group))
+
+    def _clean_expired(self):
+        """Drop expired messages, their channels' memberships, and memberships older than ``group_expiry``."""
+        now = time.time()
+        for channel, queue in list(self.channels.items()):
+            while not queue.empty() and queue._queue[0][0] < now:
+                queue.get_nowait()
+                for group in list(self.groups):
+                    self._leave(group, channel)
+                if queue.empty():
+                    self.channels.pop(channel, None)
+
+        timeout = now - self.group_expiry
+        for group, channels in list(self.groups.items()):
+            for channel, joined in list(channels.items()):
+                if joined < timeout:
+                    self._leave(group, channel)
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific.'):
+        return '%s.worker%d!%s' % (prefix, self.worker, ''.join(random.choice(string.ascii_letters) for i in range(12)))
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        await self._run(self._send, channel, message)
+
+    async def _send(self, channel, message):
+        worker = self.owner(channel)
+        if worker == self.worker:
+            self._put(channel, deepcopy(message))
+            return
+
+        peer = self.peers.get(worker)
+        request_id = next(self.request_ids)
+        queued = await peer.request(request_id, (SEND, request_id, channel, message), self.send_timeout) if peer else None
+        if queued is False:
+            raise ChannelFull(channel)
+        if queued is None:
+            logger.warning(f"Channel layer: message to {channel} dropped, worker {worker} did not answer")
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        return await self._run(self._receive, channel)
+
+    async def _receive(self, channel):
+        self._clean_expired()
+        queue = self._queue(channel)
+        try:
+            _, message = await queue.get()
+        finally:
+            if queue.empty():
+                self.channels.pop(channel, None)
+        return message
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        await self._run(self._group_change, GROUP_ADD, group, channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+        await self._run(self._group_change, GROUP_DISCARD, group, channel)
+
+    async def _group_change(self, op, group, channel):
+        worker = self.owner(channel)
+        if worker == self.worker:
+            if op == GROUP_ADD:
+                self._join(group, channel)
+            else:
+                self._leave(group, channel)
+        elif worker in self.peers:
+            await self.peers[worker].write((op, group, channel))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+        await self._run(self._group_send, group, message)
+
+    async def _group_send(self, group, message):
+        self._clean_expired()
+        self._put_group(group, message)
+        for peer in self.peers.values():
+            if group in peer.groups:
+                await peer.write((GROUP_SEND, group, message))
+
+    async def flush(self):
+        await self._run(self._flush)
+
+    async def _flush(self):
+        for group in list(self.groups):
+            self._announce((LEAVE, group))
+        self.channels = {}
+        self.groups = {}
+
+    async def close(self):
+        """Stop listening and close the connections to the other workers."""
+        if self.loop is None or self.loop.is_closed() or self.starting is None:
+            return
+        await self._run(self._close)
+
+    async def _close(self):
+        for peer in self.peers.values():
+            peer.task.cancel()
+            peer.disconnected()
+        for writer in list(self.incoming.values()):
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+        self.loop = None
+        self.starting = None
+        self._reset()
@@ -100,6 +100,69 @@ CHANNEL_LAYERS = {
     }
 }
 
+# Pong physics engine: 'scalar' steps each match through game_update, 'numpy' steps all matches at once
+PONG_ENGINE = config('PONG_ENGINE', default='scalar')
+
+# Physics steps per second, and game frames sent to clients per second (a match may override the send rate)
+PONG_TICK_RATE = config('PONG_TICK_RATE', default=60, cast=int)
+PONG_SEND_RATE = config('PONG_SEND_RATE', default=60, cast=int)
+
+# Game frames sent to spectators per second, rounded so they reuse the players' frames
+PONG_SPECTATOR_SEND_RATE = config('PONG_SPECTATOR_SEND_RATE', default=20, cast=int)
+
+# Frames a player's socket may have sent and not acknowledged by its client. Past it the socket only
+# keeps the newest frame until the client catches up, clients acknowledge every quarter window.
+# Clients that never acknowledge are held back while a quarter window of messages waits in their channel
+PONG_FRAME_WINDOW = config('PONG_FRAME_WINDOW', default=30, cast=int)
+
+# Seconds between two batched writes of in-match scores
+PONG_SCORE_FLUSH_INTERVAL = config('PONG_SCORE_FLUSH_INTERVAL', default=1.0, cast=float)
+
+# Seconds a player may stay disconnected before the match is forfeited, or cancelled if nobody is left,
+# and seconds between two checks for abandoned matches
+PONG_ABANDON_GRACE_PERIOD = config('PONG_ABANDON_GRACE_PERIOD', default=60, cast=int)
+PONG_REAP_INTERVAL = config('PONG_REAP_INTERVAL', default=5, cast=int)
+
+# Seconds between two heartbeat pings on the match and friendship sockets (0 turns them off),
+# and pings in a row a client may leave unanswered before its socket is closed as dead
+PONG_HEARTBEAT_INTERVAL = config('PONG_HEARTBEAT_INTERVAL', default=5, cast=float)
+PONG_HEARTBEAT_MISSES = config('PONG_HEARTBEAT_MISSES', default=2, cast=int)
+
+# Record the inputs of every match so it can be replayed, a few KB per match
+PONG_RECORD_REPLAYS = config('PONG_RECORD_REPLAYS', default=True, cast=bool)
+
+# Time every phase of the game loop's ticks into rolling histograms of PONG_PROFILE_WINDOWS windows of
+# PONG_PROFILE_WINDOW seconds. game_profile/ serves them to requests sending PONG_PROFILE_TOKEN in the
+# X-Profile-Token header, and is disabled while no token is set
+PONG_PROFILE = config('PONG_PROFILE', default=False, cast=bool)
+PONG_PROFILE_WINDOW = config('PONG_PROFILE_WINDOW', default=10.0, cast=float)
+PONG_PROFILE_WINDOWS = config('PONG_PROFILE_WINDOWS', default=6, cast=int)
+PONG_PROFILE_TOKEN = config('PONG_PROFILE_TOKEN', default='')
+
+# Live matches are spread over PONG_WORKERS daphne processes, this one is worker PONG_WORKER_ID. Workers
+# create matches on each other through the Unix socket PONG_WORKER_SOCKET of the owner, and match sockets
+# are opened at PONG_WORKER_WS_PATH, which nginx routes to the owner's port. Both take a {worker} index.
+# nginx proxies to as many workers as the PONG_WORKERS it reads from the same .env, see conf/pong-workers.sh
+PONG_WORKERS = config('PONG_WORKERS', default=1, cast=int)
+PONG_WORKER_ID = config('PONG_WORKER_ID', default=0, cast=int)
+PONG_WORKER_SOCKET = config('PONG_WORKER_SOCKET', default='/tmp/pong-worker-{worker}.sock')
+PONG_WORKER_WS_PATH = config('PONG_WORKER_WS_PATH', default='/ws/w{worker}/')
+
+# Several workers share one channel layer, connected through their Unix sockets PONG_LAYER_SOCKET
+PONG_LAYER_SOCKET = config('PONG_LAYER_SOCKET', default='/tmp/pong-layer-{worker}.sock')
+if PONG_WORKERS > 1:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'backend.layers.PeerChannelLayer',
+            'CONFIG': {
+                'worker': PONG_WORKER_ID,
+                'workers': PONG_WORKERS,
+                'path': PONG_LAYER_SOCKET,
+                'secret': SECRET_KEY,
+            },
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -188,6 +251,8 @@ CORS_ALLOWED_ORIGINS = [
 
 # HTTPS settings
 SECURE_SSL_REDIRECT = True
+# Workers call each other's worker_game/ in plain HTTP over their Unix sockets, see gameBackend.sharding
+SECURE_REDIRECT_EXEMPT = [r'^worker_game/$']
 SESSION_COOKIE_SECURE = True
 CSRF_COOKIE_SECURE = True
 
@@ -0,0 +1,42 @@
+"""
+Settings for ``manage.py pong_loadtest``: the regular settings on a local SQLite
+database, so a load test needs no PostgreSQL, Redis or Ganache.
+
+    python manage.py pong_loadtest --settings backend.settings_loadtest
+
+To load test over the network, serve the same database from another process:
+
+    DJANGO_SETTINGS_MODULE=backend.settings_loadtest daphne -p 8001 backend.asgi:application
+    python manage.py pong_loadtest --settings backend.settings_loadtest --url ws://127.0.0.1:8001
+"""
+import os
+
+# The regular settings require these, the load test never connects to PostgreSQL, SMTP or Ganache
+for name in ('POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD', 'POSTGRES_HOST', 'EMAIL_HOST_USER', 'EMAIL_HOST_PASSWORD'):
+    os.environ.setdefault(name, 'loadtest')
+os.environ.setdefault('POSTGRES_PORT', '5432')
+os.environ.setdefault('ADMIN_PRIVATE_KEY', '')
+
+from .settings import *  # noqa: E402,F401,F403
+from django.db.backends.sqlite3.base import DatabaseWrapper  # noqa: E402
+
+# A few CharFields have no max_length, which only PostgreSQL accepts. SQLite ignores
+# varchar lengths anyway, so the load test database declares every CharField unbounded
+DatabaseWrapper.data_types = dict(DatabaseWrapper.data_types, CharField='varchar')
+DatabaseWrapper.features_class.supports_unlimited_charfield = True
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('PONG_LOADTEST_DB', BASE_DIR / 'loadtest.sqlite3'),
+        'OPTIONS': {'timeout': 30},
+    }
+}
+
+# The load test creates its tables straight from the models, it never keeps data to migrate
+MIGRATION_MODULES = {'authentication': None, 'gameBackend': None, 'blockchain': None}
+
+SECURE_SSL_REDIRECT = False
+
+# The blockchain log file only exists in the container
+LOGGING['handlers']['blockchain_file'] = LOGGING['handlers']['console']
@@ -0,0 +1,202 @@
+import logging
+from .engine import np
+from .state import PLAYER2, UP, DOWN, IDLE
+
+logger = logging.getLogger(__name__)
+
+# How a bot plays, per difficulty:
+# reaction: seconds between two looks at the ball
+# foresight: 0 follows the ball, 1 aims where the ball will cross the paddle line, walls included
+# error: standard deviation of the aiming error, in field heights
+# deadzone: distance to the target under which the paddle stays still
+LEVELS = {
+    'easy': {'reaction': 0.35, 'foresight': 0.0, 'error': 0.10, 'deadzone': 0.04},
+    'medium': {'reaction': 0.18, 'foresight': 0.6, 'error': 0.05, 'deadzone': 0.03},
+    'hard': {'reaction': 0.07, 'foresight': 1.0, 'error': 0.015, 'deadzone': 0.02},
+}
+DEFAULT_LEVEL = 'medium'
+
+
+class BotController:
+    """
+    Plays the right paddle of every ``ai`` match, all bots in one batch per tick.
+
+    Like ``VectorEngine`` each bot owns one row in a set of NumPy buffers, which
+    also hold the fields of its match that never change. On each tick ``decide``
+    picks the rows whose reaction time has elapsed, staggered so the bots of a
+    level do not all look at once. With the vectorized engine it reads their ball
+    and paddle from the engine's rows by index, otherwise from their GameState,
+    and computes every target and direction with array operations. A bot holds
+    its key for as many ticks as it takes to reach the target, so the ticks in
+    between cost nothing.
+
+    Bots play through ``GameState.queue_input`` like a client would, and only when
+    their direction changes: releases and new directions are merged first and
+    queued in one pass over the bots that changed. Their inputs are applied,
+    acknowledged and recorded for replays the same way as a human's.
+    """
+
+    ARRAYS = ('reaction', 'offset', 'foresight', 'error', 'deadzone', 'direction', 'release_at',
+              'paddle_x', 'ball_bounds', 'paddle_speed')
+
+    def __init__(self, capacity=64, seed=None):
+        if np is None:
+            raise ImportError("numpy is required for AI opponents")
+        self.capacity = capacity
+        self.size = 0
+        self.rows = {}
+        self.game_ids = []
+        self.games = []
+        self.rng = np.random.default_rng(seed)
+        self.reaction = np.ones(capacity, dtype=np.int64)
+        self.offset = np.zeros(capacity, dtype=np.int64)
+        self.foresight = np.zeros(capacity, dtype=np.float64)
+        self.error = np.zeros(capacity, dtype=np.float64)
+        self.deadzone = np.zeros(capacity, dtype=np.float64)
+        self.direction = np.zeros(capacity, dtype=np.int8)
+        self.release_at = np.full(capacity, -1, dtype=np.int64)
+        self.paddle_x = np.zeros(capacity, dtype=np.float64)
+        self.ball_bounds = np.zeros(capacity, dtype=np.float64)
+        self.paddle_speed = np.zeros(capacity, dtype=np.float64)
+        # Row of each bot's match in the engine, rebuilt when rows move on either side
+        self.engine_rows = None
+        self.engine_layout = None
+
+    def __contains__(self, game_id):
+        return game_id in self.rows
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        self.capacity *= 2
+        for field in self.ARRAYS:
+            old = getattr(self, field)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, field, new)
+
+    def add(self, game_id, game):
+        if game_id in self.rows:
+            return
+        if self.size == self.capacity:
+            self._grow()
+        level = LEVELS.get(game.ai_level, LEVELS[DEFAULT_LEVEL])
+        row = self.size
+        self.size += 1
+        self.rows[game_id] = row
+        self.game_ids.append(game_id)
+        self.games.append(game)
+        self.reaction[row] = max(1, round(level['reaction'] * game.tick_rate))
+        self.offset[row] = row
+        self.foresight[row] = level['foresight']
+        self.error[row] = level['error']
+        self.deadzone[row] = level['deadzone']
+        self.direction[row] = game.moving[PLAYER2]
+        self.release_at[row] = -1
+        self.paddle_x[row] = game.paddle_x[PLAYER2]
+        self.ball_bounds[row] = game.ball_bounds
+        self.paddle_speed[row] = game.paddle_speed
+        self.engine_rows = None
+
+    def remove(self, game_id):
+        """Free a row by moving the last row into its place."""
+        row = self.rows.pop(game_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            for field in self.ARRAYS:
+                array = getattr(self, field)
+                array[row] = array[last]
+            self.game_ids[row] = self.game_ids[last]
+            self.games[row] = self.games[last]
+            self.rows[self.game_ids[row]] = row
+        self.game_ids.pop()
+        self.games.pop()
+        self.size = last
+        self.engine_rows = None
+
+    def _engine_rows(self, engine):
+        """Row of each bot's match in ``engine``, -1 for the matches it has not stepped yet."""
+        if self.engine_rows is None or self.engine_layout != engine.layout:
+            rows = engine.rows
+            self.engine_rows = np.fromiter((rows.get(game_id, -1) for game_id in self.game_ids),
+                                           dtype=np.int64, count=self.size)
+            self.engine_layout = engine.layout
+        return self.engine_rows
+
+    def _state(self, due, engine):
+        """Ball position and speed, and bot paddle position, of the matches of the ``due`` rows."""
+        if engine is not None:
+            rows = self._engine_rows(engine)[due]
+            if (rows >= 0).all():
+                return (engine.ball_x[rows], engine.ball_y[rows], engine.ball_speed_x[rows],
+                        engine.ball_speed_y[rows], engine.paddle2_y[rows])
+        games = self.games
+        return np.array([
+            (game.ball_x, game.ball_y, game.ball_speed_x, game.ball_speed_y, game.paddle_y[PLAYER2])
+            for game in (games[row] for row in due.tolist())
+        ]).T
+
+    def decide(self, tick, engine=None):
+        """
+        Queue the inputs of every bot for ``tick``, return how many bots looked at the ball.
+
+        ``engine`` is the scheduler's VectorEngine, if it runs one: its rows hold the
+        state the matches were left in by the previous tick.
+        """
+        n = self.size
+        if n == 0:
+            return 0
+
+        directions = self.direction[:n].copy()
+        released = self.release_at[:n] == tick
+        directions[released] = IDLE
+        self.release_at[:n][released] = -1
+        due = ((tick + self.offset[:n]) % self.reaction[:n] == 0).nonzero()[0]
+        if len(due):
+            self._aim(due, directions, tick, engine)
+
+        # One pass over the bots whose key changed: release the old key, press the new one
+        current = self.direction[:n]
+        changed = (directions != current).nonzero()[0]
+        games = self.games
+        for row, old, new in zip(changed.tolist(), current[changed].tolist(), directions[changed].tolist()):
+            game = games[row]
+            if old != IDLE:
+                game.queue_input(PLAYER2, old, False)
+            if new != IDLE:
+                game.queue_input(PLAYER2, new, True)
+        current[:] = directions
+        return len(due)
+
+    def _aim(self, due, directions, tick, engine):
+        """Set the direction of the ``due`` rows in ``directions`` and when they let go of it."""
+        ball_x, ball_y, speed_x, speed_y, paddle_y = self._state(due, engine)
+        paddle_x, bounds, paddle_speed = self.paddle_x[due], self.ball_bounds[due], self.paddle_speed[due]
+
+        # Where the ball crosses the paddle line, folding its path back into the field at the walls
+        incoming = speed_x > 0
+        ticks_left = np.where(incoming, (paddle_x - ball_x) / np.where(incoming, speed_x, 1), 0)
+        span = 1 - 2 * bounds
+        folded = np.mod(ball_y + speed_y * ticks_left - bounds, 2 * span)
+        crossing = bounds + np.where(folded > span, 2 * span - folded, folded)
+
+        aim = ball_y + self.foresight[due] * (crossing - ball_y) + self.rng.normal(0, self.error[due])
+        # Go back to the middle while the ball moves away
+        target = np.where(incoming, aim, 0.5)
+        distance = target - paddle_y
+        aimed = np.where(distance > self.deadzone[due], DOWN, np.where(distance < -self.deadzone[due], UP, IDLE))
+        hold = np.ceil(np.abs(distance) / paddle_speed).astype(np.int64)
+
+        directions[due] = aimed
+        self.release_at[due] = np.where(aimed != IDLE, tick + np.maximum(hold, 1), -1)
+
+
+def create_bots(**kwargs):
+    """Return a BotController, or None when numpy is not installed."""
+    if np is None:
+        logger.warning("numpy is not installed, AI opponents are disabled")
+        return None
+    return BotController(**kwargs)
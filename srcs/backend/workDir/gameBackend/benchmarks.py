@@ -0,0 +1,299 @@
+"""
+Benchmarks of the Pong engine and broadcast path, run by ``manage.py pong_benchmark``.
+
+Every benchmark returns a list of metrics, plain dicts with a ``name``, a ``value``,
+a ``unit`` and whether ``higher`` or ``lower`` is better, so a run can be saved
+as JSON and compared with a baseline run.
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from unittest import mock
+from channels.layers import InMemoryChannelLayer
+from backend.layers import PeerChannelLayer
+
+from . import simulation
+from .ai import BotController
+from .consumers import PongConsumer
+from .engine import np, VectorEngine
+from .protocol import BINARY, DELTA, JSON, DeltaEncoder, encode_frame
+from .registry import registry
+from .scheduler import GameScheduler
+from .state import PADDLES, UP, DOWN
+from .stats import TickStats
+
+GAME_COUNTS = (1, 100, 1000)
+
+
+def metric(name, value, unit, better='higher'):
+    return {'name': name, 'value': round(value, 3), 'unit': unit, 'better': better}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def new_games(count):
+    games = {}
+    for i in range(count):
+        game = simulation.new_match(seed=i)
+        games[str(i)] = game
+    return games
+
+
+def bench_engine(ticks):
+    """Physics steps per second, scalar and vectorized."""
+    games = new_games(100)
+    start = time.perf_counter()
+    steps = 0
+    for game in games.values():
+        for _ in range(ticks):
+            simulation.step(game)
+        steps += ticks
+    results = [metric('engine.scalar.steps_per_sec', steps / (time.perf_counter() - start), 'steps/s')]
+
+    if np is not None:
+        games = new_games(1000)
+        engine = VectorEngine(capacity=len(games))
+        for game_id, game in games.items():
+            engine.add(game_id, game)
+        start = time.perf_counter()
+        for _ in range(ticks):
+            engine.step(games)
+        elapsed = time.perf_counter() - start
+        results.append(metric('engine.numpy.steps_per_sec', len(games) * ticks / elapsed, 'steps/s'))
+        results += bench_bots(games, ticks, engine)
+    return results
+
+
+def bench_bots(games, ticks, engine=None):
+    """Bot decisions per second, every match of ``games`` against a medium bot, reading ``engine``'s rows if given."""
+    bots = BotController(capacity=len(games), seed=0)
+    for game_id, game in games.items():
+        game.ai_level = 'medium'
+        bots.add(game_id, game)
+    start = time.perf_counter()
+    for tick in range(1, ticks + 1):
+        bots.decide(tick, engine)
+        for game in games.values():
+            game.inputs.clear()
+    elapsed = time.perf_counter() - start
+    return [metric('bots.numpy.bot_ticks_per_sec', len(games) * ticks / elapsed, 'bot ticks/s')]
+
+
+async def bench_tick(game_count, ticks, engine=None):
+    """Latency of full scheduler ticks, physics and broadcast, with ``game_count`` matches."""
+    games = new_games(game_count)
+    scheduler = GameScheduler(engine=engine)
+    with mock.patch.dict(registry.games, games, clear=True), \
+            mock.patch('gameBackend.scheduler.score_writer'), \
+            mock.patch('gameBackend.scheduler.get_channel_layer', return_value=InMemoryChannelLayer()):
+        for game_id in games:
+            scheduler.running.add(game_id)
+            scheduler.encoders[game_id] = DeltaEncoder()
+            scheduler.send_intervals[game_id] = 1
+        samples = []
+        for _ in range(ticks):
+            start = time.perf_counter()
+            await scheduler.tick()
+            samples.append(time.perf_counter() - start)
+
+    kind = 'numpy' if engine is not None else 'scalar'
+    prefix = f'tick.{kind}.{game_count}_games'
+    return [
+        metric(f'{prefix}.p50_ms', statistics.median(samples) * 1000, 'ms', 'lower'),
+        metric(f'{prefix}.p99_ms', percentile(samples, 0.99) * 1000, 'ms', 'lower'),
+        metric(f'{prefix}.max_ms', max(samples) * 1000, 'ms', 'lower'),
+    ]
+
+
+async def profile_ticks(game_count, ticks, engine=None, inputs=True):
+    """Run ``ticks`` scheduler ticks of ``game_count`` matches with the profiler on, return its summary."""
+    games = new_games(game_count)
+    scheduler = GameScheduler(engine=engine)
+    profiler = scheduler.enable_profiling(window=3600, windows=1)
+    rng = random.Random(0)
+    with mock.patch.dict(registry.games, games, clear=True), \
+            mock.patch('gameBackend.scheduler.score_writer'), \
+            mock.patch('gameBackend.scheduler.get_channel_layer', return_value=InMemoryChannelLayer()):
+        for game_id in games:
+            scheduler.running.add(game_id)
+            scheduler.encoders[game_id] = DeltaEncoder()
+            scheduler.send_intervals[game_id] = 1
+            scheduler.spectator_intervals[game_id] = 1
+            scheduler.game_stats[game_id] = TickStats()
+        for _ in range(ticks):
+            if inputs:
+                for game in games.values():
+                    if rng.random() < 0.1:
+                        game.queue_input(rng.choice(PADDLES), rng.choice([UP, DOWN]), rng.random() < 0.5)
+            await scheduler.tick()
+    return profiler.summary()
+
+
+async def bench_serialization(iterations):
+    """Cost of encoding a frame once per tick, and of PongConsumer.game_state per recipient."""
+    game = simulation.new_match(seed=1)
+    encoder = DeltaEncoder()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        simulation.step(game)
+        event = encode_frame(game, encoder)
+    results = [metric('serialize.encode_frame_us', (time.perf_counter() - start) / iterations * 1e6, 'us', 'lower')]
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        json.dumps(game.frame())
+    results.append(metric('serialize.json_dumps_per_recipient_us', (time.perf_counter() - start) / iterations * 1e6, 'us', 'lower'))
+
+    async def discard(message):
+        pass
+
+    for protocol in (None, DELTA, BINARY):
+        consumer = PongConsumer()
+        consumer.base_send = discard
+        consumer.protocol = protocol
+        consumer.needs_keyframe = False
+        consumer.frame_window = 30
+        consumer.sent_frame = consumer.acked_frame = consumer.held_frame = None
+        consumer.channel_layer = InMemoryChannelLayer()
+        consumer.channel_name = 'specific.benchmark'
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await consumer.game_state(event)
+        name = protocol or JSON
+        results.append(metric(f'serialize.game_state.{name}_us', (time.perf_counter() - start) / iterations * 1e6, 'us', 'lower'))
+        payload = event[name]
+        results.append(metric(f'serialize.frame_size.{name}_bytes', len(payload), 'bytes', 'lower'))
+    return results
+
+
+async def bench_fanout(group_sizes, messages):
+    """group_send of one pre-encoded frame over the in-memory channel layer, and delivery to every member."""
+    game = simulation.new_match(seed=1)
+    event = encode_frame(game, DeltaEncoder())
+    results = []
+    for size in group_sizes:
+        layer = InMemoryChannelLayer(capacity=messages + 1)
+        channels = [await layer.new_channel() for _ in range(size)]
+        for channel in channels:
+            await layer.group_add('pong_bench', channel)
+
+        start = time.perf_counter()
+        for _ in range(messages):
+            await layer.group_send('pong_bench', event)
+        sent = time.perf_counter()
+        for channel in channels:
+            for _ in range(messages):
+                await layer.receive(channel)
+        received = time.perf_counter()
+
+        results.append(metric(f'fanout.{size}_members.group_send_us', (sent - start) / messages * 1e6, 'us', 'lower'))
+        results.append(metric(f'fanout.{size}_members.deliveries_per_sec', size * messages / (received - start), 'msgs/s'))
+    return results
+
+
+async def bench_channel_layers(messages):
+    """
+    Throughput of the in-memory layer and of PeerChannelLayer, within a worker and between two.
+
+    Both workers run in this process, so the remote figures pay for both ends on one core.
+    """
+    game = simulation.new_match(seed=1)
+    event = encode_frame(game, DeltaEncoder())
+    sockets = tempfile.mkdtemp(prefix='pong-layers-')
+    path = os.path.join(sockets, 'layer-{worker}.sock')
+    memory = InMemoryChannelLayer(capacity=messages + 1)
+    first, second = (PeerChannelLayer(worker=worker, workers=2, path=path, capacity=messages + 1) for worker in (0, 1))
+    results = []
+    try:
+        # Start both workers and let them connect to each other
+        await first.flush()
+        await second.flush()
+        await asyncio.sleep(0.05)
+        for name, sender, receiver in (('inmemory', memory, memory), ('peer_local', first, first), ('peer_remote', first, second)):
+            channel = await receiver.new_channel()
+            start = time.perf_counter()
+            for _ in range(messages):
+                await sender.send(channel, event)
+            for _ in range(messages):
+                await receiver.receive(channel)
+            results.append(metric(f'channel_layer.{name}.send_receive_per_sec', messages / (time.perf_counter() - start), 'msgs/s'))
+
+            # One member in each worker
+            members = [(layer, await layer.new_channel()) for layer in (sender, receiver)]
+            for _, member in members:
+                await receiver.group_add('bench', member)
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            for _ in range(messages):
+                await sender.group_send('bench', event)
+            for layer, member in members:
+                for _ in range(messages):
+                    await layer.receive(member)
+            results.append(metric(f'channel_layer.{name}.group_deliveries_per_sec',
+                                  len(members) * messages / (time.perf_counter() - start), 'msgs/s'))
+            for _, member in members:
+                await receiver.group_discard('bench', member)
+    finally:
+        await first.close()
+        await second.close()
+        shutil.rmtree(sockets, ignore_errors=True)
+    return results
+
+
+async def run_async_benchmarks(game_counts, ticks, iterations):
+    results = []
+    for game_count in game_counts:
+        results += await bench_tick(game_count, ticks)
+        if np is not None:
+            results += await bench_tick(game_count, ticks, engine=VectorEngine(capacity=game_count))
+    results += await bench_serialization(iterations)
+    results += await bench_fanout((2, 10, 100), max(iterations // 100, 10))
+    results += await bench_channel_layers(max(iterations // 2, 100))
+    return results
+
+
+def run_benchmarks(game_counts=GAME_COUNTS, ticks=240, iterations=10000):
+    """Run the whole suite and return a JSON-serializable report."""
+    results = bench_engine(ticks * 2)
+    results += asyncio.run(run_async_benchmarks(game_counts, ticks, iterations))
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__ if np is not None else None,
+            'machine': platform.machine(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'game_counts': list(game_counts),
+            'ticks': ticks,
+            'iterations': iterations,
+        },
+        'results': results,
+    }
+
+
+def compare(report, baseline, tolerance=10.0):
+    """
+    Compare a report with a baseline report.
+
+    Returns one ``(name, baseline, current, change_percent, regressed)`` row per
+    metric found in both, where a metric regressed if it got worse by more than
+    ``tolerance`` percent.
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    rows = []
+    for result in report['results']:
+        before = previous.get(result['name'])
+        if before is None or not before['value']:
+            continue
+        change = (result['value'] - before['value']) / before['value'] * 100
+        worse = -change if result['better'] == 'higher' else change
+        rows.append((result['name'], before['value'], result['value'], round(change, 1), worse > tolerance))
+    return rows
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from authentication.models import Users
+from authentication.utils import update_ppp_ratings
+from blockchain.blockchainInterface import TournamentBlockchain
+from .models import Match, MatchCompletionJob, MatchReplay, Tournament
+
+logger = logging.getLogger(__name__)
+
+JobStatus = MatchCompletionJob.JobStatusChoices
+Outcome = MatchCompletionJob.OutcomeChoices
+OPEN_STATUSES = (JobStatus.PENDING, JobStatus.RECORDED)
+
+
+def create_job(game_id, scores, outcome=Outcome.COMPLETED, winner=None, replay=None):
+    """Queue the completion of a finished match, and save its replay. A match only ever gets one job."""
+    forfeit_winner = Users.objects.filter(user_name=winner).first() if outcome == Outcome.FORFEIT else None
+    with transaction.atomic():
+        job, created = MatchCompletionJob.objects.get_or_create(
+            match_id=game_id,
+            defaults={
+                'score_player_1': scores[0],
+                'score_player_2': scores[1],
+                'outcome': outcome,
+                'forfeit_winner': forfeit_winner,
+            },
+        )
+        if created and replay is not None:
+            MatchReplay.objects.create(match_id=game_id, data=replay)
+    if not created:
+        logger.warning(f"[{game_id}] Completion already queued, status {job.status}")
+    return created
+
+
+def due_jobs(limit=20):
+    """Return the ids of open jobs whose next attempt is due, and the seconds until the next one otherwise."""
+    now = timezone.now()
+    open_jobs = MatchCompletionJob.objects.filter(status__in=OPEN_STATUSES)
+    job_ids = list(open_jobs.filter(next_attempt_at__lte=now).order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+    if job_ids:
+        return job_ids, 0
+    next_job = open_jobs.order_by('next_attempt_at').first()
+    if next_job is None:
+        return [], None
+    return [], max((next_job.next_attempt_at - now).total_seconds(), 0)
+
+
+def record_match_result(job_id):
+    """Save the final score, winner, player stats and ratings of a finished match, exactly once."""
+    with transaction.atomic():
+        job = MatchCompletionJob.objects.select_for_update().get(id=job_id)
+        if job.status != JobStatus.PENDING:
+            return job.status
+
+        pongMatch = Match.objects.select_related('player_1', 'player_2').get(id=job.match_id)
+        pongMatch.score_player_1 = job.score_player_1
+        pongMatch.score_player_2 = job.score_player_2
+        if job.outcome == Outcome.CANCELLED:
+            # Nobody won, player stats and ratings stay as they are
+            pongMatch.match_status = Match.MatchStatusChoices.CANCELLED
+        else:
+            if job.outcome == Outcome.FORFEIT:
+                player_1_won = job.forfeit_winner_id == pongMatch.player_1_id
+            else:
+                player_1_won = job.score_player_1 >= 7
+            if player_1_won:
+                pongMatch.match_winner = pongMatch.player_1
+                pongMatch.match_loser = pongMatch.player_2
+            else:
+                pongMatch.match_winner = pongMatch.player_2
+                pongMatch.match_loser = pongMatch.player_1
+            if pongMatch.game_opponent == Match.GameOpponentChoices.ONLINE:
+                # Local and ai matches have one player on both sides, stats and ratings are for online matches
+                winner = pongMatch.match_winner
+                loser = pongMatch.match_loser
+                winner.matches_played += 1
+                loser.matches_played += 1
+                winner.matches_won += 1
+                winner.win_ratio = (winner.matches_won / winner.matches_played) * 100 if winner.matches_played > 0 else 0
+                loser.win_ratio = (loser.matches_won / loser.matches_played) * 100 if loser.matches_played > 0 else 0
+                update_ppp_ratings(winner, loser, 1)
+                winner.save()
+                loser.save()
+            pongMatch.match_status = Match.MatchStatusChoices.DONE
+        pongMatch.save()
+
+        job.status = JobStatus.RECORDED
+        job.save(update_fields=['status', 'updated_at'])
+
+    logger.info(f"[{job.match_id}] Saved match: Winner={pongMatch.match_winner}, Status={pongMatch.match_status}, Outcome={job.outcome}")
+    return job.status
+
+
+def blockchain_update(job_id):
+    """Return the ``updateMatchScore`` arguments of a tournament match, or None if there is nothing to report."""
+    job = MatchCompletionJob.objects.select_related('match').get(id=job_id)
+    if job.outcome == Outcome.CANCELLED:
+        return None
+    pongMatch = job.match
+    tournament = Tournament.objects.filter(
+        Q(semifinal_1=pongMatch) | Q(semifinal_2=pongMatch) | Q(final=pongMatch)
+    ).first()
+    if not tournament:
+        return None
+    if pongMatch.blockchain_match_id is None:
+        logger.warning(f"[{pongMatch.id}] Skipping blockchain update: Match {pongMatch.id} has no blockchain_match_id")
+        return None
+    return (tournament.blockchain_tournament_id, pongMatch.blockchain_match_id,
+            pongMatch.score_player_1, pongMatch.score_player_2)
+
+
+def report_to_blockchain(tournament_id, match_id, score1, score2):
+    # Waits for the transaction receipt, runs outside the shared database thread
+    TournamentBlockchain().updateMatchScore(tournament_id, match_id, score1, score2)
+    logger.info(f"Blockchain updated: Tournament {tournament_id}, Match {match_id}, Scores: {score1}-{score2}")
+
+
+def finish_job(job_id):
+    MatchCompletionJob.objects.filter(id=job_id).update(status=JobStatus.DONE, last_error='', updated_at=timezone.now())
+
+
+def complete_match(game_id, scores, replay=None):
+    """
+    Queue and record the completion of a match at once, for callers outside the event loop.
+
+    Only for matches that never report to the blockchain, such as local ones. Returns
+    False when the match already has a completion job.
+    """
+    if not create_job(game_id, scores, replay=replay):
+        return False
+    job_id = MatchCompletionJob.objects.get(match_id=game_id).id
+    if record_match_result(job_id) == JobStatus.RECORDED:
+        finish_job(job_id)
+    return True
+
+
+def schedule_retry(job_id, error, max_attempts, retry_delay):
+    """Record a failed attempt, then retry later with exponential backoff or give up."""
+    job = MatchCompletionJob.objects.get(id=job_id)
+    job.attempts += 1
+    job.last_error = str(error)
+    if job.attempts >= max_attempts:
+        job.status = JobStatus.FAILED
+        logger.error(f"[{job.match_id}] Match completion failed after {job.attempts} attempts: {error}")
+    else:
+        delay = retry_delay * 2 ** (job.attempts - 1)
+        job.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        logger.warning(f"[{job.match_id}] Match completion attempt {job.attempts} failed, retrying in {delay}s: {error}")
+    job.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'])
+
+
+class CompletionWorker:
+    """
+    Runs the queued ``MatchCompletionJob`` rows of this process in the background.
+
+    A job first records the result in the database, which is what tournaments wait
+    for, then reports the score to the blockchain. A failed step is retried with
+    exponential backoff, ``max_attempts`` times in total. Jobs live in the database,
+    so the ones left open by a restart are picked up again the next time the worker runs.
+    """
+
+    def __init__(self, max_attempts=5, retry_delay=2):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._task = None
+        self._wakeup = None
+
+    async def enqueue(self, game_id, scores, outcome=Outcome.COMPLETED, winner=None, replay=None):
+        created = await database_sync_to_async(create_job)(game_id, scores, outcome, winner, replay)
+        self.wake()
+        return created
+
+    def wake(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                job_ids, delay = await database_sync_to_async(due_jobs)()
+            except Exception as e:
+                logger.error(f"Failed to fetch match completion jobs: {e}")
+                return
+            for job_id in job_ids:
+                await self.process(job_id)
+            if job_ids or self._wakeup.is_set():
+                continue
+            if delay is None:
+                return # no open job left, the next enqueue starts the worker again
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process(self, job_id):
+        try:
+            status = await database_sync_to_async(record_match_result)(job_id)
+            if status != JobStatus.RECORDED:
+                return
+            update = await database_sync_to_async(blockchain_update)(job_id)
+            if update is not None:
+                await sync_to_async(report_to_blockchain, thread_sensitive=False)(*update)
+            await database_sync_to_async(finish_job)(job_id)
+        except Exception as e:
+            try:
+                await database_sync_to_async(schedule_retry)(job_id, e, self.max_attempts, self.retry_delay)
+            except Exception as retry_error:
+                logger.error(f"Failed to schedule retry of completion job {job_id}: {retry_error}")
+                await asyncio.sleep(self.retry_delay)
+
+
+completion_worker = CompletionWorker()
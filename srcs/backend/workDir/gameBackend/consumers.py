@@ -1,23 +1,26 @@
 import json
-import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from authentication.utils import decode_jwt_token
 from authentication.models import BlacklistedTokens, LoggedOutTokens, Users
+from django.conf import settings
 from django.db.models import Q
 from .models import Tournament, Match
+from .reaper import reaper
+from . import sharding
+from .heartbeat import Heartbeat
+from .registry import registry
+from .scheduler import scheduler
+from .protocol import BINARY, DELTA, JSON, decode_input, input_seq, keyframe, select_subprotocol
+from .state import ACTIONS, LOCAL_ACTIONS, PADDLE_NAMES, PLAYER1, PLAYER2
 import logging
-import time
 
 logger = logging.getLogger(__name__)
 
-game_locks = {}
-
 class PongConsumer(AsyncWebsocketConsumer):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.game_locks = game_locks
+    # Seconds a socket waits for its match to be created before giving up
+    GAME_WAIT_TIMEOUT = 30
 
     @database_sync_to_async
     def check_ws_auth(self, scope):
@@ -41,7 +44,7 @@ class PongConsumer(AsyncWebsocketConsumer):
                 return None, "Token is invalid"
 
             user = Users.objects.get(id=payload["user_id"])
-            user.online_status = datetime.utcnow() + timedelta(minutes=2)
+            user.online_status = True
             user.save()
             return user.user_name, "Success"
         except Users.DoesNotExist:
@@ -51,17 +54,19 @@ class PongConsumer(AsyncWebsocketConsumer):
             return None, "Authentication failed"
 
     async def connect(self):
-        try:
-            from .views import games
-        except ImportError as e:
-            logger.error(f"Cannot import views: {e}")
-            await self.send(text_data=json.dumps({'error': 'Internal server error'}))
-            await self.close(code=4001, reason="Server misconfiguration")
-            return
-
         self.game_id = self.scope['url_route']['kwargs']['game_id']
         self.room_group_name = f'pong_{self.game_id}'
-        self.game_task = None
+        self.protocol = select_subprotocol(self.scope)
+        self.needs_keyframe = True
+        # Frames sent and acknowledged by the client, and the newest frame held back while it is behind
+        self.frame_window = settings.PONG_FRAME_WINDOW
+        self.sent_frame = None
+        self.acked_frame = None
+        self.held_frame = None
+        self.heartbeat = None
+
+        if await self.reject_foreign_game():
+            return
 
         self.client_id, result = await self.check_ws_auth(self.scope)
         if not self.client_id:
@@ -69,15 +74,19 @@ class PongConsumer(AsyncWebsocketConsumer):
             await self.close(code=4001, reason=result)
             return
 
+        reaper.start()
+        # Before joining the group, so every frame it gets is encoded in its protocol
+        registry.subscribe(self.game_id, self.protocol or JSON)
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        await self.accept(subprotocol=self.protocol)
 
-        game = await self.wait_for_game(games)
+        game = await self.wait_for_game()
         if not game:
             return
 
-        if self.client_id not in [game['player_1'], game['player_2']]:
-            logger.warning(f"Client {self.client_id} not in game {self.game_id}. Expected: {game['player_1']} or {game['player_2']}")
+        paddle = game.paddle_of(self.client_id)
+        if paddle is None:
+            logger.warning(f"Client {self.client_id} not in game {self.game_id}. Expected: {game.players[PLAYER1]} or {game.players[PLAYER2]}")
             await self.send(text_data=json.dumps({
                 'type': 'error',
                 'error': 'You are not a player in this game'
@@ -85,21 +94,20 @@ class PongConsumer(AsyncWebsocketConsumer):
             await self.close(code=4002, reason="Unauthorized player")
             return
 
-        lock = self.game_locks.setdefault(self.game_id, asyncio.Lock())
+        lock = registry.lock(self.game_id)
         async with lock:
-            if self.client_id == game['player_1']:
-                game['player1_status'] = 'online'
-                game['player1_disconnect_time'] = None
-            elif self.client_id == game['player_2']:
-                game['player2_status'] = 'online'
-                game['player2_disconnect_time'] = None
+            game.online[paddle] = True
+            game.disconnect_time[paddle] = None
+        # Only once attached: receive() and its pongs are not dispatched while connect() waits for the match
+        self.heartbeat = Heartbeat(self, 'pong', self.client_id)
+        self.heartbeat.start()
 
         await self.send_initial_state(game)
 
         async with lock:
-            if not game.get('game_running', False):
-                game['game_running'] = True
-                logger.info(f"Starting game {self.game_id}: {game['player_1']} vs {game['player_2']}")
+            if not game.game_running:
+                game.game_running = True
+                logger.info(f"Starting game {self.game_id}: {game.players[PLAYER1]} vs {game.players[PLAYER2]}")
                 await self.channel_layer.group_send(
                     self.room_group_name,
                     {
@@ -108,28 +116,47 @@ class PongConsumer(AsyncWebsocketConsumer):
                         'game_id': self.game_id
                     }
                 )
-                self.game_task = asyncio.create_task(self.game_update_loop())
-            elif game['player1_status'] != 'online' or game['player2_status'] != 'online':
+                scheduler.start_game(self.game_id)
+            elif scheduler.resume_game(self.game_id):
+                logger.info(f"Player {self.client_id} is back in game {self.game_id}")
+            elif not all(game.online):
                 await self.send(text_data=json.dumps({
                     'type': 'status',
                     'message': 'Game is running, one player is offline...'
                 }))
 
-    async def wait_for_game(self, games):
-        timeout = 30
-        elapsed = 0
-        while elapsed < timeout:
-            if self.game_id in games:
-                game = games[self.game_id]
-                logger.debug(f"Game {self.game_id} found: {game}")
-                return game
-            await self.send(text_data=json.dumps({
-                'type': 'status',
-                'message': 'Waiting for game to start...'
-            }))
-            await asyncio.sleep(2)
-            elapsed += 2
-        logger.warning(f"Timeout: Game {self.game_id} not initialized after {timeout}s")
+    async def reject_foreign_game(self):
+        """Close the socket when another worker hosts the match, telling the client where it is."""
+        owner = sharding.owner_of(self.game_id)
+        if owner == sharding.worker_id():
+            return False
+
+        self.client_id = None
+        logger.info(f"Game {self.game_id} is hosted by worker {owner}, not worker {sharding.worker_id()}")
+        await self.accept()
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'error': 'Game is hosted by another worker',
+            'worker': owner,
+            'ws_path': sharding.ws_path(self.game_id)
+        }))
+        await self.close(code=4003, reason="Wrong worker")
+        return True
+
+    async def wait_for_game(self):
+        game = registry.get(self.game_id)
+        if game:
+            return game
+
+        await self.send(text_data=json.dumps({
+            'type': 'status',
+            'message': 'Waiting for game to start...'
+        }))
+        game = await registry.wait_for(self.game_id, self.GAME_WAIT_TIMEOUT)
+        if game:
+            logger.debug(f"Game {self.game_id} found: {game}")
+            return game
+        logger.warning(f"Timeout: Game {self.game_id} not initialized after {self.GAME_WAIT_TIMEOUT}s")
         await self.send(text_data=json.dumps({
             'type': 'error',
             'error': 'Game not found or not yet started'
@@ -138,248 +165,156 @@ class PongConsumer(AsyncWebsocketConsumer):
         return None
 
     async def disconnect(self, close_code):
-        try:
-            from .views import games
-        except ImportError as e:
-            logger.error(f"Cannot import views on disconnect: {e}")
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+        if self.client_id is None:
+            # Never joined the match
             return
-
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-
-        lock = self.game_locks.setdefault(self.game_id, asyncio.Lock())
-        async with lock:
-            game = games.get(self.game_id)
-            if game and self.client_id and game.get('status') != 'done':
-                if self.client_id == game['player_1']:
-                    game['player1_status'] = 'offline'
-                    game['player1_disconnect_time'] = datetime.utcnow()
-                elif self.client_id == game['player_2']:
-                    game['player2_status'] = 'offline'
-                    game['player2_disconnect_time'] = datetime.utcnow()
+        registry.unsubscribe(self.game_id, self.protocol or JSON)
+
+        async with registry.lock(self.game_id):
+            game = registry.get(self.game_id)
+            paddle = game.paddle_of(self.client_id) if game and self.client_id else None
+            if paddle is not None and game.status != 'done':
+                game.online[paddle] = False
+                game.disconnect_time[paddle] = datetime.utcnow()
                 logger.info(f"Player {self.client_id} disconnected from game {self.game_id}. Game continues for remaining players.")
+                if not game.connected():
+                    scheduler.pause_game(self.game_id)
 
-    async def receive(self, text_data):
-        try:
-            from .views import games
-        except ImportError as e:
-            logger.error(f"Cannot import views in receive: {e}")
-            await self.send(text_data=json.dumps({'type': 'error', 'error': 'Internal server error'}))
-            return
-
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
-            action = data['action']
-            paddle = data.get('paddle')  # Only used in local mode
-            logger.debug(f"Received: {data}, using client_id: {self.client_id}")
-        except (json.JSONDecodeError, KeyError) as e:
+            if bytes_data is not None:
+                action, paddle, seq = decode_input(bytes_data)
+                if action == 'ack':
+                    await self.acknowledge(seq)
+                    return
+            else:
+                data = json.loads(text_data)
+                action = data['action']
+                if action == 'ack':
+                    await self.acknowledge(data.get('frame'))
+                    return
+                if action == 'pong':
+                    # No heartbeat before the socket is attached to its paddle
+                    if self.heartbeat is not None:
+                        self.heartbeat.pong(data.get('id'))
+                    return
+                paddle = data.get('paddle')  # Only used in local mode
+                seq = input_seq(data.get('seq'))
+            logger.debug(f"Received: {action} {paddle} #{seq}, using client_id: {self.client_id}")
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
             logger.error(f"Invalid message: {e}")
             return
-        
-        lock = self.game_locks.setdefault(self.game_id, asyncio.Lock())
-        async with lock:
-            game = games.get(self.game_id)
-            if not game:
-                logger.warning(f"Game {self.game_id} not found in receive")
-                return
 
-            valid_actions = ['upStart', 'upStop', 'downStart', 'downStop']
-            if game['game_opponent'] == 'local':
-                valid_actions.extend(['wStart', 'wStop', 'sStart', 'sStop'])
+        if action == 'resync':
+            # Delta client missed a frame, send it a keyframe next
+            self.needs_keyframe = True
+            return
 
-            if action not in valid_actions:
-                logger.debug(f"Invalid action: {action}")
-                return
+        # No lock here: the input is only queued, the next tick applies it
+        game = registry.get(self.game_id)
+        if not game:
+            logger.warning(f"Game {self.game_id} not found in receive")
+            return
 
-            if game.get('status') == 'done':
-                await self.send(text_data=json.dumps({'status': 'done'}))
-                return
+        local = game.game_opponent == 'local'
+        if action not in ACTIONS or (action in LOCAL_ACTIONS and not local):
+            logger.debug(f"Invalid action: {action}")
+            return
 
-            if game['game_opponent'] == 'local':
-                if self.client_id != game['player_1']:
-                    logger.debug(f"Invalid client_id {self.client_id} for local game")
-                    return
-                target_paddle = paddle
-                if not target_paddle or target_paddle not in ['player1', 'player2']:
-                    logger.debug(f"Invalid paddle: {paddle}")
-                    return
-                self.update_paddle(game, target_paddle, action)
-            else:
-                if self.client_id == game['player_1']:
-                    self.update_paddle(game, 'player1', action)
-                elif self.client_id == game['player_2']:
-                    self.update_paddle(game, 'player2', action)
-
-    def update_paddle(self, game, paddle, action):
-        if action in ['wStart', 'upStart']:
-            game[f'{paddle}_moving'] = 'up'
-        elif action in ['wStop', 'upStop']:
-            if game.get(f'{paddle}_moving') == 'up':
-                game[f'{paddle}_moving'] = None
-        elif action in ['sStart', 'downStart']:
-            game[f'{paddle}_moving'] = 'down'
-        elif action in ['sStop', 'downStop']:
-            if game.get(f'{paddle}_moving') == 'down':
-                game[f'{paddle}_moving'] = None
-
-    async def game_update_loop(self):
-        try:
-            from .views import games, game_update
-        except ImportError as e:
-            logger.error(f"Cannot import views in game_update_loop: {e}")
+        if game.status == 'done':
+            await self.send(text_data=json.dumps({'status': 'done'}))
             return
 
-        frame_rate = 60
-        frame_duration = 1 / frame_rate
-        last_frame_time = time.time()
-
-        lock = self.game_locks.setdefault(self.game_id, asyncio.Lock())
-        while True:
-            current_time = time.time()
-            elapsed = current_time - last_frame_time
-            if elapsed < frame_duration:
-                await asyncio.sleep(frame_duration - elapsed)
-                current_time = time.time()
-
-            async with lock:
-                game = games.get(self.game_id)
-                if not game:
-                    logger.warning(f"Game {self.game_id} not found in update loop")
-                    break
-
-                # Continue paddle movement for online players
-                for player in ['player1', 'player2']:
-                    if game[f'{player}_status'] == 'online':
-                        paddle = 'paddle1_y' if player == 'player1' else 'paddle2_y'
-                        if game.get(f'{player}_moving') == 'up':
-                            game[paddle] = max(0 + game['paddle_bounds_y'], game[paddle] - game['paddle_speed'])
-                        elif game.get(f'{player}_moving') == 'down':
-                            game[paddle] = min(1 - game['paddle_bounds_y'], game[paddle] + game['paddle_speed'])
-
-                updated_game = await game_update(self.game_id)
-                if not updated_game:
-                    logger.error(f"Game update failed for {self.game_id}")
-                    break
-                game.update(updated_game)
-
-                # Set winner only when score reaches 7
-                if game['score1'] >= 7 and 'winner' not in game:
-                    game['winner'] = game['player_1']
-                    game['status'] = 'done'
-                elif game['score2'] >= 7 and 'winner' not in game:
-                    game['winner'] = game['player_2']
-                    game['status'] = 'done'
-
-                if game.get('status') == 'done':
-                    await self.send_final_state(game)
-                    await self.end_game(game)
-                    # Disconnect all clients after showing result
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'game_end',
-                            'message': 'Game has ended, disconnecting...'
-                        }
-                    )
-                    await asyncio.sleep(2)  # Brief delay to ensure clients see the result
-                    await self.close(code=1000, reason="Game concluded")
-                    break
+        if local:
+            if self.client_id != game.players[PLAYER1]:
+                logger.debug(f"Invalid client_id {self.client_id} for local game")
+                return
+            target_paddle = PADDLE_NAMES.get(paddle)
+            if target_paddle is None:
+                logger.debug(f"Invalid paddle: {paddle}")
+                return
+        else:
+            target_paddle = game.paddle_of(self.client_id)
+            if target_paddle is None:
+                return
+        self.update_paddle(game, target_paddle, action, seq)
 
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {'type': 'game_state', 'game_state': game}
-                )
-            last_frame_time = current_time
+    def update_paddle(self, game, paddle, action, seq=None):
+        direction, pressed = ACTIONS[action]
+        game.queue_input(paddle, direction, pressed, seq)
 
     async def send_initial_state(self, game):
-        await self.send(text_data=json.dumps({
-            'type': 'initial_state',
-            'paddle1_x': game['paddle1_x'],
-            'paddle2_x': game['paddle2_x'],
-            'paddle1_y': game['paddle1_y'],
-            'paddle2_y': game['paddle2_y'],
-            'ball_x': game['ball_x'],
-            'ball_y': game['ball_y'],
-            'score1': game['score1'],
-            'score2': game['score2'],
-            'ball_bounds': game['ball_bounds'],
-            'paddle_bounds_x': game['paddle_bounds_x'],
-            'paddle_bounds_y': game['paddle_bounds_y'],
-            'game_opponent': game['game_opponent'],
-            'player_1': game['player_1'],
-            'player_2': game['player_2']
-        }))
+        # Clients acknowledging frames are sent at most frame_window frames ahead of them
+        ack_every = max(1, self.frame_window // 4)
+        await self.send(text_data=json.dumps(dict(game.initial_state(), ack_every=ack_every)))
 
-    async def send_final_state(self, game):
-        final_state = {
-            'type': 'game_result',
-            'result': f"{game['player_1']}: {game['score1']} - {game['score2']} :{game['player_2']}",
-            'winner': game.get('winner', 'Unknown'),
-            'status': 'done'
-        }
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {'type': 'game_result', 'game_result': final_state}
-        )
-
-    async def end_game(self, game):
-        try:
-            from .views import games
-            from .models import Match
-        except ImportError as e:
-            logger.error(f"Cannot import views or models in end_game: {e}")
+    async def acknowledge(self, frame):
+        """The client received the frames up to ``frame``, send the frame held back for it if there is one."""
+        if not isinstance(frame, int) or self.sent_frame is None:
             return
-
-        lock = self.game_locks.setdefault(self.game_id, asyncio.Lock())
-        async with lock:
-            if self.game_id in games:
-                winner = game.get('winner')
-                if winner:
-                    try:
-                        match = await database_sync_to_async(Match.objects.get)(id=self.game_id)
-                        winner_user = await database_sync_to_async(Users.objects.get)(user_name=winner)
-                        match.match_winner = winner_user
-                        match.match_status = Match.MatchStatusChoices.DONE
-                        await database_sync_to_async(match.save)()
-                        logger.info(f"Match {self.game_id} updated with winner {winner}")
-                    except Match.DoesNotExist:
-                        logger.error(f"Match {self.game_id} not found in database")
-                    except Users.DoesNotExist:
-                        logger.error(f"Winner {winner} not found in Users")
-                    except Exception as e:
-                        logger.error(f"Failed to update match {self.game_id} with winner: {e}")
-                del games[self.game_id]
-                if self.game_id in self.game_locks:
-                    del self.game_locks[self.game_id]
+        frame = min(frame, self.sent_frame)
+        if self.acked_frame is None or frame > self.acked_frame:
+            self.acked_frame = frame
+
+        held = self.held_frame
+        if held is not None and not self.window_full():
+            self.held_frame = None
+            scheduler.flow.released += 1
+            await self.send_frame(held)
+
+    def window_full(self):
+        if self.acked_frame is None:
+            # Clients that never acknowledge a frame, like pong JSON clients whose frames carry no
+            # number, are behind when this consumer is: newer frames already wait in its channel
+            return self.backlog() >= max(1, self.frame_window // 4)
+        return self.sent_frame - self.acked_frame >= self.frame_window
+
+    def backlog(self):
+        """Messages waiting in this consumer's channel, 0 on channel layers that do not expose their queues."""
+        queue = getattr(self.channel_layer, 'channels', {}).get(self.channel_name)
+        return queue.qsize() if queue is not None else 0
 
     async def game_state(self, event):
-        game = event['game_state']
-        state = {
-            'type': 'game_state',
-            'ball_x': game['ball_x'],
-            'ball_y': game['ball_y'],
-            'paddle1_y': game['paddle1_y'],
-            'paddle2_y': game['paddle2_y'],
-            'score1': game['score1'],
-            'score2': game['score2'],
-            'paddle1_x': game['paddle1_x'],
-            'paddle2_x': game['paddle2_x'],
-            'ball_bounds': game['ball_bounds'],
-            'paddle_bounds_x': game['paddle_bounds_x'],
-            'paddle_bounds_y': game['paddle_bounds_y'],
-            'game_opponent': game['game_opponent'],
-            'status': game.get('status', 'active'),
-            'player_1': game['player_1'],
-            'player_2': game['player_2']
-        }
-        await self.send(text_data=json.dumps(state))
+        # A client too far behind only gets the newest frame once it catches up, the frames it
+        # would have got in between are dropped instead of piling up in the socket's buffer
+        if self.window_full():
+            if self.held_frame is not None:
+                scheduler.flow.conflated += 1
+                self.needs_keyframe = True
+            self.held_frame = event
+            return
+        if self.held_frame is not None:
+            # Caught up without acknowledging, this frame is newer than the one held back
+            scheduler.flow.conflated += 1
+            self.needs_keyframe = True
+            self.held_frame = None
+        await self.send_frame(event)
+
+    async def send_frame(self, event):
+        # Frames arrive pre-encoded by the scheduler, once per match and tick
+        if self.protocol == DELTA and self.needs_keyframe:
+            self.needs_keyframe = False
+            await self.send(text_data=json.dumps(keyframe(event['values'], event['frame'])))
+        elif self.protocol == BINARY:
+            await self.send(bytes_data=event[BINARY])
+        else:
+            await self.send(text_data=event[self.protocol or JSON])
+        self.sent_frame = event['frame']
+        scheduler.flow.record(self.sent_frame - self.acked_frame if self.acked_frame is not None else 0)
 
     async def game_result(self, event):
+        # Events are never held back, and no frame follows the result
+        self.held_frame = None
         result = event['game_result']
         await self.send(text_data=json.dumps({
             'type': 'game_result',
             'result': result['result'],
             'winner': result['winner'],
-            'status': result['status']
+            'status': result['status'],
+            'outcome': event.get('outcome', 'completed')
         }))
 
     async def game_start(self, event):
@@ -390,7 +325,64 @@ class PongConsumer(AsyncWebsocketConsumer):
         }))
 
     async def game_end(self, event):
+        self.held_frame = None
         await self.send(text_data=json.dumps({
             'type': 'game_end',
             'message': event['message']
-        }))
\ No newline at end of file
+        }))
+        await self.close(code=1000, reason="Game concluded")
+
+class SpectatorConsumer(PongConsumer):
+    """
+    Read-only socket of ``ws/pong/<game_id>/watch/``.
+
+    Spectators register with the registry and the scheduler writes one shared
+    keyframe to them at ``PONG_SPECTATOR_SEND_RATE``, without the channel layer,
+    so they have no channel of their own. They never queue inputs or take the
+    match lock, and the match is not paused or forfeited on their account.
+    """
+
+    # Not a channel layer alias, the consumer gets no channel
+    channel_layer_alias = None
+
+    async def connect(self):
+        self.game_id = self.scope['url_route']['kwargs']['game_id']
+        self.protocol = BINARY if select_subprotocol(self.scope) == BINARY else None
+        self.watching = False
+
+        if await self.reject_foreign_game():
+            return
+
+        self.client_id, result = await self.check_ws_auth(self.scope)
+        if not self.client_id:
+            logger.info(f"Auth failed for spectator of game {self.game_id}: {result}")
+            await self.close(code=4001, reason=result)
+            return
+
+        await self.accept(subprotocol=self.protocol)
+
+        game = await self.wait_for_game()
+        if not game:
+            return
+
+        registry.watch(self.game_id, self)
+        self.watching = True
+        logger.info(f"{self.client_id} is watching game {self.game_id}, {len(registry.spectators[self.game_id])} spectators")
+        initial_state = game.initial_state()
+        initial_state['spectator'] = True
+        await self.send(text_data=json.dumps(initial_state))
+
+    async def disconnect(self, close_code):
+        if self.watching:
+            self.watching = False
+            registry.unwatch(self.game_id, self)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Spectators have no paddle
+        pass
+
+    async def spectator_state(self, event):
+        if self.protocol == BINARY:
+            await self.send(bytes_data=event[BINARY])
+        else:
+            await self.send(text_data=event[JSON])
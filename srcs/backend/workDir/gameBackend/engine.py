@@ -0,0 +1,197 @@
+import logging
+from .state import SERVE_SPEED_Y, PADDLE_SPIN
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the scheduler falls back to the scalar simulation.step
+    np = None
+
+logger = logging.getLogger(__name__)
+
+class VectorEngine:
+    """
+    Struct-of-arrays physics for every live match.
+
+    Each match owns one row in a set of NumPy buffers and ``step`` advances all rows
+    at once with masks for walls, paddles and scoring. It mirrors ``simulation.step``
+    operation for operation, so both paths give the same frames for the same seeds.
+    """
+
+    FLOAT_FIELDS = (
+        'ball_x', 'ball_y', 'ball_speed_x', 'ball_speed_y', 'paddle1_y', 'paddle2_y',
+        'paddle1_x', 'paddle2_x', 'ball_bounds', 'paddle_bounds_x', 'paddle_bounds_y', 'paddle_speed',
+        'tick_scale',
+    )
+    INT_FIELDS = ('score1', 'score2', 'serve_delay', 'serve_ticks')
+    # GameState fields copied once when a match is added
+    SCALAR_FIELDS = ('ball_x', 'ball_y', 'ball_speed_x', 'ball_speed_y', 'ball_bounds',
+                     'paddle_bounds_x', 'paddle_bounds_y', 'paddle_speed', 'serve_delay',
+                     'tick_scale', 'serve_ticks')
+
+    def __init__(self, capacity=256):
+        if np is None:
+            raise ImportError("numpy is required for the vectorized engine")
+        self.capacity = capacity
+        self.size = 0
+        self.rows = {}
+        self.game_ids = []
+        self.layout = 0 # changes whenever a match gets or loses a row
+        for field in self.FLOAT_FIELDS:
+            setattr(self, field, np.zeros(capacity, dtype=np.float64))
+        for field in self.INT_FIELDS:
+            setattr(self, field, np.zeros(capacity, dtype=np.int64))
+        self.moving1 = np.zeros(capacity, dtype=np.int8)
+        self.moving2 = np.zeros(capacity, dtype=np.int8)
+        self.online1 = np.zeros(capacity, dtype=bool)
+        self.online2 = np.zeros(capacity, dtype=bool)
+
+    def __contains__(self, game_id):
+        return game_id in self.rows
+
+    def _grow(self):
+        self.capacity *= 2
+        for field in self.FLOAT_FIELDS + self.INT_FIELDS + ('moving1', 'moving2', 'online1', 'online2'):
+            old = getattr(self, field)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, field, new)
+
+    def add(self, game_id, game):
+        if game_id in self.rows:
+            return
+        if self.size == self.capacity:
+            self._grow()
+        row = self.size
+        self.size += 1
+        self.rows[game_id] = row
+        self.game_ids.append(game_id)
+        self.layout += 1
+        for field in self.SCALAR_FIELDS:
+            getattr(self, field)[row] = getattr(game, field)
+        self.paddle1_x[row], self.paddle2_x[row] = game.paddle_x
+        self.paddle1_y[row], self.paddle2_y[row] = game.paddle_y
+        self.score1[row], self.score2[row] = game.scores
+        self.load(game_id, game)
+
+    def remove(self, game_id):
+        """Free a row by moving the last row into its place."""
+        row = self.rows.pop(game_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            for field in self.FLOAT_FIELDS + self.INT_FIELDS + ('moving1', 'moving2', 'online1', 'online2'):
+                array = getattr(self, field)
+                array[row] = array[last]
+            moved_id = self.game_ids[last]
+            self.game_ids[row] = moved_id
+            self.rows[moved_id] = row
+        self.game_ids.pop()
+        self.size = last
+        self.layout += 1
+
+    def load(self, game_id, game):
+        """Copy the fields that change outside the tick (inputs and connection status) into the buffers."""
+        row = self.rows[game_id]
+        self.moving1[row], self.moving2[row] = game.moving
+        self.online1[row], self.online2[row] = game.online
+
+    def store(self, game_id, game):
+        """Write the simulated fields of one match back to its GameState."""
+        row = self.rows[game_id]
+        game.ball_x = self.ball_x[row].item()
+        game.ball_y = self.ball_y[row].item()
+        game.ball_speed_x = self.ball_speed_x[row].item()
+        game.ball_speed_y = self.ball_speed_y[row].item()
+        game.paddle_y[0] = self.paddle1_y[row].item()
+        game.paddle_y[1] = self.paddle2_y[row].item()
+        game.scores[0] = self.score1[row].item()
+        game.scores[1] = self.score2[row].item()
+        game.serve_delay = self.serve_delay[row].item()
+
+    def step(self, games):
+        """
+        Advance every row by one tick and return the ids of the matches that scored.
+
+        ``games`` maps game ids to their GameState, it is only used for the per-game
+        RNG when a serve has to be drawn.
+        """
+        n = self.size
+        if n == 0:
+            return []
+
+        ball_x, ball_y = self.ball_x[:n], self.ball_y[:n]
+        speed_x, speed_y = self.ball_speed_x[:n], self.ball_speed_y[:n]
+        paddle1_y, paddle2_y = self.paddle1_y[:n], self.paddle2_y[:n]
+        paddle1_x, paddle2_x = self.paddle1_x[:n], self.paddle2_x[:n]
+        bounds_x, bounds_y = self.paddle_bounds_x[:n], self.paddle_bounds_y[:n]
+        ball_bounds, paddle_speed = self.ball_bounds[:n], self.paddle_speed[:n]
+        tick_scale = self.tick_scale[:n]
+        score1, score2, serve_delay = self.score1[:n], self.score2[:n], self.serve_delay[:n]
+
+        # Finished matches stand still until they are stopped, serve pause after a goal
+        done = (score1 >= 7) | (score2 >= 7)
+        paused = ~done & (serve_delay > 0)
+        serve_delay[paused] -= 1
+        active = ~done & ~paused
+
+        # Paddle movement for online players
+        for paddle_y, moving, online in ((paddle1_y, self.moving1[:n], self.online1[:n]),
+                                         (paddle2_y, self.moving2[:n], self.online2[:n])):
+            up = active & online & (moving == -1)
+            down = active & online & (moving == 1)
+            paddle_y[up] = np.maximum(bounds_y[up], paddle_y[up] - paddle_speed[up])
+            paddle_y[down] = np.minimum(1 - bounds_y[down], paddle_y[down] + paddle_speed[down])
+
+        ball_x[active] += speed_x[active]
+        ball_y[active] += speed_y[active]
+
+        # Scoring
+        scored2 = active & (ball_x < paddle1_x - bounds_x)
+        scored1 = active & ~scored2 & (ball_x > paddle2_x + bounds_x)
+        score2[scored2] += 1
+        score1[scored1] += 1
+        scored = scored1 | scored2
+        finished = (score1 >= 7) | (score2 >= 7)
+        scored_rows = np.flatnonzero(scored)
+        if scored_rows.size:
+            ball_x[scored] = 0.5
+            ball_y[scored] = 0.5
+            paddle1_y[scored] = 0.5
+            paddle2_y[scored] = 0.5
+            for row in scored_rows:
+                speed_x[row], speed_y[row] = games[self.game_ids[row]].serve_speed()
+            serving = scored & ~finished
+            serve_delay[serving] = self.serve_ticks[:n][serving]
+
+        # Wall collision
+        live = active & ~scored
+        top = live & (ball_y < ball_bounds)
+        bottom = live & ~top & (ball_y > 1 - ball_bounds)
+        ball_y[top] = ball_bounds[top]
+        speed_y[top] = np.where(speed_y[top] > 0, -np.abs(speed_y[top]), SERVE_SPEED_Y * tick_scale[top])
+        ball_y[bottom] = 1 - ball_bounds[bottom]
+        speed_y[bottom] = np.where(speed_y[bottom] < 0, -np.abs(speed_y[bottom]), -SERVE_SPEED_Y * tick_scale[bottom])
+
+        # Paddle collision
+        live &= ~(top | bottom)
+        hit1 = (live & (ball_x >= paddle1_x) & (ball_x < paddle1_x + bounds_x)
+                & (paddle1_y - bounds_y < ball_y) & (ball_y < paddle1_y + bounds_y))
+        hit2 = (live & ~hit1 & (ball_x <= paddle2_x) & (ball_x > paddle2_x - bounds_x)
+                & (paddle2_y - bounds_y < ball_y) & (ball_y < paddle2_y + bounds_y))
+        speed_x[hit1] = -speed_x[hit1]
+        speed_y[hit1] = (ball_y[hit1] - paddle1_y[hit1]) * PADDLE_SPIN * tick_scale[hit1]
+        speed_x[hit2] = -speed_x[hit2]
+        speed_y[hit2] = (ball_y[hit2] - paddle2_y[hit2]) * PADDLE_SPIN * tick_scale[hit2]
+
+        return [self.game_ids[row] for row in scored_rows]
+
+
+def create_engine(name, **kwargs):
+    """Return the engine configured by ``PONG_ENGINE``, or None for the scalar path."""
+    if name != 'numpy':
+        return None
+    if np is None:
+        logger.warning("PONG_ENGINE is 'numpy' but numpy is not installed, using the scalar engine")
+        return None
+    return VectorEngine(**kwargs)
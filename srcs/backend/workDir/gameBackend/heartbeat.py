@@ -0,0 +1,109 @@
+"""
+Application-level heartbeats of the match and friendship sockets.
+
+A half-open TCP connection, a laptop closed mid-match or a mobile link gone
+dead, is only noticed by the kernel after minutes of retransmissions. Until then
+the player stays online, the match keeps ticking and the user stays in its
+notification groups. Every socket with a ``Heartbeat`` is sent ``{"type":
+"ping", "id": n, "rtt_ms": ...}`` every ``PONG_HEARTBEAT_INTERVAL`` seconds, and
+its client answers with the same ``id`` (``{"action": "pong"}`` on match
+sockets, ``{"type": "pong"}`` on friendship sockets). Once
+``PONG_HEARTBEAT_MISSES`` pings in a row went unanswered the socket is closed.
+The server drops a connection that does not answer the close handshake either
+after about a second, and the consumer goes through its usual ``disconnect``,
+so a dead socket is released within ``(misses + 1) * interval`` seconds.
+
+Each answer measures the round trip time of the connection. It is sent back to
+the client with the next ping, and ``summary`` lists it for every open socket
+of this process.
+"""
+import asyncio
+import json
+import logging
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSE_CODE = 4008 # close code of the sockets that missed their heartbeats
+
+
+class Heartbeat:
+    """Pings the client of ``consumer`` until ``stop`` and closes the socket when it stops answering."""
+
+    live = set() # heartbeats of the open sockets of this process
+    expired = 0 # sockets closed for missing their heartbeats
+
+    def __init__(self, consumer, kind, user_name, interval=None, misses=None):
+        self.consumer = consumer
+        self.kind = kind
+        self.user_name = user_name
+        self.interval = interval if interval is not None else getattr(settings, 'PONG_HEARTBEAT_INTERVAL', 5)
+        self.misses = misses if misses is not None else getattr(settings, 'PONG_HEARTBEAT_MISSES', 2)
+        self.sent = 0 # id of the last ping sent
+        self.answered = 0 # id of the last ping answered
+        self.sent_at = None
+        self.rtt = None # seconds, of the last ping answered in time
+        self._task = None
+
+    def start(self):
+        if self.interval <= 0 or self._task is not None:
+            return
+        Heartbeat.live.add(self)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        Heartbeat.live.discard(self)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def pong(self, ping_id):
+        """The client answered the ping ``ping_id``."""
+        if not isinstance(ping_id, int) or not self.answered < ping_id <= self.sent:
+            return
+        self.answered = ping_id
+        if ping_id == self.sent:
+            self.rtt = time.perf_counter() - self.sent_at
+
+    def rtt_ms(self):
+        return round(self.rtt * 1000, 1) if self.rtt is not None else None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.sent - self.answered >= self.misses:
+                await self.expire()
+                return
+            self.sent += 1
+            self.sent_at = time.perf_counter()
+            await self.consumer.send(text_data=json.dumps({'type': 'ping', 'id': self.sent, 'rtt_ms': self.rtt_ms()}))
+
+    async def expire(self):
+        Heartbeat.expired += 1
+        Heartbeat.live.discard(self)
+        self._task = None
+        logger.info(f"The {self.kind} socket of {self.user_name} missed {self.sent - self.answered} heartbeats, closing it")
+        await self.consumer.close(code=CLOSE_CODE)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summary():
+    """Round trip times of the open sockets of this process, slowest first."""
+    heartbeats = sorted(Heartbeat.live, key=lambda heartbeat: heartbeat.rtt or 0, reverse=True)
+    rtts = sorted(heartbeat.rtt_ms() for heartbeat in heartbeats if heartbeat.rtt is not None)
+    return {
+        'sockets': len(heartbeats),
+        'expired': Heartbeat.expired,
+        'rtt_p50_ms': percentile(rtts, 0.5) if rtts else None,
+        'rtt_p99_ms': percentile(rtts, 0.99) if rtts else None,
+        'connections': [{
+            'socket': heartbeat.kind,
+            'user': heartbeat.user_name,
+            'rtt_ms': heartbeat.rtt_ms(),
+            'unanswered': heartbeat.sent - heartbeat.answered,
+        } for heartbeat in heartbeats],
+    }
@@ -0,0 +1,648 @@
+"""
+Load test of the game and notification WebSockets, run by ``manage.py pong_loadtest``.
+
+Synthetic players connect to ``ws/friendship/`` and ``ws/pong/<game_id>/`` with the
+JWT cookie a login would set, either in-process against ``backend.asgi.application``
+or over the network against a running server. Pairs of players set up a match with
+a game invite, groups of four play a whole tournament, and every player presses
+paddle keys at a human rate until its match is over. Each match can also be
+watched by ``spectators`` sockets on ``ws/pong/<game_id>/watch/``.
+
+``start_workers`` runs the server as several local daphne workers sharing the
+matches, see ``sharding``. The players' notification sockets are then spread
+over the workers and each match socket is opened on the worker owning the match.
+
+The report uses the metric format of ``benchmarks``, so two runs can be compared.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from unittest import mock
+from channels.testing import WebsocketCommunicator
+
+try:
+    import websockets
+except ImportError:  # only needed to load test a server over the network
+    websockets = None
+
+from authentication.models import Users
+from authentication.utils import generate_jwt_token
+from .benchmarks import metric, percentile
+from . import sharding
+from .protocol import BINARY, DELTA, FRAME_STRUCT, INPUT_ACTIONS, INPUT_STRUCT, JSON
+from .state import PLAYER1, PLAYER2, SERVE_DELAY
+
+PLAYER_PREFIX = 'loadtest_'
+
+# Seconds to wait for a message before a session counts as failed. PongConsumer
+# waits up to 30 seconds for its match and a tournament final is only created
+# after both semifinals were recorded.
+RECEIVE_TIMEOUT = 45
+
+# A match clock jump this long between two frames is a serve pause, not a late frame
+PAUSE_MS = SERVE_DELAY * 1000 / 2
+
+
+def create_players(count):
+    """Replace the players of a previous load test with ``count`` new ones and return them."""
+    Users.objects.filter(user_name__startswith=PLAYER_PREFIX).delete()
+    return [
+        Users.objects.create(
+            user_name=f'{PLAYER_PREFIX}{i}',
+            email=f'{PLAYER_PREFIX}{i}@loadtest.invalid',
+            first_name='Load',
+            last_name=f'Test {i}',
+            bio_description='',
+            # Far apart, so rating updates never collide on the unique ppp_rating
+            ppp_rating=1000 + i * 100,
+        )
+        for i in range(count)
+    ]
+
+
+def process_cpu_seconds(pid):
+    """CPU time used so far by another process on this machine, from /proc."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class OfflineBlockchain:
+    """Stands in for TournamentBlockchain in-process, load test players have no Ethereum address to report to."""
+
+    tournament_ids = itertools.count(1)
+
+    def createTournament(self):
+        return next(self.tournament_ids)
+
+
+class InProcessConnection:
+    """A WebSocket to ``backend.asgi.application`` running in this process."""
+
+    def __init__(self, path, token, subprotocols):
+        from backend.asgi import application
+        self.communicator = WebsocketCommunicator(
+            application, path, headers=[(b'cookie', f'token={token}'.encode())], subprotocols=subprotocols,
+        )
+
+    async def connect(self, timeout):
+        connected, _ = await self.communicator.connect(timeout)
+        return connected
+
+    async def send(self, data):
+        if isinstance(data, bytes):
+            await self.communicator.send_to(bytes_data=data)
+        else:
+            await self.communicator.send_to(text_data=data)
+
+    async def receive(self, timeout):
+        """Return the next text or bytes message, or None once the server closed the socket."""
+        message = await self.communicator.receive_output(timeout)
+        if message['type'] == 'websocket.close':
+            return None
+        return message['text'] if message.get('text') is not None else message['bytes']
+
+    async def close(self):
+        try:
+            await self.communicator.disconnect()
+        except Exception:
+            pass
+
+
+class NetworkConnection:
+    """A WebSocket to a server at ``url``, such as ``ws://127.0.0.1:8001`` or ``wss://localhost``."""
+
+    def __init__(self, url, path, token, subprotocols):
+        self.uri = url.rstrip('/') + path
+        self.token = token
+        self.subprotocols = subprotocols
+        self.socket = None
+
+    async def connect(self, timeout):
+        options = {}
+        if self.uri.startswith('wss://'):
+            # The development certificate is self-signed
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            options['ssl'] = context
+        try:
+            self.socket = await asyncio.wait_for(websockets.connect(
+                self.uri, additional_headers={'Cookie': f'token={self.token}'},
+                subprotocols=self.subprotocols or None, max_size=None, **options,
+            ), timeout)
+        except (OSError, websockets.InvalidHandshake):
+            return False
+        return True
+
+    async def send(self, data):
+        try:
+            await self.socket.send(data)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def receive(self, timeout):
+        try:
+            return await asyncio.wait_for(self.socket.recv(), timeout)
+        except websockets.ConnectionClosed:
+            return None
+
+    async def close(self):
+        if self.socket is not None:
+            await self.socket.close()
+
+
+class LoadStats:
+    """Samples collected by every synthetic player of a run."""
+
+    def __init__(self):
+        self.connect_ms = {'friendship': [], 'pong': [], 'watch': []}
+        self.invite_ms = []
+        self.inter_arrival_ms = []
+        self.jitter_ms = []
+        self.input_latency_ms = []
+        self.spectator_inter_arrival_ms = []
+        self.spectator_frames = 0
+        self.frames = 0
+        self.dropped_frames = 0
+        self.inputs = 0
+        self.matches = set()
+        self.worker_matches = {}
+        self.tournaments = 0
+        self.errors = {}
+        self.client_cpu = 0.0
+
+    def error(self, reason):
+        self.errors[reason] = self.errors.get(reason, 0) + 1
+
+
+class Player:
+    """One synthetic user, with a notification socket open for the whole run."""
+
+    def __init__(self, load_test, user, seed):
+        self.load_test = load_test
+        self.stats = load_test.stats
+        self.user = user
+        self.name = user.user_name
+        self.rng = random.Random(seed)
+        self.friendship = None
+        self.reader = None
+        self.inbox = []
+        self.received = asyncio.Event()
+
+    async def connect(self):
+        self.friendship = await self.load_test.open('/ws/friendship/', self.user, 'friendship',
+                                                    url=self.load_test.front_url(self.user.id))
+        if self.friendship is None:
+            return False
+        # Read the socket all along like the browser does, its heartbeats are answered during matches too
+        self.reader = asyncio.ensure_future(self.read_notifications())
+        return True
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+        if self.friendship is not None:
+            await self.friendship.close()
+
+    async def send_json(self, message):
+        await self.friendship.send(json.dumps(message))
+
+    async def read_notifications(self):
+        try:
+            while True:
+                text = await self.friendship.receive(None)
+                if text is None:
+                    break
+                message = json.loads(text)
+                if message.get('type') == 'ping':
+                    await self.send_json({'type': 'pong', 'id': message['id']})
+                    continue
+                self.inbox.append(message)
+                self.received.set()
+        finally:
+            self.received.set()
+
+    async def expect(self, *types):
+        """Wait for the next notification of one of ``types``, keeping the others for later calls."""
+        deadline = time.monotonic() + RECEIVE_TIMEOUT
+        while True:
+            for i, message in enumerate(self.inbox):
+                if message.get('type') in types:
+                    return self.inbox.pop(i)
+                if message.get('type') in ('error', 'game_invite_error', 'tournament_error'):
+                    self.inbox.pop(i)
+                    raise RuntimeError(f"{message['type']}: {message.get('error') or message.get('message')}")
+            if self.reader.done():
+                raise RuntimeError('friendship socket closed')
+            self.received.clear()
+            await asyncio.wait_for(self.received.wait(), max(deadline - time.monotonic(), 0))
+
+    async def play(self, game_id, protocol):
+        """Play a match until the server ends it and return the winner's username."""
+        subprotocols = [protocol] if protocol != JSON else []
+        socket = await self.load_test.open(f'/ws/pong/{game_id}/', self.user, 'pong', subprotocols,
+                                           self.load_test.worker_url(game_id))
+        if socket is None:
+            return None
+
+        stats = self.stats
+        paddle = None
+        winner = None
+        sent = deque() # (seq, time sent) of inputs the server has not acknowledged yet
+        keys = None
+        ack_every = 0
+        last_arrival = last_time = last_frame = None
+        try:
+            while True:
+                message = await socket.receive(RECEIVE_TIMEOUT)
+                if message is None:
+                    break
+                now = time.perf_counter()
+                cpu = time.thread_time()
+
+                frame = match_time = ack = None
+                if isinstance(message, bytes):
+                    values = FRAME_STRUCT.unpack(message)
+                    frame, match_time = values[1], values[2]
+                    ack = values[10 + paddle] if paddle is not None else None
+                else:
+                    data = json.loads(message)
+                    kind = data.get('type')
+                    if kind == 'initial_state':
+                        paddle = PLAYER1 if data['player_1'] == self.name else PLAYER2
+                        ack_every = data.get('ack_every', 0)
+                    elif kind in ('game_state', 'keyframe', 'delta'):
+                        frame = data.get('frame')
+                        match_time = data.get('time')
+                        ack = data.get(f'ack{paddle + 1}') if paddle is not None else None
+                    elif kind == 'game_result':
+                        winner = data['winner']
+                        stats.matches.add(game_id)
+                        if keys is not None:
+                            keys.cancel()
+                    elif kind == 'ping':
+                        await socket.send(json.dumps({'action': 'pong', 'id': data['id']}))
+                    elif kind == 'error':
+                        stats.error(f"pong: {data['error']}")
+
+                paused = False
+                if frame is not None or match_time is not None:
+                    stats.frames += 1
+                    if keys is None and winner is None:
+                        # Start pressing keys once the match runs, like a player watching the serve
+                        keys = asyncio.ensure_future(self.press_keys(socket, protocol, sent))
+                    if match_time is not None and last_time is not None:
+                        paused = match_time - last_time > PAUSE_MS
+                    if last_arrival is not None and not paused:
+                        stats.inter_arrival_ms.append((now - last_arrival) * 1000)
+                        if match_time is not None and last_time is not None:
+                            # Arrival spacing against send spacing
+                            stats.jitter_ms.append(abs((now - last_arrival) * 1000 - (match_time - last_time)))
+                    if frame is not None and last_frame is not None and frame > last_frame + 1:
+                        stats.dropped_frames += frame - last_frame - 1
+                        if protocol == DELTA:
+                            await socket.send(json.dumps({'action': 'resync'}))
+                    last_arrival = now
+                    last_time = match_time if match_time is not None else last_time
+                    last_frame = frame if frame is not None else last_frame
+                    if ack_every and frame is not None and frame % ack_every == 0:
+                        # Acknowledge frames like the browser does, or the server holds them back
+                        if protocol == BINARY:
+                            await socket.send(INPUT_STRUCT.pack(INPUT_ACTIONS.index('ack'), 0, frame))
+                        else:
+                            await socket.send(json.dumps({'action': 'ack', 'frame': frame}))
+                while ack is not None and sent and sent[0][0] <= ack:
+                    # Inputs sent during a serve pause are only acknowledged by the frame after it
+                    latency = (now - sent.popleft()[1]) * 1000
+                    if not paused:
+                        stats.input_latency_ms.append(latency)
+                stats.client_cpu += time.thread_time() - cpu
+        except asyncio.TimeoutError:
+            stats.error('pong: no message before timeout')
+        finally:
+            if keys is not None:
+                keys.cancel()
+            await socket.close()
+        return winner
+
+    async def press_keys(self, socket, protocol, sent):
+        """Press and release up or down at random, ``input_rate`` key events per second on average."""
+        held = None
+        for seq in itertools.count(1):
+            await asyncio.sleep(self.rng.expovariate(self.load_test.input_rate))
+            if held is None:
+                held = self.rng.choice(('up', 'down'))
+                action = f'{held}Start'
+            else:
+                action, held = f'{held}Stop', None
+            if protocol == BINARY:
+                data = INPUT_STRUCT.pack(INPUT_ACTIONS.index(action), 0, seq)
+            else:
+                data = json.dumps({'action': action, 'seq': seq})
+            sent.append((seq, time.perf_counter()))
+            self.stats.inputs += 1
+            await socket.send(data)
+
+
+class LoadTest:
+    """
+    Drives ``matches`` invite matches and ``tournaments`` four player tournaments at once.
+
+    Without ``url`` the clients talk to ``backend.asgi.application`` in this process,
+    so the CPU they use is measured and left out of the server CPU. Over the network
+    the server CPU is read from ``/proc`` when the ``server_pids`` are given. With
+    ``worker_urls`` the server is sharded: the friendship sockets are spread over
+    the workers and the match sockets of each match go to the worker that owns it.
+    """
+
+    def __init__(self, players, matches=10, tournaments=1, protocol=DELTA, input_rate=6.0, ramp=1.0,
+                 url=None, server_pids=(), seed=0, spectators=0, worker_urls=None):
+        self.players = players
+        self.matches = matches
+        self.tournaments = tournaments
+        self.protocol = protocol
+        self.input_rate = input_rate
+        self.ramp = ramp
+        self.url = url
+        self.server_pids = list(server_pids)
+        self.worker_urls = worker_urls
+        self.seed = seed
+        self.spectators = spectators
+        self.stats = LoadStats()
+
+    @staticmethod
+    def players_needed(matches, tournaments):
+        return matches * 2 + tournaments * 4
+
+    def front_url(self, user_id):
+        """URL of the worker serving the notification socket of a user, spread like a load balancer would."""
+        if not self.worker_urls:
+            return self.url
+        return self.worker_urls[user_id % len(self.worker_urls)]
+
+    def worker_url(self, game_id):
+        """URL of the worker hosting ``game_id``, ``url`` when the server is not sharded."""
+        if not self.worker_urls:
+            return self.url
+        worker = sharding.owner_of(game_id, len(self.worker_urls))
+        self.stats.worker_matches.setdefault(worker, set()).add(game_id)
+        return self.worker_urls[worker]
+
+    async def open(self, path, user, kind, subprotocols=(), url=None):
+        token = generate_jwt_token(user)
+        if self.url is None:
+            socket = InProcessConnection(path, token, list(subprotocols))
+        else:
+            socket = NetworkConnection(url or self.url, path, token, list(subprotocols))
+        start = time.perf_counter()
+        if not await socket.connect(RECEIVE_TIMEOUT):
+            self.stats.error(f'{kind}: connection refused')
+            return None
+        self.stats.connect_ms[kind].append((time.perf_counter() - start) * 1000)
+        return socket
+
+    async def invite_match(self, host, guest):
+        start = time.perf_counter()
+        await host.send_json({'type': 'send_game_invite', 'to_username': guest.name, 'game_mode': 'online'})
+        invite = await guest.expect('new_game_invite_notification')
+        await guest.send_json({'type': 'accept_game_invite', 'invite_id': invite['invite_id']})
+        accepted = await host.expect('game_invite_accepted_notification')
+        self.stats.invite_ms.append((time.perf_counter() - start) * 1000)
+        await asyncio.gather(
+            host.play(accepted['game_id'], self.protocol),
+            guest.play(accepted['game_id'], self.protocol),
+            self.watch(accepted['game_id']),
+        )
+
+    async def watch(self, game_id):
+        """Watch a match with ``spectators`` sockets, logged in as players of the run, until it ends."""
+        users = itertools.islice(itertools.cycle(self.players), self.spectators)
+        await asyncio.gather(*(self.spectate(game_id, user) for user in users))
+
+    async def spectate(self, game_id, user):
+        subprotocols = [BINARY] if self.protocol == BINARY else []
+        socket = await self.open(f'/ws/pong/{game_id}/watch/', user, 'watch', subprotocols, self.worker_url(game_id))
+        if socket is None:
+            return
+
+        stats = self.stats
+        last_arrival = last_time = None
+        try:
+            while True:
+                message = await socket.receive(RECEIVE_TIMEOUT)
+                if message is None:
+                    break
+                now = time.perf_counter()
+                cpu = time.thread_time()
+                if isinstance(message, bytes):
+                    match_time = FRAME_STRUCT.unpack(message)[2]
+                else:
+                    data = json.loads(message)
+                    if data.get('type') == 'error':
+                        stats.error(f"watch: {data['error']}")
+                    match_time = data.get('time') if data.get('type') == 'keyframe' else None
+                if match_time is not None:
+                    stats.spectator_frames += 1
+                    if last_arrival is not None and match_time - last_time <= PAUSE_MS:
+                        stats.spectator_inter_arrival_ms.append((now - last_arrival) * 1000)
+                    last_arrival, last_time = now, match_time
+                stats.client_cpu += time.thread_time() - cpu
+        except asyncio.TimeoutError:
+            stats.error('watch: no message before timeout')
+        finally:
+            await socket.close()
+
+    async def tournament(self, creator, *invited):
+        await creator.send_json({
+            'type': 'create_tournament',
+            'tournament_name': f'Load test {creator.name}',
+            'invited_usernames': [player.name for player in invited],
+        })
+        created = await creator.expect('tournament_created')
+        for player in invited:
+            invite = await player.expect('new_game_invite_notification')
+            await player.send_json({
+                'type': 'accept_tournament_invite',
+                'invite_id': invite['invite_id'],
+                'tournament_id': created['tournament_id'],
+            })
+
+        players = (creator,) + invited
+        starts = await asyncio.gather(*(player.expect('tournament_match_start') for player in players))
+        winners = await asyncio.gather(*(player.play(start['game_id'], self.protocol) for player, start in zip(players, starts)))
+        finalists = [player for player in players if player.name in winners]
+        for player, start, winner in zip(players, starts, winners):
+            if player.name == winner:
+                await player.send_json({'type': 'report_match_result', 'game_id': start['game_id'], 'winner': winner,
+                                        'tournament_id': created['tournament_id']})
+
+        starts = await asyncio.gather(*(player.expect('tournament_match_start') for player in finalists))
+        winners, _ = await asyncio.gather(
+            asyncio.gather(*(player.play(start['game_id'], self.protocol) for player, start in zip(finalists, starts))),
+            self.watch(starts[0]['game_id']) if starts else asyncio.sleep(0),
+        )
+        for player, start, winner in zip(finalists, starts, winners):
+            if player.name == winner:
+                await player.send_json({'type': 'report_match_result', 'game_id': start['game_id'], 'winner': winner,
+                                        'tournament_id': created['tournament_id']})
+        await creator.expect('tournament_completed')
+        self.stats.tournaments += 1
+
+    async def session(self, delay, flow, players):
+        await asyncio.sleep(delay)
+        try:
+            for player in players:
+                if not await player.connect():
+                    return
+            await flow(*players)
+        except (RuntimeError, asyncio.TimeoutError) as e:
+            self.stats.error(f'{flow.__name__}: {str(e) or "timeout"}')
+        finally:
+            for player in players:
+                await player.close()
+
+    async def run(self, timeout=None):
+        players = [Player(self, user, self.seed * 100003 + i) for i, user in enumerate(self.players)]
+        sessions = [(self.invite_match, players[i * 2:i * 2 + 2]) for i in range(self.matches)]
+        offset = self.matches * 2
+        sessions += [(self.tournament, players[offset + i * 4:offset + i * 4 + 4]) for i in range(self.tournaments)]
+
+        wall = time.perf_counter()
+        cpu = time.process_time() if self.url is None else None
+        server_cpu = [process_cpu_seconds(pid) for pid in self.server_pids] if self.server_pids else None
+        tasks = [
+            asyncio.ensure_future(self.session(self.ramp * i / max(len(sessions), 1), flow, group))
+            for i, (flow, group) in enumerate(sessions)
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.stats.error('session still running at the timeout')
+            await asyncio.wait(pending)
+        wall = time.perf_counter() - wall
+
+        if cpu is not None:
+            server_cpu = time.process_time() - cpu - self.stats.client_cpu
+        elif server_cpu is not None:
+            server_cpu = [process_cpu_seconds(pid) - start for pid, start in zip(self.server_pids, server_cpu)]
+        return self.report(wall, server_cpu)
+
+    def report(self, wall, server_cpu):
+        """``server_cpu`` is the CPU seconds of the server, or a list of them per server process."""
+        stats = self.stats
+        results = []
+
+        def distribution(name, samples, unit='ms'):
+            if samples:
+                results.append(metric(f'{name}.p50_{unit}', statistics.median(samples), unit, 'lower'))
+                results.append(metric(f'{name}.p99_{unit}', percentile(samples, 0.99), unit, 'lower'))
+
+        distribution('connect.friendship', stats.connect_ms['friendship'])
+        distribution('connect.pong', stats.connect_ms['pong'])
+        distribution('connect.watch', stats.connect_ms['watch'])
+        distribution('invite.round_trip', stats.invite_ms)
+        distribution('frames.inter_arrival', stats.inter_arrival_ms)
+        distribution('frames.jitter', stats.jitter_ms)
+        distribution('inputs.ack_latency', stats.input_latency_ms)
+        distribution('spectators.inter_arrival', stats.spectator_inter_arrival_ms)
+        results += [
+            metric('frames.received', stats.frames, 'frames'),
+            metric('frames.dropped', stats.dropped_frames, 'frames', 'lower'),
+            metric('inputs.sent', stats.inputs, 'inputs'),
+            metric('spectators.frames', stats.spectator_frames, 'frames'),
+            metric('matches.finished', len(stats.matches), 'matches'),
+            metric('tournaments.completed', stats.tournaments, 'tournaments'),
+            metric('errors', sum(stats.errors.values()), 'errors', 'lower'),
+        ]
+        for worker, games in sorted(stats.worker_matches.items()):
+            results.append(metric(f'workers.{worker}.matches', len(games), 'matches'))
+        if isinstance(server_cpu, list):
+            if len(server_cpu) > 1:
+                for worker, seconds in enumerate(server_cpu):
+                    results.append(metric(f'cpu.worker_{worker}_percent', seconds / wall * 100, '%', 'lower'))
+            server_cpu = sum(server_cpu)
+        if server_cpu is not None and stats.matches:
+            results.append(metric('cpu.server_per_match_ms', server_cpu / len(stats.matches) * 1000, 'ms', 'lower'))
+            results.append(metric('cpu.server_percent', server_cpu / wall * 100, '%', 'lower'))
+
+        return {
+            'meta': {
+                'transport': self.url or 'in-process',
+                'workers': len(self.worker_urls) if self.worker_urls else 1,
+                'players': len(self.players),
+                'matches': self.matches,
+                'tournaments': self.tournaments,
+                'spectators': self.spectators,
+                'protocol': self.protocol,
+                'input_rate': self.input_rate,
+                'duration_s': round(wall, 3),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'errors': stats.errors,
+            },
+            'results': results,
+        }
+
+
+def start_workers(count, port, database, host='127.0.0.1', timeout=30):
+    """
+    Start ``count`` daphne workers of a sharded server on ``port`` and the ports after it.
+
+    The workers use the load test settings on the SQLite file ``database`` and reach
+    each other over Unix sockets in a temporary directory. Returns the processes and
+    the URL of each worker, once they all accept connections.
+    """
+    sockets = tempfile.mkdtemp(prefix='pong-workers-')
+    processes = []
+    for worker in range(count):
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='backend.settings_loadtest',
+            PONG_LOADTEST_DB=str(database),
+            PONG_WORKERS=str(count),
+            PONG_WORKER_ID=str(worker),
+            PONG_WORKER_SOCKET=os.path.join(sockets, 'worker-{worker}.sock'),
+            PONG_LAYER_SOCKET=os.path.join(sockets, 'layer-{worker}.sock'),
+        )
+        processes.append(subprocess.Popen(
+            [sys.executable, '-m', 'daphne', '-b', host, '-p', str(port + worker),
+             '-u', os.path.join(sockets, f'worker-{worker}.sock'), 'backend.asgi:application'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        ))
+
+    deadline = time.monotonic() + timeout
+    for worker, process in enumerate(processes):
+        while not os.path.exists(os.path.join(sockets, f'worker-{worker}.sock')):
+            if process.poll() is not None or time.monotonic() > deadline:
+                stop_workers(processes)
+                raise RuntimeError(f"Worker {worker} did not start")
+            time.sleep(0.1)
+    return processes, [f'ws://{host}:{port + worker}' for worker in range(count)]
+
+
+def stop_workers(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_loadtest(load_test, timeout=None):
+    """Run a load test and return its report, in-process with tournaments kept off the blockchain."""
+    if load_test.url is not None:
+        return asyncio.run(load_test.run(timeout))
+    with mock.patch('authentication.consumers.TournamentBlockchain', OfflineBlockchain):
+        return asyncio.run(load_test.run(timeout))
@@ -0,0 +1,52 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from gameBackend.benchmarks import GAME_COUNTS, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmark the Pong engine, scheduler tick, frame serialization and group_send fan-out"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--games', default=','.join(map(str, GAME_COUNTS)),
+                            help="Comma-separated numbers of concurrent games for the tick benchmark")
+        parser.add_argument('--ticks', type=int, default=240, help="Ticks measured per tick benchmark")
+        parser.add_argument('--iterations', type=int, default=10000, help="Iterations of the serialization benchmarks")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+        parser.add_argument('--baseline', help="JSON report of a previous run to compare with")
+        parser.add_argument('--tolerance', type=float, default=10.0,
+                            help="Percent a metric may get worse than the baseline before it counts as a regression")
+
+    def handle(self, *args, **options):
+        try:
+            game_counts = [int(count) for count in options['games'].split(',') if count]
+        except ValueError:
+            raise CommandError("--games must be a comma-separated list of integers")
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        report = run_benchmarks(game_counts, options['ticks'], options['iterations'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if baseline is None:
+            return
+
+        rows = compare(report, baseline, options['tolerance'])
+        regressions = 0
+        for name, before, current, change, regressed in rows:
+            line = f"{name:<48} {before:>14} -> {current:>14} {change:+7.1f}%"
+            if regressed:
+                regressions += 1
+                self.stderr.write(self.style.ERROR(line + "  REGRESSION"))
+            else:
+                self.stderr.write(line)
+        if regressions:
+            raise CommandError(f"{regressions} metrics regressed by more than {options['tolerance']}%")
@@ -0,0 +1,98 @@
+import json
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from gameBackend import loadtest
+from gameBackend.benchmarks import compare
+from gameBackend.protocol import BINARY, DELTA, JSON
+
+
+class Command(BaseCommand):
+    help = "Load test the Pong and friendship WebSockets with synthetic players, in-process or over the network"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--matches', type=int, default=10, help="Concurrent invite matches, two players each")
+        parser.add_argument('--tournaments', type=int, default=1, help="Concurrent tournaments, four players each")
+        parser.add_argument('--spectators', type=int, default=0,
+                            help="Spectator sockets watching each invite match and tournament final")
+        parser.add_argument('--protocol', choices=(JSON, DELTA, BINARY), default=DELTA, help="Frame format the players ask for")
+        parser.add_argument('--input-rate', type=float, default=6.0, help="Paddle key events per second and player")
+        parser.add_argument('--ramp', type=float, default=1.0, help="Seconds over which the sessions are started")
+        parser.add_argument('--timeout', type=float, default=600.0, help="Seconds after which running sessions are cut")
+        parser.add_argument('--url', help="Server to load test, such as ws://127.0.0.1:8001, instead of the in-process application")
+        parser.add_argument('--server-pid', type=int, help="Process id of the server at --url, to measure its CPU time")
+        parser.add_argument('--workers', type=int, default=0,
+                            help="Start this many local daphne workers sharing the matches and load test them instead of --url")
+        parser.add_argument('--port', type=int, default=8765, help="Port of the first local worker, the others follow it")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the players' key presses")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+        parser.add_argument('--baseline', help="JSON report of a previous run to compare with")
+        parser.add_argument('--tolerance', type=float, default=10.0,
+                            help="Percent a metric may get worse than the baseline before it counts as a regression")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("pong_loadtest creates its own players, run it with --settings backend.settings_loadtest")
+        if (options['url'] or options['workers']) and loadtest.websockets is None:
+            raise CommandError("--url and --workers need the websockets package")
+        if options['url'] and options['workers']:
+            raise CommandError("--url and --workers cannot be combined")
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        call_command('migrate', run_syncdb=True, verbosity=0)
+        players = loadtest.create_players(loadtest.LoadTest.players_needed(options['matches'], options['tournaments']))
+
+        url, server_pids, worker_urls, workers = options['url'], [], None, []
+        if options['server_pid']:
+            server_pids.append(options['server_pid'])
+        if options['workers']:
+            try:
+                workers, worker_urls = loadtest.start_workers(options['workers'], options['port'],
+                                                              connection.settings_dict['NAME'])
+            except RuntimeError as e:
+                raise CommandError(str(e))
+            url, server_pids = worker_urls[0], [worker.pid for worker in workers]
+
+        load_test = loadtest.LoadTest(
+            players,
+            matches=options['matches'],
+            tournaments=options['tournaments'],
+            protocol=options['protocol'],
+            input_rate=options['input_rate'],
+            ramp=options['ramp'],
+            url=url,
+            server_pids=server_pids,
+            seed=options['seed'],
+            spectators=options['spectators'],
+            worker_urls=worker_urls,
+        )
+        try:
+            report = loadtest.run_loadtest(load_test, options['timeout'])
+        finally:
+            loadtest.stop_workers(workers)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if baseline is None:
+            return
+
+        rows = compare(report, baseline, options['tolerance'])
+        regressions = 0
+        for name, before, current, change, regressed in rows:
+            line = f"{name:<48} {before:>14} -> {current:>14} {change:+7.1f}%"
+            if regressed:
+                regressions += 1
+                self.stderr.write(self.style.ERROR(line + "  REGRESSION"))
+            else:
+                self.stderr.write(line)
+        if regressions:
+            raise CommandError(f"{regressions} metrics regressed by more than {options['tolerance']}%")
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from gameBackend.benchmarks import profile_ticks
+from gameBackend.engine import np, VectorEngine
+
+
+class Command(BaseCommand):
+    help = "Show where the game loop's ticks spend their time, from a running server or an in-process run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Server to read the profile of, such as http://127.0.0.1:8000, instead of an in-process run")
+        parser.add_argument('--token', help="Profile token of the server, PONG_PROFILE_TOKEN by default")
+        parser.add_argument('--game', help="Only show the phases of this game, with --url")
+        parser.add_argument('--action', choices=('enable', 'reset', 'disable'), help="Turn profiling on or off on the server first")
+        parser.add_argument('--games', type=int, default=100, help="Matches of the in-process run")
+        parser.add_argument('--ticks', type=int, default=600, help="Ticks of the in-process run")
+        parser.add_argument('--engine', choices=('scalar', 'numpy'), default='scalar', help="Physics engine of the in-process run")
+        parser.add_argument('--json', action='store_true', help="Print the raw JSON profile")
+
+    def handle(self, *args, **options):
+        if options['url']:
+            profile = self.fetch(options)
+        else:
+            engine = None
+            if options['engine'] == 'numpy':
+                if np is None:
+                    raise CommandError("The numpy engine needs numpy")
+                engine = VectorEngine(capacity=options['games'])
+            profile = dict(asyncio.run(profile_ticks(options['games'], options['ticks'], engine)), enabled=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps(profile, indent=2))
+        else:
+            if not profile.get('enabled'):
+                self.stdout.write("Profiling is off on this server, turn it on with --action enable")
+            else:
+                self.print_phases(profile['phases'])
+            if profile.get('flow'):
+                flow = profile['flow']
+                self.stdout.write(f"player frames sent {flow['sent']}, conflated {flow['conflated']}, "
+                                  f"released {flow['released']}, max unacknowledged {flow['max_depth']}")
+            if profile.get('heartbeat'):
+                heartbeat = profile['heartbeat']
+                self.stdout.write(f"open sockets {heartbeat['sockets']}, closed for missed heartbeats {heartbeat['expired']}, "
+                                  f"round trip p50 {heartbeat['rtt_p50_ms']} ms, p99 {heartbeat['rtt_p99_ms']} ms")
+
+    def fetch(self, options):
+        token = options['token'] or getattr(settings, 'PONG_PROFILE_TOKEN', '')
+        url = options['url'].rstrip('/') + '/game_profile/'
+        if options['game']:
+            url += '?' + urllib.parse.urlencode({'game_id': options['game']})
+        data = urllib.parse.urlencode({'action': options['action']}).encode() if options['action'] else None
+        request = urllib.request.Request(url, data=data, headers={'X-Profile-Token': token})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            raise CommandError(f"{url}: {e.code} {e.read().decode(errors='replace')}")
+        except urllib.error.URLError as e:
+            raise CommandError(f"{url}: {e.reason}")
+
+    def print_phases(self, phases):
+        self.stdout.write(f"{'phase':<12} {'count':>9} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'max us':>10} {'total ms':>10}")
+        for phase, stats in phases.items():
+            self.stdout.write(f"{phase:<12} {stats['count']:>9} {stats['mean_us']:>9} {stats['p50_us']:>9} "
+                              f"{stats['p99_us']:>9} {stats['max_us']:>10} {stats['total_ms']:>10}")
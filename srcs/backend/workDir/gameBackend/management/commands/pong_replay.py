@@ -0,0 +1,63 @@
+import cProfile
+import pstats
+import time
+from django.core.management.base import BaseCommand, CommandError
+from gameBackend.models import MatchReplay
+from gameBackend.replay import Replay
+
+
+class Command(BaseCommand):
+    help = "Re-simulate a recorded match to check its result, measure the engine or profile it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('match_id', nargs='?', type=int, help="Match whose stored replay to load")
+        parser.add_argument('--file', help="Load the replay from a file, such as one saved by match_replay/?format=log")
+        parser.add_argument('--save', help="Write the replay to this file")
+        parser.add_argument('--repeat', type=int, default=1, help="Simulate the match this many times")
+        parser.add_argument('--profile', action='store_true', help="Print the functions the simulation spends most time in")
+
+    def handle(self, *args, **options):
+        if options['file']:
+            with open(options['file'], 'rb') as f:
+                data = f.read()
+        elif options['match_id'] is not None:
+            stored = MatchReplay.objects.filter(match_id=options['match_id']).first()
+            if stored is None:
+                raise CommandError(f"Match {options['match_id']} has no replay")
+            data = bytes(stored.data)
+        else:
+            raise CommandError("Give a match id or --file")
+
+        try:
+            replay = Replay.decode(data)
+        except ValueError as e:
+            raise CommandError(f"Invalid replay: {e}")
+
+        if options['save']:
+            with open(options['save'], 'wb') as f:
+                f.write(data)
+
+        profiler = cProfile.Profile() if options['profile'] else None
+        repeat = max(options['repeat'], 1)
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        for _ in range(repeat):
+            game = replay.simulate()
+        if profiler:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        match_seconds = replay.ticks / replay.tick_rate
+        verified = tuple(game.scores) == replay.scores
+        self.stdout.write(f"Replay: {len(data)} bytes, {len(replay.events)} events, seed {replay.seed}")
+        self.stdout.write(f"Match: {replay.ticks} ticks at {replay.tick_rate} Hz, {match_seconds:.1f}s, recorded score {replay.scores[0]}-{replay.scores[1]}")
+        self.stdout.write(f"Simulated score {game.scores[0]}-{game.scores[1]}, "
+                          f"{elapsed / repeat * 1000:.2f} ms per run, {match_seconds * repeat / elapsed:.0f}x real time")
+        if profiler:
+            pstats.Stats(profiler, stream=self.stdout).sort_stats('cumulative').print_stats(15)
+
+        if verified:
+            self.stdout.write(self.style.SUCCESS("Result verified"))
+        else:
+            raise CommandError("The simulated score does not match the recorded one")
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameInvites',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('refused', 'Refused')], default='pending')),
+                ('game_mode', models.CharField(choices=[('online', 'Online'), ('tournament', 'Tournament')])),
+                ('issued_at', models.DateTimeField(auto_now_add=True)),
+                ('game_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('from_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='game_invites_sent', to='authentication.users')),
+                ('to_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='game_invites_received', to='authentication.users')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Match',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('blockchain_match_id', models.IntegerField(blank=True, null=True)),
+                ('match_name', models.CharField(max_length=255)),
+                ('match_status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('cancelled', 'Cancelled')], default='pending', max_length=15)),
+                ('game_opponent', models.CharField(choices=[('local', 'Local'), ('online', 'Online')], default='local', max_length=15)),
+                ('score_player_1', models.IntegerField(blank=True, null=True)),
+                ('score_player_2', models.IntegerField(blank=True, null=True)),
+                ('match_creation_date', models.DateTimeField(auto_now_add=True)),
+                ('match_loser', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='match_loser', to='authentication.users')),
+                ('match_winner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='match_winner', to='authentication.users')),
+                ('player_1', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='player_1', to='authentication.users')),
+                ('player_2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='player_2', to='authentication.users')),
+            ],
+            options={
+                'unique_together': {('player_1', 'player_2', 'match_creation_date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Tournament',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('blockchain_tournament_id', models.IntegerField(blank=True, null=True)),
+                ('tournament_name', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='pending', max_length=15)),
+                ('current_round', models.CharField(choices=[('pending', 'Pending'), ('semifinals', 'Semifinals'), ('final', 'Final')], default='pending', max_length=20)),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('champion', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tournaments_won', to='authentication.users')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='created_tournaments', to='authentication.users')),
+                ('final', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tournament_final', to='gameBackend.match')),
+                ('participants', models.ManyToManyField(related_name='tournaments_participated', to='authentication.users')),
+                ('semifinal_1', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tournament_semifinal_1', to='gameBackend.match')),
+                ('semifinal_2', models.OneToOneField(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='tournament_semifinal_2', to='gameBackend.match')),
+            ],
+            options={
+                'ordering': ['-creation_date'],
+            },
+        ),
+    ]
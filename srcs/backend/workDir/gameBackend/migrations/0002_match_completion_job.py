@@ -0,0 +1,30 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gameBackend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchCompletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('recorded', 'Recorded'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=15)),
+                ('score_player_1', models.IntegerField()),
+                ('score_player_2', models.IntegerField()),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('match', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='completion_job', to='gameBackend.match')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_initial'),
+        ('gameBackend', '0002_match_completion_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchcompletionjob',
+            name='forfeit_winner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='authentication.users'),
+        ),
+        migrations.AddField(
+            model_name='matchcompletionjob',
+            name='outcome',
+            field=models.CharField(choices=[('completed', 'Completed'), ('forfeit', 'Forfeit'), ('cancelled', 'Cancelled')], default='completed', max_length=15),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gameBackend', '0004_match_replay'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='match',
+            name='game_opponent',
+            field=models.CharField(choices=[('local', 'Local'), ('online', 'Online'), ('ai', 'Ai')], default='local', max_length=15),
+        ),
+    ]
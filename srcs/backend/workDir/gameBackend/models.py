@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from authentication.models import Users
 
 class Match(models.Model):
@@ -10,6 +11,7 @@ class Match(models.Model):
     class GameOpponentChoices(models.TextChoices):
         LOCAL = 'local'
         ONLINE = 'online'
+        AI = 'ai'
     id = models.AutoField(primary_key=True)
     blockchain_match_id = models.IntegerField(null=True, blank=True)
     match_name = models.CharField(max_length=255)
@@ -26,6 +28,42 @@ class Match(models.Model):
     class Meta:
         unique_together = ('player_1', 'player_2', 'match_creation_date')
 
+class MatchCompletionJob(models.Model):
+    class JobStatusChoices(models.TextChoices):
+        PENDING = 'pending' # nothing saved yet
+        RECORDED = 'recorded' # match, player stats and ratings saved, blockchain report left
+        DONE = 'done'
+        FAILED = 'failed' # gave up after too many attempts
+
+    class OutcomeChoices(models.TextChoices):
+        COMPLETED = 'completed' # someone reached the winning score
+        FORFEIT = 'forfeit' # the opponent left for longer than the grace period
+        CANCELLED = 'cancelled' # nobody stayed connected, no winner
+
+    match = models.OneToOneField(Match, on_delete=models.CASCADE, related_name='completion_job')
+    status = models.CharField(max_length=15, choices=JobStatusChoices.choices, default=JobStatusChoices.PENDING)
+    outcome = models.CharField(max_length=15, choices=OutcomeChoices.choices, default=OutcomeChoices.COMPLETED)
+    forfeit_winner = models.ForeignKey(Users, on_delete=models.SET_NULL, related_name='+', null=True, blank=True)
+    score_player_1 = models.IntegerField()
+    score_player_2 = models.IntegerField()
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Completion of match {self.match_id} - {self.status}"
+
+class MatchReplay(models.Model):
+    # Seed and input log of a finished match, see gameBackend.replay for the format
+    match = models.OneToOneField(Match, on_delete=models.CASCADE, related_name='replay')
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Replay of match {self.match_id} - {len(self.data)} bytes"
+
 class GameInvites(models.Model):
     class GameInviteStatus(models.TextChoices):
         PENDING = 'pending'
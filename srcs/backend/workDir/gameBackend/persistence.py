@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from .models import Match
+
+logger = logging.getLogger(__name__)
+
+
+class ScoreWriter:
+    """
+    Write-behind persistence of in-match scores.
+
+    The tick only calls ``record``, which keeps the latest scores of each match in
+    memory. A background task wakes up every ``flush_interval`` seconds and writes
+    all pending matches with a single ``bulk_update``, so a goal never waits on the
+    database and several goals of a match between two flushes cost one write.
+
+    Once a match is finished its completion job owns the score: ``discard`` drops
+    what is pending for it, a failed write in flight is not retried, and rows of
+    matches no longer pending are never written.
+    """
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.writing = set() # matches of the writes in flight
+        self.discarded = set() # matches discarded while a write of theirs was in flight
+        self._task = None
+
+    def record(self, game_id, scores):
+        self.pending[game_id] = tuple(scores)
+        if self._task is None or self._task.done():
+            if self.flush_interval is None:
+                self.flush_interval = getattr(settings, 'PONG_SCORE_FLUSH_INTERVAL', 1.0)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def discard(self, game_id):
+        """Forget the scores of a finished match, its final result is written by the completion job."""
+        self.pending.pop(game_id, None)
+        if game_id in self.writing:
+            self.discarded.add(game_id)
+
+    async def _run(self):
+        while self.pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self, game_id=None):
+        """Write the pending scores of one match, or of every match, now."""
+        if game_id is None:
+            batch, self.pending = self.pending, {}
+        elif game_id in self.pending:
+            batch = {game_id: self.pending.pop(game_id)}
+        else:
+            return
+        if not batch:
+            return
+
+        self.writing.update(batch)
+        try:
+            await database_sync_to_async(self._write)(batch)
+        except Exception as e:
+            logger.error(f"Failed to update intermediate scores of {len(batch)} games: {e}")
+            # Retry on the next flush unless a newer score came in or the match finished meanwhile
+            for pending_id, scores in batch.items():
+                if pending_id not in self.discarded:
+                    self.pending.setdefault(pending_id, scores)
+        finally:
+            self.writing.difference_update(batch)
+            self.discarded.difference_update(batch)
+
+    @staticmethod
+    def _write(batch):
+        # Only the primary key is needed to update a row, no need to load the matches
+        matches = [
+            Match(id=game_id, score_player_1=score1, score_player_2=score2)
+            for game_id, (score1, score2) in batch.items()
+        ]
+        # A late write must not overwrite the final score of a match that was completed meanwhile
+        Match.objects.filter(match_status=Match.MatchStatusChoices.PENDING).bulk_update(
+            matches, ['score_player_1', 'score_player_2'])
+
+
+score_writer = ScoreWriter()
@@ -0,0 +1,157 @@
+import json
+import struct
+from .state import PLAYER1, PLAYER2
+
+# WebSocket subprotocols of ws/pong/<game_id>/, clients that ask for none get full JSON frames.
+# Spectators on ws/pong/<game_id>/watch/ get JSON keyframes, or pong.binary frames if they ask for it.
+JSON = 'json'
+DELTA = 'pong.delta'
+BINARY = 'pong.binary'
+SUBPROTOCOLS = (BINARY, DELTA)
+PROTOCOLS = (JSON, DELTA, BINARY)
+
+KEYFRAME_INTERVAL = 60 # one full frame per second at 60 Hz
+
+# Fields that change during a match, everything else is sent once in initial_state
+FRAME_FIELDS = ('time', 'ball_x', 'ball_y', 'paddle1_y', 'paddle2_y', 'score1', 'score2', 'status', 'ack1', 'ack2')
+
+
+# pong.binary game frame, little-endian:
+# message type, frame number, match time in ms, ball x/y, paddle 1/2 y, score 1/2, status bits,
+# last input sequence number applied for paddle 1/2
+FRAME_STRUCT = struct.Struct('<BIIffffBBBII')
+MESSAGE_FRAME = 1
+STATUS_DONE = 0x01
+STATUS_PLAYER1_ONLINE = 0x02
+STATUS_PLAYER2_ONLINE = 0x04
+
+# pong.binary input: action code, paddle code (0 outside local games), sequence number.
+# An ack carries the number of the last frame received instead of a sequence number.
+INPUT_STRUCT = struct.Struct('<BBI')
+INPUT_ACTIONS = ('upStart', 'upStop', 'downStart', 'downStop', 'wStart', 'wStop', 'sStart', 'sStop', 'ack')
+INPUT_PADDLES = (None, 'player1', 'player2')
+MAX_SEQ = 2 ** 32 - 1
+
+
+def select_subprotocol(scope):
+    """Return the first subprotocol offered by the client that the server speaks, if any."""
+    for subprotocol in scope.get('subprotocols', []):
+        if subprotocol in SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+def frame_values(game):
+    return (
+        game.time(), game.ball_x, game.ball_y, game.paddle_y[PLAYER1], game.paddle_y[PLAYER2],
+        game.scores[PLAYER1], game.scores[PLAYER2], game.status, game.acks[PLAYER1], game.acks[PLAYER2],
+    )
+
+
+def keyframe(values, frame):
+    message = {'type': 'keyframe', 'frame': frame}
+    message.update(zip(FRAME_FIELDS, values))
+    return message
+
+
+def status_bits(game):
+    bits = STATUS_DONE if game.status == 'done' else 0
+    if game.online[PLAYER1]:
+        bits |= STATUS_PLAYER1_ONLINE
+    if game.online[PLAYER2]:
+        bits |= STATUS_PLAYER2_ONLINE
+    return bits
+
+
+def pack_frame(game, frame):
+    return FRAME_STRUCT.pack(
+        MESSAGE_FRAME, frame, game.time(), game.ball_x, game.ball_y, game.paddle_y[PLAYER1], game.paddle_y[PLAYER2],
+        game.scores[PLAYER1], game.scores[PLAYER2], status_bits(game), game.acks[PLAYER1], game.acks[PLAYER2],
+    )
+
+
+def input_seq(value):
+    """Return a client input sequence number if it fits the frame format, otherwise None."""
+    if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_SEQ:
+        return value
+    return None
+
+
+def decode_input(data):
+    """Return the ``(action, paddle, seq)`` of a pong.binary input message, like the JSON ``action``/``paddle``/``seq`` keys."""
+    if len(data) != INPUT_STRUCT.size:
+        raise ValueError(f"Binary input must be {INPUT_STRUCT.size} bytes, got {len(data)}")
+    action, paddle, seq = INPUT_STRUCT.unpack(data)
+    if action >= len(INPUT_ACTIONS) or paddle >= len(INPUT_PADDLES):
+        raise ValueError(f"Unknown binary input {action}/{paddle}")
+    return INPUT_ACTIONS[action], INPUT_PADDLES[paddle], seq
+
+
+class DeltaEncoder:
+    """
+    Builds the ``pong.delta`` message of one match for each tick.
+
+    A frame only carries the fields that changed since the previous frame, plus its
+    frame number. WebSocket delivery is reliable and ordered, so a client that
+    received frame N holds the base of frame N + 1; when it sees a gap it asks for a
+    resync and gets a keyframe. Every ``keyframe_interval`` frames all fields are sent.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.frame = 0
+        self.previous = None
+
+    def encode(self, game):
+        values = frame_values(game)
+        self.frame += 1
+        if self.previous is None or self.frame % self.keyframe_interval == 0:
+            message = keyframe(values, self.frame)
+        else:
+            message = {'type': 'delta', 'frame': self.frame}
+            for field, value, previous in zip(FRAME_FIELDS, values, self.previous):
+                if value != previous:
+                    message[field] = value
+        self.previous = values
+        return message
+
+
+def encode_frame(game, encoder, protocols=PROTOCOLS):
+    """
+    Encode one tick of a match once for each of ``protocols``.
+
+    Returns the ``game_state`` channel layer event. It only holds immutable,
+    pre-encoded values, so every group member sends the same text or bytes and
+    a serializing channel layer never has to pickle the live GameState. The
+    delta is computed on every tick, used or not, so the encoder's base frame
+    stays current for clients that join later.
+    """
+    delta = encoder.encode(game)
+    event = {
+        'type': 'game_state',
+        'frame': encoder.frame,
+        'values': encoder.previous,
+    }
+    if JSON in protocols:
+        event[JSON] = json.dumps(game.frame())
+    if DELTA in protocols:
+        event[DELTA] = json.dumps(delta)
+    if BINARY in protocols:
+        event[BINARY] = pack_frame(game, encoder.frame)
+    return event
+
+
+def spectator_frame(event):
+    """
+    Build the ``spectator_state`` event of a tick from the players' ``game_state`` event.
+
+    Spectators get full keyframes so they need no per-socket state, and one event is
+    shared by all spectators of the match. It reuses the values and bytes already
+    encoded for the players, so spectators add one ``json.dumps`` per spectator frame
+    and nothing per spectator.
+    """
+    return {
+        'type': 'spectator_state',
+        JSON: json.dumps(keyframe(event['values'], event['frame'])),
+        BINARY: event[BINARY],
+    }
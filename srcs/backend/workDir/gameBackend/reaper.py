@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from django.conf import settings
+from .completion import Outcome
+from .registry import registry
+from .scheduler import scheduler
+from .state import PLAYER1, PLAYER2
+
+logger = logging.getLogger(__name__)
+
+
+class GameReaper:
+    """
+    Ends the matches of the ``registry`` that their players abandoned.
+
+    Every ``interval`` seconds it looks at when each player last disconnected,
+    ``GameState.disconnect_time``, or when the match was created for players who
+    never joined. Once a player has been gone for ``grace_period`` seconds while
+    the opponent is still connected, the opponent wins by forfeit. A match nobody
+    has been connected to for ``grace_period`` seconds is cancelled. Either way the
+    outcome goes through the completion job like any finished match, and the match
+    is removed from the registry.
+
+    Matches nobody is connected to are already paused by the consumers, so until
+    the grace period is over they only cost their memory.
+    """
+
+    def __init__(self, grace_period=60, interval=5):
+        self.grace_period = grace_period
+        self.interval = interval
+        self._task = None
+
+    def configure(self):
+        self.grace_period = getattr(settings, 'PONG_ABANDON_GRACE_PERIOD', self.grace_period)
+        self.interval = getattr(settings, 'PONG_REAP_INTERVAL', self.interval)
+
+    def start(self):
+        """Start sweeping in the background, if not already running. Called by every consumer on connect."""
+        if self._task is None or self._task.done():
+            self.configure()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.exception(f"Game reaper sweep failed: {e}")
+
+    def verdict(self, game, now):
+        """Return ``(outcome, winner)`` for a match that should end now, otherwise None."""
+        grace = timedelta(seconds=self.grace_period)
+        if not game.game_running:
+            # Nobody ever joined
+            return (Outcome.CANCELLED, None) if now - game.created_at > grace else None
+
+        paddles = (PLAYER1,) if game.game_opponent in ('local', 'ai') else (PLAYER1, PLAYER2)
+        gone = [paddle for paddle in paddles
+                if not game.online[paddle] and now - (game.disconnect_time[paddle] or game.created_at) > grace]
+        if len(gone) == len(paddles):
+            return Outcome.CANCELLED, None
+        if gone and game.connected():
+            winner = PLAYER2 if gone[0] == PLAYER1 else PLAYER1
+            return Outcome.FORFEIT, game.players[winner]
+        return None
+
+    async def sweep(self, now=None):
+        """End every abandoned match, return how many were ended."""
+        now = now or datetime.utcnow()
+        ended = 0
+        for game_id, game in registry.items():
+            if game.status == 'done' or self.verdict(game, now) is None:
+                continue
+
+            async with registry.lock(game_id):
+                # A player may have come back while the lock was taken
+                verdict = self.verdict(game, now) if registry.get(game_id) is game and game.status != 'done' else None
+                if verdict is None:
+                    continue
+                outcome, winner = verdict
+                game.status = 'done'
+                game.winner = winner
+                scheduler.stop_game(game_id)
+
+            logger.info(f"Game {game_id} abandoned: {outcome}, winner {winner}, {game.result_text()}")
+            asyncio.create_task(scheduler.finish_game(game_id, game, outcome))
+            ended += 1
+        return ended
+
+
+reaper = GameReaper()
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from django.conf import settings
+from .ai import DEFAULT_LEVEL
+from .replay import ReplayRecorder
+from .state import GameState
+
+logger = logging.getLogger(__name__)
+
+
+def new_game(player_1, player_2=None, game_opponent='local', seed=None, send_rate=None, ai_level=None):
+    """A match at the deployment's tick rate, not registered anywhere."""
+    game = GameState(player_1, player_2, game_opponent, seed, tick_rate=settings.PONG_TICK_RATE, send_rate=send_rate)
+    if game_opponent == 'ai':
+        game.ai_level = ai_level or DEFAULT_LEVEL
+    if getattr(settings, 'PONG_RECORD_REPLAYS', False):
+        game.replay = ReplayRecorder()
+    return game
+
+
+class GameRegistry:
+    """
+    Owns the live matches of this process and the locks that guard them.
+
+    Matches are added with ``create`` and dropped with ``remove``, nothing else
+    writes to ``games``. Alongside the matches the registry keeps:
+
+    - ``players``, the live match of each user name, so a player who reconnects
+      or reloads the page is found without scanning every match;
+    - the sockets waiting in ``wait_for`` for a match that does not exist yet,
+      which are woken the moment it is created instead of polling;
+    - ``spectators``, the spectator consumers of each match, which the scheduler
+      sends to directly instead of through the channel layer;
+    - ``protocols``, how many player sockets of each match take its frames in
+      each protocol, so the scheduler only encodes the ones in use;
+    - the ``on_create`` and ``on_remove`` hooks, called with ``(game_id, game)``.
+
+    ``create`` is also called from sync views running outside the event loop, so
+    waiters are always woken with ``call_soon_threadsafe`` and hooks must not
+    assume they run on the loop.
+    """
+
+    def __init__(self):
+        self.games = {}
+        self.locks = {}
+        self.players = {}
+        self.spectators = {}
+        self.protocols = {}
+        self.on_create = []
+        self.on_remove = []
+        self._waiters = {}
+
+    def __contains__(self, game_id):
+        return game_id in self.games
+
+    def __len__(self):
+        return len(self.games)
+
+    def get(self, game_id):
+        return self.games.get(game_id)
+
+    def items(self):
+        return list(self.games.items())
+
+    def lock(self, game_id):
+        return self.locks.setdefault(game_id, asyncio.Lock())
+
+    def game_of(self, user_name):
+        """Id of the live match ``user_name`` plays in, None when there is none."""
+        return self.players.get(user_name)
+
+    def watch(self, game_id, consumer):
+        self.spectators.setdefault(game_id, set()).add(consumer)
+
+    def unwatch(self, game_id, consumer):
+        spectators = self.spectators.get(game_id)
+        if spectators is not None:
+            spectators.discard(consumer)
+            if not spectators:
+                del self.spectators[game_id]
+
+    def subscribe(self, game_id, protocol):
+        protocols = self.protocols.setdefault(game_id, {})
+        protocols[protocol] = protocols.get(protocol, 0) + 1
+
+    def unsubscribe(self, game_id, protocol):
+        protocols = self.protocols.get(game_id)
+        if protocols is None or protocol not in protocols:
+            return
+        protocols[protocol] -= 1
+        if not protocols[protocol]:
+            del protocols[protocol]
+            if not protocols:
+                del self.protocols[game_id]
+
+    def protocols_of(self, game_id):
+        """Protocols the player sockets of ``game_id`` negotiated, whether or not the match exists yet."""
+        return self.protocols.get(game_id, {})
+
+    def create(self, game_id, player_1, player_2=None, game_opponent='local', seed=None, send_rate=None, ai_level=None):
+        """Create the match ``game_id`` and wake its waiters. Returns the existing match if there is one."""
+        game = self.games.get(game_id)
+        if game is not None:
+            return game
+
+        game = new_game(player_1, player_2, game_opponent, seed, send_rate, ai_level)
+        self.games[game_id] = game
+        for user_name in game.players:
+            if user_name:
+                self.players[user_name] = game_id
+
+        for future in self._waiters.pop(game_id, ()):
+            future.get_loop().call_soon_threadsafe(self._resolve, future, game)
+        self._run_hooks(self.on_create, game_id, game)
+        return game
+
+    def remove(self, game_id):
+        """Drop a finished match and its lock, returns the match or None."""
+        game = self.games.pop(game_id, None)
+        self.locks.pop(game_id, None)
+        self.spectators.pop(game_id, None)
+        if game is None:
+            return None
+
+        for user_name in game.players:
+            if self.players.get(user_name) == game_id:
+                del self.players[user_name]
+        self._run_hooks(self.on_remove, game_id, game)
+        return game
+
+    async def wait_for(self, game_id, timeout):
+        """Return the match ``game_id`` as soon as it exists, or None after ``timeout`` seconds."""
+        game = self.games.get(game_id)
+        if game is not None:
+            return game
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(game_id, set()).add(future)
+        try:
+            # The match may have been created by another thread in between
+            game = self.games.get(game_id)
+            if game is not None:
+                return game
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(game_id)
+            if waiters is not None:
+                waiters.discard(future)
+                if not waiters:
+                    del self._waiters[game_id]
+
+    @staticmethod
+    def _resolve(future, game):
+        if not future.done():
+            future.set_result(game)
+
+    @staticmethod
+    def _run_hooks(hooks, game_id, game):
+        for hook in hooks:
+            try:
+                hook(game_id, game)
+            except Exception as e:
+                logger.exception(f"Game registry hook {hook} failed for game {game_id}: {e}")
+
+
+registry = GameRegistry()
@@ -0,0 +1,163 @@
+"""
+Compact match replays.
+
+A replay is the seed and tick rate of a match plus what the players did, not the
+frames: ``simulation.step`` is deterministic, so stepping a fresh ``GameState``
+through the same events gives back every frame of the live match. The live
+scheduler only appends a few bytes to an in-memory buffer when an input is
+applied or a player connects or leaves. The log is encoded once when the match
+is over and stored with its completion job.
+
+Binary format, little-endian. The header is magic, version, seed, tick rate,
+ticks played, the final score of each player and flags. It is followed by one
+3-byte event per change: the ticks since the previous event, then an event code.
+A match of a few minutes takes a few KB.
+"""
+import struct
+from .state import GameState, PADDLES, PLAYER1, PLAYER2, UP, DOWN
+from . import simulation
+from .protocol import frame_values, keyframe
+
+MAGIC = b'PGRL'
+VERSION = 1
+HEADER_STRUCT = struct.Struct('<4sBIHIBBB')
+EVENT_STRUCT = struct.Struct('<HB')
+MAX_DELTA = 0xFFFF
+
+FLAG_LOCAL = 0x01
+
+# Event codes: bit 0 is the paddle, bit 1 pressed or online, bit 2 the direction (down)
+INPUT = 0x00
+ONLINE = 0x10
+WAIT = 0xF0 # no change, only moves the clock when two events are more than MAX_DELTA ticks apart
+PADDLE_BIT = 0x01
+FLAG_BIT = 0x02
+DOWN_BIT = 0x04
+
+
+class ReplayRecorder:
+    """
+    Records the events of one live match, called by ``GameState.drain_inputs``.
+
+    Every event is recorded at the tick it is applied at. A player connecting or
+    leaving is recorded too, since the paddles of offline players do not move.
+    """
+
+    __slots__ = ('events', 'last_tick', 'online')
+
+    def __init__(self):
+        self.events = bytearray()
+        self.last_tick = 0
+        self.online = [False, False]
+
+    def _append(self, tick, code):
+        delta = tick - self.last_tick
+        while delta > MAX_DELTA:
+            self.events += EVENT_STRUCT.pack(MAX_DELTA, WAIT)
+            delta -= MAX_DELTA
+        self.events += EVENT_STRUCT.pack(delta, code)
+        self.last_tick = tick
+
+    def record_input(self, tick, paddle, direction, pressed):
+        code = INPUT | paddle
+        if pressed:
+            code |= FLAG_BIT
+        if direction == DOWN:
+            code |= DOWN_BIT
+        self._append(tick, code)
+
+    def record_online(self, tick, online):
+        for paddle in PADDLES:
+            if online[paddle] != self.online[paddle]:
+                self._append(tick, ONLINE | paddle | (FLAG_BIT if online[paddle] else 0))
+                self.online[paddle] = online[paddle]
+
+    def encode(self, game):
+        """The replay of ``game`` as bytes, with the ticks and scores it has reached."""
+        flags = FLAG_LOCAL if game.game_opponent == 'local' else 0
+        header = HEADER_STRUCT.pack(MAGIC, VERSION, game.rng.seed, game.tick_rate, game.ticks,
+                                    game.scores[PLAYER1], game.scores[PLAYER2], flags)
+        return header + bytes(self.events)
+
+
+class Replay:
+    """A decoded replay, ``events`` holds ``(tick, code)`` pairs."""
+
+    __slots__ = ('seed', 'tick_rate', 'ticks', 'scores', 'local', 'events')
+
+    def __init__(self, seed, tick_rate, ticks, scores, local, events):
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.ticks = ticks
+        self.scores = scores
+        self.local = local
+        self.events = events
+
+    @classmethod
+    def decode(cls, data):
+        data = bytes(data)
+        if len(data) < HEADER_STRUCT.size:
+            raise ValueError("Replay is too short")
+        magic, version, seed, tick_rate, ticks, score1, score2, flags = HEADER_STRUCT.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a version {VERSION} replay")
+        if (len(data) - HEADER_STRUCT.size) % EVENT_STRUCT.size:
+            raise ValueError("Replay is truncated")
+
+        events = []
+        tick = 0
+        for delta, code in EVENT_STRUCT.iter_unpack(data[HEADER_STRUCT.size:]):
+            tick += delta
+            if code != WAIT:
+                events.append((tick, code))
+        return cls(seed, tick_rate, ticks, (score1, score2), bool(flags & FLAG_LOCAL), events)
+
+    def new_game(self, players=('player1', 'player2')):
+        return GameState(players[PLAYER1], players[PLAYER2], 'local' if self.local else 'online',
+                         seed=self.seed, tick_rate=self.tick_rate)
+
+    def steps(self, game):
+        """Step ``game`` through the match, applying each event at its tick, and yield every step result."""
+        events = iter(self.events)
+        pending = next(events, None)
+        while game.ticks < self.ticks:
+            tick = game.ticks + 1
+            while pending is not None and pending[0] <= tick:
+                apply_event(game, pending[1])
+                pending = next(events, None)
+            result = simulation.step(game)
+            if result == simulation.SCORED and simulation.is_finished(game):
+                game.status = 'done'
+            yield result
+
+    def simulate(self, game=None, on_frame=None):
+        """
+        Re-run the match as fast as possible and return its final state.
+
+        ``on_frame(game)`` is called after every tick the live server sent a frame for.
+        """
+        game = game or self.new_game()
+        for result in self.steps(game):
+            if result != simulation.PAUSED and on_frame is not None:
+                on_frame(game)
+        return game
+
+    def verify(self):
+        """Whether re-simulating the match gives the recorded score."""
+        return tuple(self.simulate().scores) == self.scores
+
+    def frames(self, send_rate=30, players=('player1', 'player2')):
+        """Yield, as they are simulated, the keyframes of the match at ``send_rate`` per second of match time."""
+        interval = max(1, round(self.tick_rate / send_rate))
+        game = self.new_game(players)
+        for result in self.steps(game):
+            if result != simulation.PAUSED and game.ticks % interval == 0:
+                yield keyframe(frame_values(game), game.ticks // interval)
+
+
+def apply_event(game, code):
+    paddle = code & PADDLE_BIT
+    if code & 0xF0 == ONLINE:
+        game.online[paddle] = bool(code & FLAG_BIT)
+    else:
+        simulation.apply_input(game, paddle, DOWN if code & DOWN_BIT else UP, bool(code & FLAG_BIT))
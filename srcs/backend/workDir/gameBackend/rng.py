@@ -0,0 +1,38 @@
+import random
+
+MASK32 = 0xFFFFFFFF
+
+
+def imul(a, b):
+    return (a * b) & MASK32
+
+
+class Mulberry32:
+    """
+    Small seeded PRNG with 32-bit state.
+
+    Unlike ``random.Random`` its output is specified by a few lines of integer
+    arithmetic, so any runtime can reproduce it. The JavaScript version is the
+    well-known ``mulberry32`` with ``Math.imul``, a client can replay a match
+    with the same serves as the server.
+    """
+
+    __slots__ = ('seed', 'state')
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed & MASK32
+        self.state = self.seed
+
+    def next_uint32(self):
+        self.state = (self.state + 0x6D2B79F5) & MASK32
+        t = imul(self.state ^ (self.state >> 15), self.state | 1)
+        t ^= (t + imul(t ^ (t >> 7), t | 61)) & MASK32
+        return (t ^ (t >> 14)) & MASK32
+
+    def random(self):
+        return self.next_uint32() / 4294967296
+
+    def choice(self, seq):
+        return seq[self.next_uint32() % len(seq)]
@@ -0,0 +1,466 @@
+import asyncio
+import logging
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .ai import create_bots
+from .engine import create_engine
+from .completion import Outcome, completion_worker
+from .persistence import score_writer
+from .registry import registry
+from .protocol import BINARY, DeltaEncoder, encode_frame, spectator_frame
+from .stats import FlowStats, TickProfiler, TickStats
+from . import simulation
+from .state import PLAYER1, PLAYER2
+
+logger = logging.getLogger(__name__)
+
+
+class GameScheduler:
+    """
+    Drives every running match of the ``registry`` from a single asyncio task.
+
+    Matches are registered with ``start_game`` and stepped together, ``batch_size``
+    at a time, on one shared timeline of ``PONG_TICK_RATE`` physics steps per second.
+    The loop does not belong to any socket: it keeps going when consumers disconnect
+    and stops by itself once no match is left.
+
+    Frames go out at ``PONG_SEND_RATE`` per second, or at the match's own
+    ``send_rate``, so a match can simulate at 120 Hz and broadcast at 30 Hz. Each
+    frame carries the match time so clients can interpolate between them.
+
+    Spectators of a match get every ``spectator_interval`` ticks a keyframe built
+    from the players' frame of the same tick. The channel layer copies an event
+    for every member of a group, so spectator frames bypass it: they are written
+    to the registry's spectator consumers by a separate task once the tick is
+    over. While that task is still busy, newer spectator frames are dropped
+    rather than delaying the next tick, so viewers never slow the players down.
+
+    Ticks run on absolute ``time.monotonic()`` deadlines. A late loop runs the
+    missed ticks back to back, up to ``max_catch_up`` per wake-up, and skips the
+    rest, so matches keep their real-time speed under load. How late each match
+    was stepped is kept in ``game_stats`` and for the whole loop in ``stats``.
+
+    With ``PONG_ENGINE = 'numpy'`` the physics of all matches runs in one
+    ``VectorEngine.step``, otherwise each match goes through ``simulation.step``.
+
+    A match nobody is connected to is moved from ``running`` to ``paused`` with
+    ``pause_game`` and costs nothing until ``resume_game``; the reaper ends it if
+    nobody comes back.
+
+    The bots of ``ai`` matches are played by one ``BotController``: at the start
+    of every tick ``bots.decide`` queues the inputs of all of them at once, and
+    the step applies them like any player's.
+
+    With ``PONG_PROFILE`` on, or once ``enable_profiling`` is called, ``profiler``
+    times every phase of the tick, see ``stats.PHASES``. It is None otherwise and
+    the tick then takes no extra timestamps.
+    """
+
+    def __init__(self, frame_rate=60, send_rate=60, batch_size=64, engine=None, max_catch_up=5, spectator_rate=20):
+        self.frame_rate = frame_rate
+        self.send_rate = send_rate
+        self.spectator_rate = spectator_rate
+        self.batch_size = batch_size
+        self.max_catch_up = max_catch_up
+        self.running = set()
+        self.paused = set()
+        self.engine = engine
+        self.bots = None
+        self.profiler = None
+        self.ticks = 0
+        self.encoders = {}
+        self.send_intervals = {}
+        self.spectator_intervals = {}
+        self.spectator_frames = []
+        self.spectator_frames_dropped = 0
+        self._spectator_task = None
+        self.stats = TickStats()
+        self.flow = FlowStats()
+        self.game_stats = {}
+        self._task = None
+        self._last_overload_warning = 0.0
+
+    def configure(self):
+        self.frame_rate = getattr(settings, 'PONG_TICK_RATE', self.frame_rate)
+        self.send_rate = getattr(settings, 'PONG_SEND_RATE', self.send_rate)
+        self.spectator_rate = getattr(settings, 'PONG_SPECTATOR_SEND_RATE', self.spectator_rate)
+        self.engine = create_engine(getattr(settings, 'PONG_ENGINE', 'scalar'))
+        if self.bots is None:
+            self.bots = create_bots()
+        if self.profiler is None and getattr(settings, 'PONG_PROFILE', False):
+            self.enable_profiling()
+
+    def enable_profiling(self, window=None, windows=None):
+        """Start timing the phases of each tick, with fresh histograms."""
+        self.profiler = TickProfiler(
+            window=window or getattr(settings, 'PONG_PROFILE_WINDOW', 10.0),
+            windows=windows or getattr(settings, 'PONG_PROFILE_WINDOWS', 6),
+        )
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def send_interval(self, game):
+        """Number of ticks between two frames of a match, at least one."""
+        send_rate = game.send_rate or self.send_rate
+        return max(1, round(game.tick_rate / send_rate))
+
+    def spectator_interval(self, game, send_interval):
+        """Number of ticks between two spectator frames, a multiple of ``send_interval`` so they reuse a player frame."""
+        return max(1, round(game.tick_rate / self.spectator_rate / send_interval)) * send_interval
+
+    def start_game(self, game_id):
+        """Register a match with the loop. Starting an already running match is a no-op."""
+        if game_id in self.running or game_id in self.paused:
+            return False
+        if self._task is None:
+            self.configure()
+        self.running.add(game_id)
+        self.encoders[game_id] = DeltaEncoder()
+        game = registry.get(game_id)
+        self.send_intervals[game_id] = self.send_interval(game)
+        self.spectator_intervals[game_id] = self.spectator_interval(game, self.send_intervals[game_id])
+        self.game_stats[game_id] = TickStats()
+        self.add_bot(game_id, game)
+        self.wake()
+        return True
+
+    def add_bot(self, game_id, game):
+        if game.game_opponent == 'ai' and self.bots is not None:
+            self.bots.add(game_id, game)
+
+    def remove_bot(self, game_id):
+        if self.bots is not None:
+            self.bots.remove(game_id)
+
+    def wake(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def pause_game(self, game_id):
+        """Stop stepping a match, keeping its frame numbers and stats for ``resume_game``."""
+        if game_id not in self.running:
+            return False
+        self.running.discard(game_id)
+        self.paused.add(game_id)
+        if self.engine is not None:
+            self.engine.remove(game_id)
+        self.remove_bot(game_id)
+        logger.info(f"Game {game_id} paused, no player connected")
+        return True
+
+    def resume_game(self, game_id):
+        if game_id not in self.paused:
+            return False
+        self.paused.discard(game_id)
+        self.running.add(game_id)
+        game = registry.get(game_id)
+        if game is not None:
+            self.add_bot(game_id, game)
+        self.wake()
+        logger.info(f"Game {game_id} resumed")
+        return True
+
+    def stop_game(self, game_id):
+        self.running.discard(game_id)
+        self.paused.discard(game_id)
+        self.encoders.pop(game_id, None)
+        self.send_intervals.pop(game_id, None)
+        self.spectator_intervals.pop(game_id, None)
+        stats = self.game_stats.pop(game_id, None)
+        if stats is not None and stats.ticks:
+            logger.info(f"Game {game_id} tick stats: {stats.summary()}")
+        if self.engine is not None:
+            self.engine.remove(game_id)
+        self.remove_bot(game_id)
+        if self.profiler is not None:
+            self.profiler.drop(game_id)
+
+    async def _run(self):
+        tick_duration = 1 / self.frame_rate
+        deadline = time.monotonic()
+        logger.info("Game scheduler started")
+
+        while self.running:
+            now = time.monotonic()
+            if now < deadline:
+                await asyncio.sleep(deadline - now)
+                now = time.monotonic()
+
+            # Ticks whose deadline has passed, run at most max_catch_up of them
+            due = int((now - deadline) / tick_duration) + 1
+            if due > self.max_catch_up:
+                self.skip_ticks(due - self.max_catch_up, now)
+                deadline += (due - self.max_catch_up) * tick_duration
+                due = self.max_catch_up
+
+            for _ in range(due):
+                await self.tick(deadline)
+                deadline += tick_duration
+
+        logger.info("Game scheduler stopped, no running games")
+
+    def skip_ticks(self, count, now):
+        self.stats.skipped += count
+        for game_id in self.running:
+            stats = self.game_stats.get(game_id)
+            if stats is not None:
+                stats.skipped += count
+        if now - self._last_overload_warning >= 1:
+            self._last_overload_warning = now
+            logger.warning(f"Game scheduler is overloaded, skipped {count} ticks for {len(self.running)} games")
+
+    def apply_inputs(self, game_id, game):
+        """Apply the inputs queued by the consumers since the last tick."""
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+            oldest = game.drain_inputs()
+            profiler.record('inputs', time.perf_counter() - start, game_id)
+        else:
+            oldest = game.drain_inputs()
+        if oldest is not None:
+            stats = self.game_stats.get(game_id)
+            if stats is not None:
+                stats.record_input_delay(time.monotonic() - oldest)
+
+    def record_lateness(self, game_id, lateness):
+        stats = self.game_stats.get(game_id)
+        if stats is not None:
+            stats.record(lateness)
+
+    async def tick(self, deadline=None):
+        if deadline is None:
+            deadline = time.monotonic()
+        self.stats.record(time.monotonic() - deadline)
+        self.ticks += 1
+        profiler = self.profiler
+        if profiler is not None:
+            tick_start = time.perf_counter()
+            profiler.rotate()
+
+        if self.bots is not None and len(self.bots):
+            try:
+                if profiler is not None:
+                    start = time.perf_counter()
+                    self.bots.decide(self.ticks, self.engine)
+                    profiler.record('bots', time.perf_counter() - start)
+                else:
+                    self.bots.decide(self.ticks, self.engine)
+            except Exception as e:
+                logger.exception(f"AI opponents failed to decide: {e}")
+
+        if self.engine is not None:
+            await self._tick_vectorized(deadline)
+        else:
+            game_ids = list(self.running)
+            for start in range(0, len(game_ids), self.batch_size):
+                for game_id in game_ids[start:start + self.batch_size]:
+                    try:
+                        self.record_lateness(game_id, time.monotonic() - deadline)
+                        await self._step(game_id)
+                    except Exception as e:
+                        logger.exception(f"Game {game_id} step failed: {e}")
+                        self.stop_game(game_id)
+                # Let consumers handle input and sends between batches
+                await asyncio.sleep(0)
+
+        if self.spectator_frames:
+            frames, self.spectator_frames = self.spectator_frames, []
+            if self._spectator_task is None or self._spectator_task.done():
+                self._spectator_task = asyncio.ensure_future(self.publish_spectators(frames))
+            else:
+                self.spectator_frames_dropped += len(frames)
+
+        if profiler is not None:
+            # Includes the time other coroutines ran while the tick yielded between batches
+            profiler.record('tick', time.perf_counter() - tick_start)
+
+    async def publish_spectators(self, frames):
+        """Write the shared spectator frame of each match to all of its spectators."""
+        start = time.perf_counter()
+        for game_id, event in frames:
+            await self.send_to_spectators(game_id, list(registry.spectators.get(game_id, ())), event)
+        if self.profiler is not None:
+            self.profiler.record('spectators', time.perf_counter() - start)
+
+    async def send_to_spectators(self, game_id, spectators, event):
+        """Call the handler of ``event['type']`` of each spectator consumer, like a channel layer message would."""
+        for index, consumer in enumerate(spectators, 1):
+            try:
+                await getattr(consumer, event['type'])(event)
+            except Exception as e:
+                logger.warning(f"Game {game_id} spectator send failed: {e}")
+            if index % self.batch_size == 0:
+                await asyncio.sleep(0)
+
+    async def _step(self, game_id):
+        # No registry lock, like the vectorized path: advance never awaits, so consumers
+        # cannot change the match while it is stepped, and a removed match is not found
+        game = registry.get(game_id)
+        if not game:
+            logger.warning(f"Game {game_id} not found in scheduler")
+            self.stop_game(game_id)
+            return
+
+        if not await self.advance(game_id, game):
+            return
+        await self._publish(game_id, game)
+
+    async def advance(self, game_id, game):
+        """
+        Run one scalar physics step for a match with ``simulation.step``.
+
+        Returns False when no frame should be sent, during the serve pause.
+        """
+        self.apply_inputs(game_id, game)
+        profiler = self.profiler
+        if profiler is None:
+            result = simulation.step(game)
+        else:
+            start = time.perf_counter()
+            result = simulation.step(game)
+            profiler.record('physics', time.perf_counter() - start, game_id)
+        if result == simulation.PAUSED:
+            return False
+        if result == simulation.SCORED and not simulation.is_finished(game):
+            self.save_scores(game_id, game)
+        return True
+
+    def save_scores(self, game_id, game):
+        """Queue the intermediate score of a match for the score writer, the tick never awaits the database."""
+        game.last_scores[:] = game.scores
+        if self.profiler is None:
+            score_writer.record(game_id, game.scores)
+        else:
+            start = time.perf_counter()
+            score_writer.record(game_id, game.scores)
+            self.profiler.record('persistence', time.perf_counter() - start, game_id)
+
+    def advance_vectorized(self, game_ids):
+        """
+        Run one engine step for the given matches and write the results back to their dicts.
+
+        Returns the ``(game_id, game, was_paused)`` of every match that was stepped.
+        """
+        stepped = []
+        for game_id in game_ids:
+            game = registry.get(game_id)
+            if not game:
+                logger.warning(f"Game {game_id} not found in scheduler")
+                self.stop_game(game_id)
+                continue
+            self.apply_inputs(game_id, game)
+            if game_id in self.engine:
+                self.engine.load(game_id, game)
+            else:
+                self.engine.add(game_id, game)
+            game.ticks += 1
+            stepped.append((game_id, game, game.serve_delay > 0))
+
+        profiler = self.profiler
+        if profiler is None:
+            scored = set(self.engine.step(registry.games))
+        else:
+            start = time.perf_counter()
+            scored = set(self.engine.step(registry.games))
+            profiler.record('physics', time.perf_counter() - start)
+        for game_id, game, _ in stepped:
+            self.engine.store(game_id, game)
+            if game_id in scored and not simulation.is_finished(game):
+                self.save_scores(game_id, game)
+        return stepped
+
+    async def _tick_vectorized(self, deadline):
+        lateness = time.monotonic() - deadline
+        stepped = self.advance_vectorized(list(self.running))
+        for index, (game_id, game, was_paused) in enumerate(stepped, 1):
+            self.record_lateness(game_id, lateness)
+            if not was_paused:
+                try:
+                    await self._publish(game_id, game)
+                except Exception as e:
+                    logger.exception(f"Game {game_id} publish failed: {e}")
+                    self.stop_game(game_id)
+            if index % self.batch_size == 0:
+                await asyncio.sleep(0)
+
+    async def _publish(self, game_id, game):
+        """Finish the match if someone reached 7, otherwise broadcast the new frame when one is due."""
+        # Set winner only when score reaches 7
+        if game.winner is None:
+            if game.scores[PLAYER1] >= simulation.WINNING_SCORE:
+                game.winner = game.players[PLAYER1]
+                game.status = 'done'
+            elif game.scores[PLAYER2] >= simulation.WINNING_SCORE:
+                game.winner = game.players[PLAYER2]
+                game.status = 'done'
+
+        if game.status == 'done':
+            self.stop_game(game_id)
+            asyncio.create_task(self.finish_game(game_id, game))
+            return
+
+        if game.ticks % self.send_intervals[game_id] == 0:
+            # Only the protocols the players negotiated, spectator frames reuse the binary one
+            protocols = registry.protocols_of(game_id)
+            watched = registry.spectators.get(game_id) and game.ticks % self.spectator_intervals[game_id] == 0
+            if watched and BINARY not in protocols:
+                protocols = (*protocols, BINARY)
+            profiler = self.profiler
+            if profiler is None:
+                event = encode_frame(game, self.encoders[game_id], protocols)
+                await get_channel_layer().group_send(f'pong_{game_id}', event)
+            else:
+                start = time.perf_counter()
+                event = encode_frame(game, self.encoders[game_id], protocols)
+                encoded = time.perf_counter()
+                await get_channel_layer().group_send(f'pong_{game_id}', event)
+                profiler.record('encode', encoded - start, game_id)
+                profiler.record('send', time.perf_counter() - encoded, game_id)
+            if watched:
+                self.spectator_frames.append((game_id, spectator_frame(event)))
+
+    async def finish_game(self, game_id, game, outcome=Outcome.COMPLETED):
+        """Report the result of a finished match to its players, queue its completion and free its state."""
+        channel_layer = get_channel_layer()
+        room_group_name = f'pong_{game_id}'
+
+        # Write any queued intermediate score first so it cannot land after the final one
+        start = time.perf_counter()
+        await score_writer.flush(game_id)
+        score_writer.discard(game_id)
+        replay = game.replay.encode(game) if game.replay is not None else None
+        try:
+            await completion_worker.enqueue(game_id, game.scores, outcome, game.winner, replay)
+        except Exception as e:
+            logger.error(f"[{game_id}] Failed to queue match completion: {e}")
+        if self.profiler is not None:
+            # Runs after stop_game, only the global histograms keep it
+            self.profiler.record('persistence', time.perf_counter() - start)
+
+        result = {
+            'type': 'game_result',
+            'game_result': game.result(),
+            'outcome': outcome
+        }
+        await channel_layer.group_send(room_group_name, result)
+        spectators = list(registry.spectators.get(game_id, ()))
+        await self.send_to_spectators(game_id, spectators, result)
+
+        async with registry.lock(game_id):
+            registry.remove(game_id)
+
+        # Disconnect all clients after showing result
+        await asyncio.sleep(2)  # Brief delay to ensure clients see the result
+        end = {
+            'type': 'game_end',
+            'message': 'Game has ended, disconnecting...'
+        }
+        await channel_layer.group_send(room_group_name, end)
+        await self.send_to_spectators(game_id, spectators, end)
+
+
+scheduler = GameScheduler()
@@ -0,0 +1,158 @@
+"""
+Game-affinity sharding of live matches over several worker processes.
+
+The registry, the scheduler and the channel layer of a match all live in the
+daphne process that hosts it, so a deployment can run ``PONG_WORKERS`` workers
+and spread the matches over them. Each match is owned by one worker, picked by
+hashing its id. Nothing has to be stored, and any worker can tell who owns a
+match.
+
+Any worker serves the HTTP API and the friendship sockets, their notifications
+go through the shared channel layer of ``backend.layers``. A worker creating a
+match owned by another worker forwards the creation to it over that worker's
+Unix socket (``PONG_WORKER_SOCKET``). Players open their match socket
+at ``ws_path``, which nginx routes to the owner's port. A worker rejects the
+match sockets of the matches it does not own.
+"""
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import socket
+import zlib
+from urllib.parse import quote
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .registry import registry
+from .state import PADDLES
+
+logger = logging.getLogger(__name__)
+
+FORWARD_TIMEOUT = 5 # seconds to wait for another worker to create a match
+WORKER_TOKEN_HEADER = 'X-Pong-Worker-Token'
+
+
+def workers():
+    return max(1, getattr(settings, 'PONG_WORKERS', 1))
+
+
+def worker_id():
+    return getattr(settings, 'PONG_WORKER_ID', 0)
+
+
+def owner_of(game_id, count=None):
+    """Index of the worker hosting the match ``game_id``, out of ``count`` workers (``PONG_WORKERS`` by default)."""
+    count = count or workers()
+    if count == 1:
+        return 0
+    return zlib.crc32(str(game_id).encode()) % count
+
+
+def is_local(game_id):
+    return owner_of(game_id) == worker_id()
+
+
+def ws_path(game_id):
+    """Path of the match socket of ``game_id``, on the worker that owns it."""
+    if workers() == 1:
+        return f'/ws/pong/{game_id}/'
+    return settings.PONG_WORKER_WS_PATH.format(worker=owner_of(game_id)) + f'pong/{game_id}/'
+
+
+def worker_token():
+    """Shared secret of the workers of a deployment, sent with their requests to each other."""
+    return hmac.new(settings.SECRET_KEY.encode(), b'pong-worker', hashlib.sha256).hexdigest()
+
+
+def check_worker_token(token):
+    return hmac.compare_digest(token or '', worker_token())
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection to a server listening on the Unix socket ``path``."""
+
+    def __init__(self, path, timeout=FORWARD_TIMEOUT):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def request(worker, method, path, body=None):
+    """Send a request to the worker ``worker`` and return its decoded JSON reply."""
+    connection = UnixHTTPConnection(settings.PONG_WORKER_SOCKET.format(worker=worker))
+    headers = {WORKER_TOKEN_HEADER: worker_token()}
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    try:
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        data = json.loads(response.read() or b'{}')
+    finally:
+        connection.close()
+    # A redirect is a failure too, its empty body would otherwise read as an empty answer
+    if not 200 <= response.status < 300:
+        raise RuntimeError(f"Worker {worker} answered {response.status}: {data.get('error')}")
+    return data
+
+
+def host_game(game_id, player_1, player_2=None, game_opponent='local', ai_level=None, online=False):
+    """
+    Register the match ``game_id`` with this worker's registry and return it.
+
+    ``online`` marks both paddles online at once, for matches played from one browser.
+    """
+    game = registry.create(game_id, player_1, player_2, game_opponent, ai_level=ai_level)
+    if online:
+        for paddle in PADDLES:
+            game.online[paddle] = True
+    return game
+
+
+def create_game(game_id, player_1, player_2=None, game_opponent='local', ai_level=None, online=False):
+    """Create the live match ``game_id`` on the worker that owns it and return that worker's index."""
+    owner = owner_of(game_id)
+    if owner == worker_id():
+        host_game(game_id, player_1, player_2, game_opponent, ai_level, online)
+        return owner
+
+    logger.debug(f"[{game_id}] Creating the match on worker {owner}")
+    request(owner, 'POST', '/worker_game/', {
+        'game_id': game_id,
+        'player_1': player_1,
+        'player_2': player_2,
+        'game_opponent': game_opponent,
+        'ai_level': ai_level,
+        'online': online,
+    })
+    return owner
+
+
+async def acreate_game(game_id, player_1, player_2=None, game_opponent='local', ai_level=None, online=False):
+    """``create_game`` for consumers, the request to another worker runs in a thread."""
+    if is_local(game_id):
+        async with registry.lock(game_id):
+            host_game(game_id, player_1, player_2, game_opponent, ai_level, online)
+        return worker_id()
+    return await sync_to_async(create_game, thread_sensitive=False)(
+        game_id, player_1, player_2, game_opponent, ai_level, online)
+
+
+def find_game(user_name):
+    """What the other workers answer about the live match of ``user_name``, None when none of them hosts one."""
+    for worker in range(workers()):
+        if worker == worker_id():
+            continue
+        try:
+            return request(worker, 'GET', f'/worker_game/?user_name={quote(user_name)}')
+        except RuntimeError:
+            continue
+        except (OSError, ValueError) as e:
+            logger.warning(f"Worker {worker} did not answer for the live match of {user_name}: {e}")
+    return None
@@ -0,0 +1,191 @@
+"""
+Deterministic Pong simulation core.
+
+Everything here is plain synchronous Python on a ``GameState``: no Django, no
+channel layer, no event loop. Given a seed and an input log, ``run`` produces the
+same frames every time, which is what the live scheduler, load tests, replays and
+result verification all build on.
+
+An input log is a sequence of ``(tick, paddle, direction, pressed)`` tuples. An
+input is applied at the start of ``tick`` (the first tick is 1), like the inputs a
+consumer queues between two live ticks.
+"""
+from .state import (
+    GameState, PADDLES, PLAYER1, PLAYER2, UP, DOWN, BASE_TICK_RATE, SERVE_SPEED_Y, PADDLE_SPIN,
+)
+
+WINNING_SCORE = 7
+
+# Result of one step
+PAUSED = 0 # serve pause after a goal, nothing moved
+MOVED = 1
+SCORED = 2 # someone scored, the match may be finished
+
+
+def new_match(seed, tick_rate=BASE_TICK_RATE, players=('player1', 'player2'), game_opponent='online'):
+    """A match with both players online, ready to be stepped."""
+    game = GameState(players[PLAYER1], players[PLAYER2], game_opponent, seed=seed, tick_rate=tick_rate)
+    game.online = [True, True]
+    return game
+
+
+def is_finished(game):
+    return game.scores[PLAYER1] >= WINNING_SCORE or game.scores[PLAYER2] >= WINNING_SCORE
+
+
+def reset(game):
+    """Put the ball and paddles back in the middle and draw the next serve."""
+    game.ball_x = 0.5
+    game.ball_y = 0.5
+    game.ball_speed_x, game.ball_speed_y = game.serve_speed()
+    game.paddle_y[PLAYER1] = 0.5
+    game.paddle_y[PLAYER2] = 0.5
+
+
+def step(game):
+    """Advance a match by one tick and return PAUSED, MOVED or SCORED."""
+    game.ticks += 1
+
+    # A finished match stands still until it is stopped, it cannot score again
+    if is_finished(game):
+        return PAUSED
+
+    # Serve pause after a goal
+    if game.serve_delay > 0:
+        game.serve_delay -= 1
+        return PAUSED
+
+    # Paddle movement for online players
+    paddle_y = game.paddle_y
+    for paddle in PADDLES:
+        if game.online[paddle]:
+            if game.moving[paddle] == UP:
+                paddle_y[paddle] = max(0 + game.paddle_bounds_y, paddle_y[paddle] - game.paddle_speed)
+            elif game.moving[paddle] == DOWN:
+                paddle_y[paddle] = min(1 - game.paddle_bounds_y, paddle_y[paddle] + game.paddle_speed)
+
+    paddle_x = game.paddle_x
+    bounds_x, bounds_y = game.paddle_bounds_x, game.paddle_bounds_y
+
+    # Update ball position
+    game.ball_x += game.ball_speed_x
+    game.ball_y += game.ball_speed_y
+
+    # Scoring
+    scorer = None
+    if game.ball_x < paddle_x[PLAYER1] - bounds_x:
+        scorer = PLAYER2
+    elif game.ball_x > paddle_x[PLAYER2] + bounds_x:
+        scorer = PLAYER1
+    if scorer is not None:
+        game.scores[scorer] += 1
+        reset(game)
+        if not is_finished(game):
+            game.serve_delay = game.serve_ticks # Brief pause for intermediate scores
+        return SCORED
+
+    # Wall collision
+    if game.ball_y < game.ball_bounds:
+        game.ball_y = game.ball_bounds
+        game.ball_speed_y = -abs(game.ball_speed_y) if game.ball_speed_y > 0 else SERVE_SPEED_Y * game.tick_scale
+        return MOVED
+    elif game.ball_y > 1 - game.ball_bounds:
+        game.ball_y = 1 - game.ball_bounds
+        game.ball_speed_y = -abs(game.ball_speed_y) if game.ball_speed_y < 0 else -SERVE_SPEED_Y * game.tick_scale
+        return MOVED
+
+    # Paddle collision
+    if (game.ball_x >= paddle_x[PLAYER1] and
+        game.ball_x < paddle_x[PLAYER1] + bounds_x and
+        paddle_y[PLAYER1] - bounds_y < game.ball_y < paddle_y[PLAYER1] + bounds_y):
+        game.ball_speed_x = -game.ball_speed_x
+        game.ball_speed_y = (game.ball_y - paddle_y[PLAYER1]) * PADDLE_SPIN * game.tick_scale
+    elif (game.ball_x <= paddle_x[PLAYER2] and
+          game.ball_x > paddle_x[PLAYER2] - bounds_x and
+          paddle_y[PLAYER2] - bounds_y < game.ball_y < paddle_y[PLAYER2] + bounds_y):
+        game.ball_speed_x = -game.ball_speed_x
+        game.ball_speed_y = (game.ball_y - paddle_y[PLAYER2]) * PADDLE_SPIN * game.tick_scale
+
+    return MOVED
+
+
+def apply_input(game, paddle, direction, pressed):
+    if pressed:
+        game.press(paddle, direction)
+    else:
+        game.release(paddle, direction)
+
+
+def run(game, inputs=(), max_ticks=None, on_frame=None):
+    """
+    Step a match until it is finished, or for ``max_ticks`` ticks, and return it.
+
+    ``inputs`` must be ordered by tick. ``on_frame(game)`` is called after every
+    tick that was not a serve pause, where the live server would send a frame.
+    """
+    inputs = iter(inputs)
+    pending = next(inputs, None)
+    while not is_finished(game) and (max_ticks is None or game.ticks < max_ticks):
+        tick = game.ticks + 1
+        while pending is not None and pending[0] <= tick:
+            apply_input(game, *pending[1:])
+            pending = next(inputs, None)
+        if step(game) != PAUSED and on_frame is not None:
+            on_frame(game)
+    return game
+
+
+def run_many(seeds, max_ticks, inputs=None, engine=None):
+    """
+    Simulate one match per seed for up to ``max_ticks`` ticks and return them by seed.
+
+    ``inputs`` optionally maps a seed to its input log. With a ``VectorEngine`` all
+    matches are stepped together and only copied back to their ``GameState`` when
+    they finish, which is how thousands of matches per second are simulated
+    offline. Both paths give the same results.
+    """
+    games = {seed: new_match(seed) for seed in seeds}
+    due = {}
+    for seed, log in (inputs or {}).items():
+        for tick, *event in log:
+            due.setdefault(tick, []).append((seed, event))
+    live = set(games)
+    tick = 0
+    if engine is not None:
+        for seed, game in games.items():
+            engine.add(seed, game)
+
+    for tick in range(1, max_ticks + 1):
+        for seed, event in due.pop(tick, ()):
+            if seed in live:
+                apply_input(games[seed], *event)
+                if engine is not None:
+                    engine.load(seed, games[seed])
+
+        if engine is None:
+            finished = []
+            for seed in live:
+                step(games[seed])
+                if is_finished(games[seed]):
+                    finished.append(seed)
+        else:
+            engine.step(games)
+            n = engine.size
+            rows = (engine.score1[:n] >= WINNING_SCORE) | (engine.score2[:n] >= WINNING_SCORE)
+            finished = [engine.game_ids[row] for row in rows.nonzero()[0]]
+
+        for seed in finished:
+            live.discard(seed)
+            if engine is not None:
+                engine.store(seed, games[seed])
+                engine.remove(seed)
+                games[seed].ticks = tick
+        if not live:
+            break
+
+    if engine is not None:
+        for seed in live:
+            engine.store(seed, games[seed])
+            engine.remove(seed)
+            games[seed].ticks = tick
+    return games
@@ -0,0 +1,218 @@
+import time
+from collections import deque
+from datetime import datetime
+from .rng import Mulberry32
+
+# Paddle indexes, player 1 owns the left paddle
+PLAYER1 = 0
+PLAYER2 = 1
+PADDLES = (PLAYER1, PLAYER2)
+PADDLE_NAMES = {'player1': PLAYER1, 'player2': PLAYER2}
+
+# Paddle directions, matching the sign of the y axis
+IDLE = 0
+UP = -1
+DOWN = 1
+
+# Client actions: (paddle direction, key pressed)
+ACTIONS = {
+    'upStart': (UP, True),
+    'upStop': (UP, False),
+    'downStart': (DOWN, True),
+    'downStop': (DOWN, False),
+    'wStart': (UP, True),
+    'wStop': (UP, False),
+    'sStart': (DOWN, True),
+    'sStop': (DOWN, False),
+}
+LOCAL_ACTIONS = ('wStart', 'wStop', 'sStart', 'sStop')
+
+# Speeds are tuned per tick at BASE_TICK_RATE and scaled for other simulation rates
+BASE_TICK_RATE = 60
+SERVE_SPEED_X = 0.011
+SERVE_SPEED_Y = 0.007
+PADDLE_SPEED = 0.02
+PADDLE_SPIN = 0.2 # ball y speed per unit of distance from the paddle center
+SERVE_DELAY = 1 # seconds of pause after a goal
+
+INPUT_QUEUE_SIZE = 64 # inputs buffered per match between two ticks, the oldest are dropped beyond
+
+
+class GameState:
+    """
+    In-memory state of one live match.
+
+    Per-paddle values are two-item lists indexed by ``PLAYER1``/``PLAYER2`` so the
+    tick never has to build keys like ``f'{player}_moving'``. The payloads sent to
+    clients are built explicitly by ``initial_state``, ``frame`` and ``result``.
+
+    ``tick_rate`` is the number of physics steps per second, per-tick speeds are
+    scaled by ``tick_scale`` so the ball covers the same distance per second at any
+    rate. ``send_rate`` overrides the deployment's ``PONG_SEND_RATE`` for this match.
+
+    Consumers never change the paddles directly: ``queue_input`` appends to the
+    bounded ``inputs`` deque and the tick applies everything queued with
+    ``drain_inputs`` before it steps. ``acks`` holds the last client sequence number
+    applied for each paddle and is echoed in every frame.
+
+    ``replay`` is the ``ReplayRecorder`` of a recorded match, or None. Inputs and
+    connection changes reach the simulation in ``drain_inputs``, so that is where
+    they are recorded.
+    """
+
+    __slots__ = (
+        'ball_x', 'ball_y', 'ball_speed_x', 'ball_speed_y', 'ball_bounds',
+        'paddle_x', 'paddle_y', 'paddle_bounds_x', 'paddle_bounds_y', 'paddle_speed',
+        'moving', 'online', 'disconnect_time', 'scores', 'last_scores', 'players',
+        'game_opponent', 'status', 'winner', 'game_running', 'serve_delay', 'rng',
+        'tick_rate', 'tick_scale', 'serve_ticks', 'send_rate', 'ticks',
+        'inputs', 'acks', 'created_at', 'replay', 'ai_level',
+    )
+
+    def __init__(self, player_1, player_2=None, game_opponent='local', seed=None, tick_rate=BASE_TICK_RATE, send_rate=None):
+        self.rng = Mulberry32(seed) # per-game serve directions, reproducible from rng.seed
+        self.tick_rate = tick_rate
+        self.tick_scale = BASE_TICK_RATE / tick_rate
+        self.serve_ticks = round(SERVE_DELAY * tick_rate)
+        self.send_rate = send_rate # frames per second sent to clients, None for the deployment default
+        self.ticks = 0 # physics steps run so far, the match clock
+        self.ball_x = 0.5
+        self.ball_y = 0.5
+        self.ball_speed_x, self.ball_speed_y = self.serve_speed()
+        self.ball_bounds = 0.01
+        self.paddle_x = [0.02, 0.98]
+        self.paddle_y = [0.5, 0.5]
+        self.paddle_bounds_x = 0.02
+        self.paddle_bounds_y = 0.1
+        self.paddle_speed = PADDLE_SPEED * self.tick_scale
+        self.moving = [IDLE, IDLE] # UP, DOWN or IDLE
+        self.inputs = deque(maxlen=INPUT_QUEUE_SIZE) # (paddle, direction, pressed, seq, receive time)
+        self.acks = [0, 0] # last input sequence number applied per paddle
+        self.online = [False, game_opponent == 'ai'] # the bot on the right paddle never leaves
+        self.disconnect_time = [None, None] # datetime of the last disconnect
+        self.created_at = datetime.utcnow()
+        self.scores = [0, 0]
+        self.last_scores = [0, 0] # last scores saved to the database
+        self.players = (player_1, player_2) # user names
+        self.game_opponent = game_opponent # local, online, ai
+        self.status = 'Playing' # Playing, done
+        self.winner = None # user name of the winner
+        self.game_running = False
+        self.serve_delay = 0 # ticks left before play resumes after a goal
+        self.replay = None
+        self.ai_level = None # difficulty of the bot of an ai match
+
+    def paddle_of(self, user_name):
+        """Return the paddle index controlled by a user, or None if they are not playing."""
+        if user_name == self.players[PLAYER1]:
+            return PLAYER1
+        if user_name == self.players[PLAYER2]:
+            return PLAYER2
+        return None
+
+    def connected(self):
+        """Whether any player is connected, a local or ai match has a single client."""
+        if self.game_opponent in ('local', 'ai'):
+            return self.online[PLAYER1]
+        return self.online[PLAYER1] or self.online[PLAYER2]
+
+    def serve_speed(self):
+        """Draw the ball speed of a new serve from the match RNG."""
+        return (self.rng.choice([-SERVE_SPEED_X, SERVE_SPEED_X]) * self.tick_scale,
+                self.rng.choice([-SERVE_SPEED_Y, SERVE_SPEED_Y]) * self.tick_scale)
+
+    def time(self):
+        """Milliseconds of match time simulated so far."""
+        return self.ticks * 1000 // self.tick_rate
+
+    def queue_input(self, paddle, direction, pressed, seq=None):
+        self.inputs.append((paddle, direction, pressed, seq, time.monotonic()))
+
+    def drain_inputs(self):
+        """Apply every queued input in arrival order, return the receive time of the oldest one or None."""
+        replay = self.replay
+        if replay is not None and self.online != replay.online:
+            replay.record_online(self.ticks + 1, self.online)
+        if not self.inputs:
+            return None
+        oldest = self.inputs[0][4]
+        while self.inputs:
+            paddle, direction, pressed, seq, _ = self.inputs.popleft()
+            if replay is not None:
+                replay.record_input(self.ticks + 1, paddle, direction, pressed)
+            if pressed:
+                self.press(paddle, direction)
+            else:
+                self.release(paddle, direction)
+            if seq is not None:
+                self.acks[paddle] = seq
+        return oldest
+
+    def press(self, paddle, direction):
+        self.moving[paddle] = direction
+
+    def release(self, paddle, direction):
+        # Releasing a key only stops the paddle if it still moves that way
+        if self.moving[paddle] == direction:
+            self.moving[paddle] = IDLE
+
+    def result_text(self):
+        return f"{self.players[PLAYER1]}: {self.scores[PLAYER1]} - {self.scores[PLAYER2]} :{self.players[PLAYER2]}"
+
+    def initial_state(self):
+        return {
+            'type': 'initial_state',
+            'paddle1_x': self.paddle_x[PLAYER1],
+            'paddle2_x': self.paddle_x[PLAYER2],
+            'paddle1_y': self.paddle_y[PLAYER1],
+            'paddle2_y': self.paddle_y[PLAYER2],
+            'ball_x': self.ball_x,
+            'ball_y': self.ball_y,
+            'score1': self.scores[PLAYER1],
+            'score2': self.scores[PLAYER2],
+            'ball_bounds': self.ball_bounds,
+            'paddle_bounds_x': self.paddle_bounds_x,
+            'paddle_bounds_y': self.paddle_bounds_y,
+            'game_opponent': self.game_opponent,
+            'ai_level': self.ai_level,
+            'player_1': self.players[PLAYER1],
+            'player_2': self.players[PLAYER2]
+        }
+
+    def frame(self):
+        return {
+            'type': 'game_state',
+            'ball_x': self.ball_x,
+            'ball_y': self.ball_y,
+            'paddle1_y': self.paddle_y[PLAYER1],
+            'paddle2_y': self.paddle_y[PLAYER2],
+            'score1': self.scores[PLAYER1],
+            'score2': self.scores[PLAYER2],
+            'paddle1_x': self.paddle_x[PLAYER1],
+            'paddle2_x': self.paddle_x[PLAYER2],
+            'ball_bounds': self.ball_bounds,
+            'paddle_bounds_x': self.paddle_bounds_x,
+            'paddle_bounds_y': self.paddle_bounds_y,
+            'game_opponent': self.game_opponent,
+            'status': self.status,
+            'time': self.time(),
+            'ack1': self.acks[PLAYER1],
+            'ack2': self.acks[PLAYER2],
+            'player_1': self.players[PLAYER1],
+            'player_2': self.players[PLAYER2]
+        }
+
+    def result(self):
+        return {
+            'type': 'game_result',
+            'result': self.result_text(),
+            'winner': self.winner or 'Unknown',
+            'status': 'done'
+        }
+
+    def to_dict(self):
+        """Every field as a plain dict, for logs and debugging."""
+        return {field: getattr(self, field) for field in self.__slots__ if field not in ('rng', 'inputs', 'replay')}
+
+    def __repr__(self):
+        return f"<GameState {self.players[PLAYER1]} vs {self.players[PLAYER2]} {self.scores[PLAYER1]}-{self.scores[PLAYER2]} {self.status}>"
@@ -0,0 +1,244 @@
+import time
+from bisect import bisect_left
+from collections import deque
+
+# Upper bounds, in milliseconds, of the tick lateness histogram buckets
+LATENESS_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class TickStats:
+    """
+    How late the game loop ran the ticks of a match, or of the whole scheduler.
+
+    A tick is late by the time between its deadline and the moment it was stepped.
+    ``skipped`` counts ticks dropped because the loop was too far behind to catch up.
+    A growing tail in the histogram or any skipped tick means the worker is overloaded.
+    ``max_input_delay`` is the longest time an input waited in the queue for its tick.
+    """
+
+    __slots__ = ('ticks', 'skipped', 'histogram', 'max_lateness', 'max_input_delay')
+
+    def __init__(self):
+        self.ticks = 0
+        self.skipped = 0
+        self.histogram = [0] * (len(LATENESS_BUCKETS_MS) + 1) # the last bucket has no upper bound
+        self.max_lateness = 0.0
+        self.max_input_delay = 0.0
+
+    def record(self, lateness):
+        """Count one tick stepped ``lateness`` seconds after its deadline."""
+        lateness_ms = max(lateness, 0.0) * 1000
+        self.ticks += 1
+        self.histogram[bisect_left(LATENESS_BUCKETS_MS, lateness_ms)] += 1
+        if lateness_ms > self.max_lateness:
+            self.max_lateness = lateness_ms
+
+    def record_input_delay(self, delay):
+        delay_ms = delay * 1000
+        if delay_ms > self.max_input_delay:
+            self.max_input_delay = delay_ms
+
+    def summary(self):
+        buckets = [f'<={bound}ms' for bound in LATENESS_BUCKETS_MS] + [f'>{LATENESS_BUCKETS_MS[-1]}ms']
+        return {
+            'ticks': self.ticks,
+            'skipped': self.skipped,
+            'max_lateness_ms': round(self.max_lateness, 2),
+            'max_input_delay_ms': round(self.max_input_delay, 2),
+            'lateness': dict(zip(buckets, self.histogram)),
+        }
+
+    def __repr__(self):
+        return f"<TickStats {self.summary()}>"
+
+
+# Upper bounds of the buckets of the unacknowledged frames histogram
+DEPTH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class FlowStats:
+    """
+    How far behind the players' sockets are, see ``PongConsumer.game_state``.
+
+    The depth of a socket is the number of frames sent to it that its client has
+    not acknowledged yet, recorded each time a frame is sent. A socket whose depth
+    reached the window holds back its frames. ``conflated`` counts the frames
+    replaced by a newer one before they were sent, and ``released`` the held
+    frames sent once the client caught up.
+    """
+
+    __slots__ = ('sent', 'conflated', 'released', 'histogram', 'max_depth')
+
+    def __init__(self):
+        self.sent = 0
+        self.conflated = 0
+        self.released = 0
+        self.histogram = [0] * (len(DEPTH_BUCKETS) + 1)
+        self.max_depth = 0
+
+    def record(self, depth):
+        """Count one frame sent to a socket with ``depth`` frames unacknowledged."""
+        self.sent += 1
+        self.histogram[bisect_left(DEPTH_BUCKETS, depth)] += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def summary(self):
+        buckets = [f'<={bound}' for bound in DEPTH_BUCKETS] + [f'>{DEPTH_BUCKETS[-1]}']
+        return {
+            'sent': self.sent,
+            'conflated': self.conflated,
+            'released': self.released,
+            'max_depth': self.max_depth,
+            'depth': dict(zip(buckets, self.histogram)),
+        }
+
+    def __repr__(self):
+        return f"<FlowStats {self.summary()}>"
+
+
+# Phases of a scheduler tick timed by TickProfiler
+PHASES = (
+    'tick', # a whole tick, every match included
+    'bots', # BotController.decide for all ai matches
+    'inputs', # applying the queued paddle inputs of a match
+    'physics', # simulation.step of a match, or one VectorEngine.step for all of them
+    'persistence', # queueing scores, flushing them and queueing the completion of a finished match
+    'encode', # encode_frame of a match
+    'send', # group_send of a match frame to its players
+    'spectators', # writing the spectator frames of a tick
+)
+# Upper bounds, in microseconds, of the phase histogram buckets
+PHASE_BUCKETS_US = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+
+class PhaseHistogram:
+    """Durations of one phase: a bucket histogram, a count, a total and the maximum, in microseconds."""
+
+    __slots__ = ('count', 'total', 'max', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(PHASE_BUCKETS_US) + 1)
+
+    def record(self, duration_us):
+        self.count += 1
+        self.total += duration_us
+        self.histogram[bisect_left(PHASE_BUCKETS_US, duration_us)] += 1
+        if duration_us > self.max:
+            self.max = duration_us
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        for index, count in enumerate(other.histogram):
+            self.histogram[index] += count
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the ``fraction`` percentile, the maximum for the last bucket."""
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank and count:
+                return PHASE_BUCKETS_US[index] if index < len(PHASE_BUCKETS_US) else self.max
+        return 0.0
+
+    def summary(self):
+        buckets = [f'<={bound}us' for bound in PHASE_BUCKETS_US] + [f'>{PHASE_BUCKETS_US[-1]}us']
+        return {
+            'count': self.count,
+            'mean_us': round(self.total / self.count, 2) if self.count else 0.0,
+            'p50_us': self.percentile(0.5),
+            'p99_us': self.percentile(0.99),
+            'max_us': round(self.max, 2),
+            'total_ms': round(self.total / 1000, 2),
+            'histogram': {bucket: count for bucket, count in zip(buckets, self.histogram) if count},
+        }
+
+
+class RollingPhases:
+    """Phase histograms of the last ``windows`` time windows, the oldest window is dropped on rotation."""
+
+    __slots__ = ('current', 'previous')
+
+    def __init__(self, windows):
+        self.current = {}
+        self.previous = deque(maxlen=windows - 1)
+
+    def record(self, phase, duration_us):
+        histogram = self.current.get(phase)
+        if histogram is None:
+            histogram = self.current[phase] = PhaseHistogram()
+        histogram.record(duration_us)
+
+    def rotate(self):
+        self.previous.append(self.current)
+        self.current = {}
+
+    def summary(self):
+        merged = {}
+        for window in (*self.previous, self.current):
+            for phase, histogram in window.items():
+                merged.setdefault(phase, PhaseHistogram()).merge(histogram)
+        return {phase: merged[phase].summary() for phase in PHASES if phase in merged}
+
+
+class TickProfiler:
+    """
+    Where the scheduler's ticks spend their time, phase by phase.
+
+    The scheduler calls ``record`` with the duration of each phase of ``PHASES``,
+    and the id of the match for per-match phases. Durations go to a global set of
+    histograms and to one per match. Both cover the last ``windows`` windows of
+    ``window`` seconds, so a summary shows the recent behaviour and not the whole uptime.
+
+    The scheduler only takes timestamps while a profiler is set, with none the
+    hooks cost one ``is None`` check per phase.
+    """
+
+    def __init__(self, window=10.0, windows=6):
+        self.window = window
+        self.windows = max(windows, 1)
+        self.started_at = time.time()
+        self.window_end = time.monotonic() + window
+        self.total = RollingPhases(self.windows)
+        self.games = {}
+
+    def record(self, phase, duration, game_id=None):
+        """Count ``duration`` seconds spent in ``phase``, for match ``game_id`` if given."""
+        duration_us = duration * 1e6
+        self.total.record(phase, duration_us)
+        if game_id is not None:
+            phases = self.games.get(game_id)
+            if phases is None:
+                phases = self.games[game_id] = RollingPhases(self.windows)
+            phases.record(phase, duration_us)
+
+    def rotate(self, now=None):
+        """Start a new window when the current one is over, called once per tick."""
+        now = time.monotonic() if now is None else now
+        if now < self.window_end:
+            return
+        self.window_end = now + self.window
+        self.total.rotate()
+        for phases in self.games.values():
+            phases.rotate()
+
+    def drop(self, game_id):
+        self.games.pop(game_id, None)
+
+    def summary(self, game_id=None):
+        if game_id is not None:
+            phases = self.games.get(game_id)
+            return phases.summary() if phases is not None else None
+        return {
+            'window_s': self.window,
+            'windows': self.windows,
+            'started_at': self.started_at,
+            'games': len(self.games),
+            'phases': self.total.summary(),
+        }
@@ -1,3 +1,968 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock, skipIf
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils import timezone
+from channels.exceptions import ChannelFull
+from authentication.consumers import FriendshipConsumer
+from backend.layers import PeerChannelLayer
+
+from . import benchmarks, completion, loadtest, sharding, simulation, views
+from .ai import BotController
+from .consumers import PongConsumer
+from .heartbeat import CLOSE_CODE, Heartbeat
+from .engine import np, VectorEngine
+from .protocol import (
+    BINARY, DELTA, JSON, FRAME_STRUCT, INPUT_STRUCT, STATUS_PLAYER1_ONLINE, DeltaEncoder, FRAME_FIELDS,
+    decode_input, encode_frame,
+)
+from .models import Match
+from .persistence import ScoreWriter
+from .reaper import GameReaper
+from .registry import GameRegistry, new_game, registry
+from .replay import Replay, ReplayRecorder
+from .scheduler import GameScheduler
+from .stats import FlowStats, TickProfiler, TickStats
+from .verification import client_seed, verify_client_replay
+from .state import GameState, PADDLES, PLAYER1, PLAYER2, UP, DOWN, IDLE
+
+
+def new_games(count, seed):
+    games = {}
+    for i in range(count):
+        game = new_game('alice', 'bob', 'online', seed=seed + i)
+        game.online = [True, True]
+        games[str(i)] = game
+    return games
+
+
+def press_random_keys(games, rng):
+    for game in games.values():
+        for paddle in PADDLES:
+            if rng.random() < 0.1:
+                game.moving[paddle] = rng.choice([UP, DOWN, IDLE])
+
+
+def snapshot(game):
+    return (game.ball_x, game.ball_y, game.ball_speed_x, game.ball_speed_y,
+            tuple(game.paddle_y), tuple(game.scores), game.serve_delay, game.ticks)
+
+
+@skipIf(np is None, "numpy is not installed")
+@mock.patch('gameBackend.scheduler.score_writer')
+class VectorEngineTests(SimpleTestCase):
+    async def test_matches_scalar_engine(self, score_writer):
+        scalar_games = new_games(25, seed=1)
+        vector_games = new_games(25, seed=1)
+        scalar = GameScheduler()
+        vector = GameScheduler(engine=VectorEngine(capacity=4))
+        scalar_inputs, vector_inputs = random.Random(7), random.Random(7)
+
+        for _ in range(3000):
+            press_random_keys(scalar_games, scalar_inputs)
+            press_random_keys(vector_games, vector_inputs)
+            with mock.patch.dict(registry.games, scalar_games, clear=True):
+                for game_id, game in scalar_games.items():
+                    await scalar.advance(game_id, game)
+            with mock.patch.dict(registry.games, vector_games, clear=True):
+                vector.advance_vectorized(list(vector_games))
+
+        for game_id, game in scalar_games.items():
+            self.assertEqual(snapshot(game), snapshot(vector_games[game_id]), f"game {game_id}")
+        self.assertTrue(any(sum(game.scores) for game in scalar_games.values()))
+
+    def test_remove_keeps_other_rows(self, score_writer):
+        games = new_games(3, seed=5)
+        engine = VectorEngine(capacity=2)
+        for game_id, game in games.items():
+            engine.add(game_id, game)
+        games['2'].ball_x = 0.25
+        engine.remove('0')
+        engine.store('2', games['2'])
+        self.assertNotIn('0', engine)
+        self.assertEqual(engine.size, 2)
+        self.assertEqual(games['2'].ball_x, 0.5)
+
+
+class DeltaEncoderTests(SimpleTestCase):
+    def test_only_changed_fields_between_keyframes(self):
+        game = new_game('alice', 'bob', 'online', seed=3)
+        encoder = DeltaEncoder(keyframe_interval=3)
+
+        first = encoder.encode(game)
+        self.assertEqual(first['type'], 'keyframe')
+        self.assertEqual(set(first), {'type', 'frame', *FRAME_FIELDS})
+
+        game.ball_x += 0.01
+        self.assertEqual(encoder.encode(game), {'type': 'delta', 'frame': 2, 'ball_x': game.ball_x})
+        self.assertEqual(encoder.encode(game)['type'], 'keyframe')
+
+    def test_encode_frame_is_pre_encoded(self):
+        game = new_game('alice', 'bob', 'online', seed=3)
+        event = encode_frame(game, DeltaEncoder())
+        game.ball_x = 0.9
+
+        self.assertEqual(json.loads(event[JSON])['ball_x'], 0.5)
+        self.assertEqual(json.loads(event[DELTA])['type'], 'keyframe')
+        self.assertIsInstance(event['values'], tuple)
+
+    def test_binary_frame_and_input(self):
+        game = new_game('alice', 'bob', 'online', seed=3)
+        game.online = [True, False]
+        game.scores = [4, 2]
+        event = encode_frame(game, DeltaEncoder())
+
+        message, frame, _, ball_x, _, _, _, score1, score2, status, _, _ = FRAME_STRUCT.unpack(event[BINARY])
+        self.assertEqual((message, frame, ball_x, score1, score2, status), (1, 1, 0.5, 4, 2, STATUS_PLAYER1_ONLINE))
+        self.assertEqual(decode_input(INPUT_STRUCT.pack(5, 1, 9)), ('wStop', 'player1', 9))
+        self.assertEqual(decode_input(INPUT_STRUCT.pack(8, 0, 42)), ('ack', None, 42))
+        with self.assertRaises(ValueError):
+            decode_input(INPUT_STRUCT.pack(9, 0, 0))
+
+
+@mock.patch('gameBackend.scheduler.score_writer')
+class TickRateTests(SimpleTestCase):
+    async def test_ball_speed_does_not_depend_on_tick_rate(self, score_writer):
+        scheduler = GameScheduler()
+        positions = []
+        for tick_rate in (60, 120):
+            game = GameState('alice', 'bob', 'online', seed=2, tick_rate=tick_rate)
+            with mock.patch.dict(registry.games, {'0': game}, clear=True):
+                for _ in range(tick_rate // 2):
+                    await scheduler.advance('0', game)
+            positions.append((game.ball_x, game.ball_y, game.time()))
+        for actual, expected in zip(positions[1], positions[0]):
+            self.assertAlmostEqual(actual, expected)
+
+    def test_send_interval(self, score_writer):
+        scheduler = GameScheduler(send_rate=30)
+        self.assertEqual(scheduler.send_interval(GameState('alice', tick_rate=120)), 4)
+        self.assertEqual(scheduler.send_interval(GameState('alice', tick_rate=120, send_rate=60)), 2)
+        self.assertEqual(scheduler.send_interval(GameState('alice', tick_rate=20)), 1)
+
+    def test_spectator_interval_reuses_player_frames(self, score_writer):
+        scheduler = GameScheduler(spectator_rate=20)
+        self.assertEqual(scheduler.spectator_interval(GameState('alice', tick_rate=60), 1), 3)
+        self.assertEqual(scheduler.spectator_interval(GameState('alice', tick_rate=120), 4), 8)
+        self.assertEqual(scheduler.spectator_interval(GameState('alice', tick_rate=20), 1), 1)
+
+
+class SpectatorTests(SimpleTestCase):
+    async def test_spectators_share_one_frame_off_the_channel_layer(self):
+        game = new_game('alice', 'bob', 'online', seed=1)
+        game.online = [True, True]
+        spectators = [mock.Mock(spectator_state=mock.AsyncMock()) for _ in range(3)]
+        scheduler = GameScheduler(spectator_rate=20)
+        scheduler.running.add('1')
+        scheduler.encoders['1'] = DeltaEncoder()
+        scheduler.send_intervals['1'] = 1
+        scheduler.spectator_intervals['1'] = 3
+        channel_layer = mock.Mock(group_send=mock.AsyncMock())
+        with mock.patch.dict(registry.games, {'1': game}, clear=True), \
+                mock.patch.dict(registry.spectators, {'1': set(spectators)}, clear=True), \
+                mock.patch.dict(registry.protocols, {'1': {DELTA: 2}}, clear=True), \
+                mock.patch('gameBackend.scheduler.get_channel_layer', return_value=channel_layer), \
+                mock.patch('gameBackend.scheduler.score_writer'):
+            for _ in range(6):
+                await scheduler.tick()
+            await scheduler._spectator_task
+
+        # Only the players' protocol is encoded, and the binary frame on spectator ticks
+        sent = [call.args[1] for call in channel_layer.group_send.await_args_list]
+        self.assertEqual([sorted(event.keys() & {JSON, DELTA, BINARY}) for event in sent[:3]],
+                         [[DELTA], [DELTA], [BINARY, DELTA]])
+        self.assertEqual(len(sent), 6)
+        events = [call.args[0] for call in spectators[0].spectator_state.await_args_list]
+        self.assertEqual(len(events), 2)
+        self.assertEqual(json.loads(events[-1][JSON])['type'], 'keyframe')
+        for spectator in spectators[1:]:
+            self.assertIs(spectator.spectator_state.await_args.args[0], events[-1])
+
+
+class FlowControlTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('gameBackend.consumers.scheduler', flow=FlowStats())
+        self.scheduler = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def consumer(self, protocol=DELTA, window=4):
+        consumer = PongConsumer()
+        consumer.protocol = protocol
+        consumer.needs_keyframe = True
+        consumer.frame_window = window
+        consumer.sent_frame = consumer.acked_frame = consumer.held_frame = None
+        consumer.channel_layer = mock.Mock(channels={})
+        consumer.channel_name = 'specific.test'
+        consumer.send = mock.AsyncMock()
+        consumer.close = mock.AsyncMock()
+        return consumer
+
+    def frames(self, count):
+        game = new_game('alice', 'bob', 'online', seed=1)
+        encoder = DeltaEncoder()
+        return [encode_frame(game, encoder) for _ in range(count)]
+
+    def sent(self, consumer):
+        return [json.loads(call.kwargs['text_data']) for call in consumer.send.await_args_list]
+
+    async def test_frames_past_the_window_are_conflated(self):
+        consumer = self.consumer()
+        frames = self.frames(12)
+        await consumer.game_state(frames[0])
+        await consumer.acknowledge(1)
+        for event in frames[1:]:
+            await consumer.game_state(event)
+
+        # Frames 2 to 5 fit the window, 6 to 11 were replaced by 12
+        self.assertEqual([message['frame'] for message in self.sent(consumer)], [1, 2, 3, 4, 5])
+        self.assertIs(consumer.held_frame, frames[11])
+        self.assertEqual(self.scheduler.flow.conflated, 6)
+        self.assertEqual(self.scheduler.flow.max_depth, 4)
+
+        # The held frame goes out as a keyframe once acknowledged, the delta chain has a gap
+        await consumer.acknowledge(5)
+        last = self.sent(consumer)[-1]
+        self.assertEqual((last['type'], last['frame']), ('keyframe', 12))
+        self.assertIsNone(consumer.held_frame)
+        self.assertEqual(self.scheduler.flow.released, 1)
+
+    async def test_binary_clients_ack_with_an_input_message(self):
+        consumer = self.consumer(protocol=BINARY)
+        frames = self.frames(6)
+        await consumer.game_state(frames[0])
+        await consumer.receive(bytes_data=INPUT_STRUCT.pack(8, 0, 1))
+        for event in frames[1:]:
+            await consumer.game_state(event)
+        self.assertEqual(consumer.send.await_count, 5)
+        self.assertIs(consumer.held_frame, frames[5])
+
+        await consumer.receive(bytes_data=INPUT_STRUCT.pack(8, 0, 5))
+        self.assertEqual(consumer.send.await_args.kwargs['bytes_data'], frames[5][BINARY])
+
+    async def test_clients_that_never_ack_are_conflated_on_the_channel_backlog(self):
+        consumer = self.consumer(protocol=JSON, window=8)
+        frames = self.frames(10)
+        for event in frames[:3]:
+            await consumer.game_state(event)
+        self.assertEqual(consumer.send.await_count, 3)
+
+        # The consumer fell behind, only the frames queued after fewer than 2 others go out
+        queue = consumer.channel_layer.channels['specific.test'] = asyncio.Queue()
+        for event in frames[3:]:
+            queue.put_nowait(event)
+        while not queue.empty():
+            await consumer.game_state(queue.get_nowait())
+        sent = [json.loads(call.kwargs['text_data']) for call in consumer.send.await_args_list]
+        self.assertEqual([message['time'] for message in sent[3:]], [frames[8]['values'][0], frames[9]['values'][0]])
+        self.assertEqual(self.scheduler.flow.conflated, 5)
+        self.assertIsNone(consumer.held_frame)
+
+    async def test_events_are_never_dropped(self):
+        consumer = self.consumer()
+        frames = self.frames(8)
+        await consumer.game_state(frames[0])
+        await consumer.acknowledge(1)
+        for event in frames[1:]:
+            await consumer.game_state(event)
+        self.assertIsNotNone(consumer.held_frame)
+
+        await consumer.game_result({'game_result': {'result': '7-3', 'winner': 'alice', 'status': 'completed'}})
+        await consumer.game_end({'message': 'Game over'})
+        self.assertEqual([message['type'] for message in self.sent(consumer)[-2:]], ['game_result', 'game_end'])
+        self.assertIsNone(consumer.held_frame)
+
+
+class HeartbeatTests(SimpleTestCase):
+    def consumer(self):
+        return mock.Mock(send=mock.AsyncMock(), close=mock.AsyncMock())
+
+    async def test_pongs_before_the_heartbeat_starts_are_ignored(self):
+        consumer = PongConsumer()
+        consumer.heartbeat = None
+        consumer.close = mock.AsyncMock()
+        await consumer.receive(text_data=json.dumps({'action': 'pong', 'id': 1}))
+        consumer.close.assert_not_awaited()
+
+    async def test_answered_pings_measure_the_round_trip(self):
+        consumer = self.consumer()
+        heartbeat = Heartbeat(consumer, 'pong', 'alice', interval=0.01, misses=2)
+        heartbeat.start()
+        try:
+            for _ in range(3):
+                while consumer.send.await_count <= heartbeat.answered:
+                    await asyncio.sleep(0.005)
+                ping = json.loads(consumer.send.await_args.kwargs['text_data'])
+                heartbeat.pong(ping['id'] + 1) # not sent yet
+                heartbeat.pong(ping['id'])
+                self.assertEqual(heartbeat.answered, ping['id'])
+            self.assertEqual(ping['type'], 'ping')
+            self.assertIsNotNone(ping['rtt_ms'])
+            self.assertIn(heartbeat, Heartbeat.live)
+            consumer.close.assert_not_awaited()
+        finally:
+            heartbeat.stop()
+        self.assertNotIn(heartbeat, Heartbeat.live)
+
+    async def test_missed_pings_close_the_socket(self):
+        consumer = self.consumer()
+        heartbeat = Heartbeat(consumer, 'friendship', 'bob', interval=0.01, misses=2)
+        expired = Heartbeat.expired
+        heartbeat.start()
+        await asyncio.wait_for(heartbeat._task, 1)
+
+        self.assertEqual(consumer.send.await_count, 2)
+        consumer.close.assert_awaited_once_with(code=CLOSE_CODE)
+        self.assertEqual(Heartbeat.expired, expired + 1)
+        self.assertNotIn(heartbeat, Heartbeat.live)
+
+
+class GameLoopTests(SimpleTestCase):
+    async def test_late_loop_catches_up_then_skips(self):
+        scheduler = GameScheduler(frame_rate=100, max_catch_up=3)
+        scheduler.running.add('0')
+        scheduler.game_stats['0'] = TickStats()
+        deadlines = []
+
+        async def tick(deadline):
+            deadlines.append(deadline)
+            if len(deadlines) == 1:
+                time.sleep(0.1) # stall the event loop for 10 ticks
+            elif len(deadlines) == 6:
+                scheduler.running.clear()
+
+        scheduler.tick = tick
+        await scheduler._run()
+
+        self.assertGreaterEqual(scheduler.game_stats['0'].skipped, 5)
+        # The 3 catch-up ticks keep their own deadlines, 10 ms apart
+        for previous, deadline in zip(deadlines[1:3], deadlines[2:4]):
+            self.assertAlmostEqual(deadline - previous, 0.01)
+
+    async def test_one_task_advances_every_match_until_it_is_stopped(self):
+        games = new_games(3, seed=1)
+        scheduler = GameScheduler()
+        channel_layer = mock.Mock(group_send=mock.AsyncMock())
+        with mock.patch.dict(registry.games, games, clear=True), \
+                mock.patch('gameBackend.scheduler.get_channel_layer', return_value=channel_layer), \
+                mock.patch('gameBackend.scheduler.score_writer'):
+            for game_id in games:
+                self.assertTrue(scheduler.start_game(game_id))
+            self.assertFalse(scheduler.start_game('0'))
+            task = scheduler._task
+            while games['0'].ticks < 5:
+                await asyncio.sleep(0.005)
+            # Every match is stepped in the same ticks of the same task
+            self.assertIs(scheduler._task, task)
+            self.assertEqual({game.ticks for game in games.values()}, {games['0'].ticks})
+
+            scheduler.stop_game('1')
+            stopped_at = games['1'].ticks
+            while games['0'].ticks < stopped_at + 3:
+                await asyncio.sleep(0.005)
+            self.assertEqual(games['1'].ticks, stopped_at)
+            self.assertEqual(scheduler.running, {'0', '2'})
+            self.assertNotIn('1', scheduler.encoders)
+
+            # The task ends by itself once no match is left
+            scheduler.stop_game('0')
+            scheduler.stop_game('2')
+            await asyncio.wait_for(task, 1)
+
+    def test_lateness_histogram(self):
+        stats = TickStats()
+        for lateness in (0.0, 0.0015, 0.004, 0.5):
+            stats.record(lateness)
+        summary = stats.summary()
+        self.assertEqual(summary['ticks'], 4)
+        self.assertEqual(summary['max_lateness_ms'], 500)
+        self.assertEqual(list(summary['lateness'].values()), [1, 1, 1, 0, 0, 0, 0, 1])
+
+    def test_profiler_windows_roll_over(self):
+        profiler = TickProfiler(window=10, windows=2)
+        profiler.record('physics', 0.000003, '1')
+        profiler.record('send', 0.2)
+        profiler.rotate(profiler.window_end)
+        profiler.record('physics', 0.000004, '1')
+        self.assertEqual(profiler.summary()['phases']['physics']['count'], 2)
+        self.assertEqual(profiler.summary('1')['physics']['max_us'], 4)
+        profiler.rotate(profiler.window_end) # the first window is dropped
+        phases = profiler.summary()['phases']
+        self.assertEqual((phases['physics']['count'], 'send' in phases), (1, False))
+        profiler.drop('1')
+        self.assertIsNone(profiler.summary('1'))
+
+    @mock.patch('gameBackend.scheduler.score_writer')
+    async def test_profiled_tick_times_every_phase(self, score_writer):
+        games = new_games(3, seed=1)
+        scheduler = GameScheduler()
+        scheduler.wake = mock.Mock() # tick by hand
+        profiler = scheduler.enable_profiling()
+        channel_layer = mock.AsyncMock()
+        with mock.patch.dict(registry.games, games, clear=True), \
+                mock.patch('gameBackend.scheduler.get_channel_layer', return_value=channel_layer):
+            for game_id in games:
+                scheduler.start_game(game_id)
+                games[game_id].queue_input(PLAYER1, UP, True)
+            await scheduler.tick()
+            scheduler.stop_game('0')
+
+        phases = profiler.summary()['phases']
+        self.assertEqual(list(phases), ['tick', 'inputs', 'physics', 'encode', 'send'])
+        self.assertEqual(phases['physics']['count'], 3)
+        self.assertEqual(list(profiler.summary('1')), ['inputs', 'physics', 'encode', 'send'])
+        self.assertIsNone(profiler.summary('0'))
+
+
+class ScoreWriterTests(SimpleTestCase):
+    async def test_merges_updates_per_match(self):
+        writer = ScoreWriter(flush_interval=60)
+        with mock.patch.object(ScoreWriter, '_write') as write:
+            writer.record('1', [1, 0])
+            writer.record('2', [0, 1])
+            writer.record('1', [2, 0])
+            await writer.flush('2')
+            await writer.flush()
+        self.assertEqual(write.call_args_list, [mock.call({'2': (0, 1)}), mock.call({'1': (2, 0)})])
+        writer._task.cancel()
+
+    async def test_failed_flush_is_retried(self):
+        writer = ScoreWriter(flush_interval=60)
+        with mock.patch.object(ScoreWriter, '_write', side_effect=Exception("database is down")):
+            writer.record('1', [1, 0])
+            with self.assertLogs('gameBackend.persistence', 'ERROR'):
+                await writer.flush()
+        self.assertEqual(writer.pending, {'1': (1, 0)})
+        writer._task.cancel()
+
+    async def test_finished_matches_are_not_retried_or_overwritten(self):
+        writer = ScoreWriter(flush_interval=60)
+        writer.record('1', [6, 2])
+        writer.record('2', [1, 1])
+
+        def fail_after_finish(batch):
+            writer.discard('1') # finish_game ran while the write was in flight
+            raise Exception("database is down")
+
+        with mock.patch.object(ScoreWriter, '_write', side_effect=fail_after_finish):
+            with self.assertLogs('gameBackend.persistence', 'ERROR'):
+                await writer.flush()
+        self.assertEqual(writer.pending, {'2': (1, 1)})
+        self.assertEqual((writer.writing, writer.discarded), (set(), set()))
+        writer._task.cancel()
+
+        with mock.patch('gameBackend.persistence.Match.objects') as objects:
+            ScoreWriter._write({'2': (1, 1)})
+        objects.filter.assert_called_once_with(match_status='pending')
+        objects.filter.return_value.bulk_update.assert_called_once()
+
+
+class TournamentTests(SimpleTestCase):
+    def consumer(self):
+        consumer = FriendshipConsumer()
+        consumer.channel_layer = mock.Mock(group_send=mock.AsyncMock())
+        consumer.create_match = mock.AsyncMock(return_value=mock.Mock(id=9))
+        consumer.cancel_tournament = mock.AsyncMock()
+        return consumer
+
+    def semifinal(self, status, winner=None):
+        return mock.Mock(match_status=status, match_winner_id=winner and winner.id, match_winner=winner)
+
+    @mock.patch('authentication.consumers.sharding.acreate_game')
+    @mock.patch('authentication.consumers.asyncio.sleep')
+    @mock.patch('authentication.consumers.Match.objects')
+    async def test_final_waits_for_the_recorded_semifinal_winners(self, objects, sleep, acreate_game):
+        alice, carol = mock.Mock(id=1, user_name='alice'), mock.Mock(id=3, user_name='carol')
+        semi1 = self.semifinal(Match.MatchStatusChoices.DONE, alice)
+        semi2 = self.semifinal(Match.MatchStatusChoices.DONE, carol)
+        # Over in the registry, the completion job has not written the second one yet
+        objects.get.side_effect = [semi1, self.semifinal(Match.MatchStatusChoices.PENDING), semi1, semi2]
+        objects.select_related.return_value.get.side_effect = [semi1, semi2]
+        tournament = mock.Mock(id=5, semifinal_1=mock.Mock(id=1), semifinal_2=mock.Mock(id=2))
+        tournament.participants.all.return_value = []
+        consumer = self.consumer()
+
+        await consumer.wait_for_semifinals(tournament)
+        sleep.assert_awaited_once()
+        consumer.create_match.assert_awaited_once_with(alice, carol, 'online', tournament)
+        acreate_game.assert_awaited_once_with('9', 'alice', 'carol', 'online')
+
+    @mock.patch('authentication.consumers.Match.objects')
+    async def test_cancelled_semifinal_cancels_the_tournament(self, objects):
+        objects.get.side_effect = [self.semifinal(Match.MatchStatusChoices.DONE, mock.Mock(id=1)),
+                                   self.semifinal(Match.MatchStatusChoices.CANCELLED)]
+        tournament = mock.Mock(id=5, semifinal_1=mock.Mock(id=1), semifinal_2=mock.Mock(id=2))
+        consumer = self.consumer()
+
+        await consumer.wait_for_semifinals(tournament)
+        consumer.cancel_tournament.assert_awaited_once()
+        consumer.create_match.assert_not_awaited()
+
+
+@mock.patch('gameBackend.completion.finish_job')
+@mock.patch('gameBackend.completion.schedule_retry')
+@mock.patch('gameBackend.completion.report_to_blockchain')
+@mock.patch('gameBackend.completion.blockchain_update', return_value=(1, 2, 7, 3))
+@mock.patch('gameBackend.completion.record_match_result', return_value=completion.JobStatus.RECORDED)
+class CompletionWorkerTests(SimpleTestCase):
+    async def test_job_runs_database_then_blockchain_step(self, record, update, report, retry, finish):
+        await completion.CompletionWorker().process(5)
+        record.assert_called_once_with(5)
+        report.assert_called_once_with(1, 2, 7, 3)
+        finish.assert_called_once_with(5)
+        retry.assert_not_called()
+
+    async def test_failed_step_is_retried(self, record, update, report, retry, finish):
+        error = Exception("chain node is down")
+        report.side_effect = error
+        await completion.CompletionWorker(max_attempts=3, retry_delay=1).process(5)
+        retry.assert_called_once_with(5, error, 3, 1)
+        finish.assert_not_called()
+
+    async def test_finished_job_is_not_run_again(self, record, update, report, retry, finish):
+        record.return_value = completion.JobStatus.DONE
+        await completion.CompletionWorker().process(5)
+        update.assert_not_called()
+        finish.assert_not_called()
+
+
+class InputQueueTests(SimpleTestCase):
+    async def test_tick_applies_queued_inputs_in_order(self):
+        game = new_game('alice', 'bob', 'online', seed=1)
+        game.online = [True, True]
+        game.queue_input(PLAYER1, UP, True, seq=1)
+        game.queue_input(PLAYER2, DOWN, True, seq=4)
+        game.queue_input(PLAYER1, UP, False, seq=2)
+        self.assertEqual(game.moving, [IDLE, IDLE])
+
+        with mock.patch.dict(registry.games, {'0': game}, clear=True):
+            await GameScheduler().advance('0', game)
+
+        self.assertEqual(game.moving, [IDLE, DOWN])
+        self.assertEqual(game.acks, [2, 4])
+        self.assertEqual(len(game.inputs), 0)
+        self.assertEqual((game.frame()['ack1'], game.frame()['ack2']), (2, 4))
+
+
+class ReaperTests(SimpleTestCase):
+    def running_game(self, opponent='online'):
+        game = new_game('alice', 'bob', opponent, seed=1)
+        game.game_running = True
+        game.online = [True, True]
+        return game
+
+    def leave(self, game, paddle, seconds_ago):
+        game.online[paddle] = False
+        game.disconnect_time[paddle] = datetime.utcnow() - timedelta(seconds=seconds_ago)
+
+    def test_verdicts(self):
+        reaper = GameReaper(grace_period=60)
+        now = datetime.utcnow()
+
+        never_joined = new_game('alice', 'bob', 'online', seed=1)
+        self.assertIsNone(reaper.verdict(never_joined, now))
+        self.assertEqual(reaper.verdict(never_joined, now + timedelta(seconds=61)), (completion.Outcome.CANCELLED, None))
+
+        game = self.running_game()
+        self.leave(game, PLAYER1, 30)
+        self.assertIsNone(reaper.verdict(game, now))
+        self.leave(game, PLAYER1, 90)
+        self.assertEqual(reaper.verdict(game, now), (completion.Outcome.FORFEIT, 'bob'))
+        self.leave(game, PLAYER2, 10)
+        self.assertIsNone(reaper.verdict(game, now)) # bob left too, wait for the cancel
+        self.leave(game, PLAYER2, 70)
+        self.assertEqual(reaper.verdict(game, now), (completion.Outcome.CANCELLED, None))
+
+        local = self.running_game('local')
+        self.leave(local, PLAYER1, 90)
+        self.assertEqual(reaper.verdict(local, now), (completion.Outcome.CANCELLED, None))
+
+    async def test_sweep_ends_abandoned_matches_only(self):
+        abandoned, playing = self.running_game(), self.running_game()
+        self.leave(abandoned, PLAYER2, 90)
+        self.leave(playing, PLAYER2, 10)
+        scheduler = GameScheduler()
+        scheduler.running.update({'1', '2'})
+        with mock.patch.dict(registry.games, {'1': abandoned, '2': playing}, clear=True), \
+                mock.patch('gameBackend.reaper.scheduler', scheduler), \
+                mock.patch.object(scheduler, 'finish_game', mock.AsyncMock()) as finish:
+            self.assertEqual(await GameReaper(grace_period=60).sweep(), 1)
+            await asyncio.sleep(0)
+
+        finish.assert_called_once_with('1', abandoned, completion.Outcome.FORFEIT)
+        self.assertEqual((abandoned.status, abandoned.winner), ('done', 'alice'))
+        self.assertEqual(scheduler.running, {'2'})
+
+    async def test_paused_match_is_not_stepped_until_resumed(self):
+        game = self.running_game()
+        scheduler = GameScheduler()
+        scheduler.running.add('1')
+        with mock.patch.dict(registry.games, {'1': game}, clear=True), \
+                mock.patch.object(scheduler, 'wake'):
+            self.assertTrue(scheduler.pause_game('1'))
+            await scheduler.tick()
+            self.assertEqual(game.ticks, 0)
+            self.assertTrue(scheduler.resume_game('1'))
+            self.assertFalse(scheduler.resume_game('1'))
+        self.assertEqual(scheduler.running, {'1'})
+
+
+class SimulationTests(SimpleTestCase):
+    def inputs(self, seed):
+        rng = random.Random(seed)
+        return [(tick, rng.choice(PADDLES), rng.choice([UP, DOWN]), rng.random() < 0.5)
+                for tick in range(1, 20000, 7)]
+
+    def test_same_seed_and_inputs_give_same_frames(self):
+        runs = []
+        for _ in range(2):
+            frames = []
+            game = simulation.run(simulation.new_match(42), self.inputs(42), on_frame=lambda game: frames.append(snapshot(game)))
+            runs.append(frames)
+            self.assertTrue(simulation.is_finished(game))
+        self.assertEqual(runs[0], runs[1])
+
+    @skipIf(np is None, "numpy is not installed")
+    def test_run_many_matches_scalar_run(self):
+        seeds = list(range(30))
+        inputs = {seed: self.inputs(seed) for seed in seeds}
+        scalar = simulation.run_many(seeds, 5000, inputs)
+        vector = simulation.run_many(seeds, 5000, inputs, engine=VectorEngine(capacity=8))
+        for seed in seeds:
+            self.assertEqual(snapshot(scalar[seed]), snapshot(vector[seed]), f"seed {seed}")
+            self.assertEqual(snapshot(scalar[seed]), snapshot(simulation.run(simulation.new_match(seed), inputs[seed], max_ticks=5000)))
+
+
+
+@mock.patch('gameBackend.scheduler.score_writer')
+class ReplayTests(SimpleTestCase):
+    async def test_replay_reproduces_live_match(self, score_writer):
+        rng = random.Random(7)
+        game = GameState('alice', 'bob', 'online', seed=11)
+        game.replay = ReplayRecorder()
+        game.online = [True, False]
+        scheduler = GameScheduler()
+        while not simulation.is_finished(game):
+            if game.ticks == 300:
+                game.online[PLAYER2] = True
+            elif game.ticks == 4000:
+                game.online[PLAYER1] = False # paddle 1 stops until its player is back
+            elif game.ticks == 4500:
+                game.online[PLAYER1] = True
+            if rng.random() < 0.1:
+                game.queue_input(rng.choice(PADDLES), rng.choice([UP, DOWN]), rng.random() < 0.5)
+            await scheduler.advance('0', game)
+
+        data = game.replay.encode(game)
+        self.assertLess(len(data), 8 * 1024)
+        replay = Replay.decode(data)
+        self.assertEqual((replay.ticks, replay.scores), (game.ticks, tuple(game.scores)))
+        self.assertEqual(snapshot(replay.simulate()), snapshot(game))
+        self.assertTrue(replay.verify())
+        frames = list(replay.frames(send_rate=30))
+        self.assertEqual(frames[-1]['score1'], game.scores[PLAYER1])
+
+    def test_decode_rejects_other_data(self, score_writer):
+        with self.assertRaises(ValueError):
+            Replay.decode(b'not a replay at all')
+        game = GameState('alice', 'bob', seed=1)
+        game.replay = ReplayRecorder()
+        game.replay.record_input(70000, PLAYER1, UP, True) # past one 16-bit tick delta
+        replay = Replay.decode(game.replay.encode(game))
+        self.assertEqual(len(replay.events), 1)
+        self.assertEqual(replay.events[0][0], 70000)
+        with self.assertRaises(ValueError):
+            Replay.decode(game.replay.encode(game)[:-1])
+
+class BenchmarkTests(SimpleTestCase):
+    def test_compare_flags_regressions_in_the_right_direction(self):
+        baseline = {'results': [
+            benchmarks.metric('steps', 1000, 'steps/s'),
+            benchmarks.metric('tick', 2.0, 'ms', 'lower'),
+            benchmarks.metric('bytes', 50, 'bytes', 'lower'),
+        ]}
+        report = {'results': [
+            benchmarks.metric('steps', 850, 'steps/s'),
+            benchmarks.metric('tick', 1.0, 'ms', 'lower'),
+            benchmarks.metric('bytes', 52, 'bytes', 'lower'),
+            benchmarks.metric('new', 1, 'ms', 'lower'),
+        ]}
+        rows = {name: regressed for name, _, _, _, regressed in benchmarks.compare(report, baseline, tolerance=10)}
+        self.assertEqual(rows, {'steps': True, 'tick': False, 'bytes': False})
+
+
+class FakeSocket:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    async def receive(self, timeout):
+        return self.messages.pop(0) if self.messages else None
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    async def close(self):
+        pass
+
+
+class LoadTestTests(SimpleTestCase):
+    def test_player_counts_dropped_frames_and_ignores_serve_pauses(self):
+        socket = FakeSocket([
+            json.dumps({'type': 'initial_state', 'player_1': 'alice', 'player_2': 'bob'}),
+            json.dumps({'type': 'keyframe', 'frame': 1, 'time': 17, 'ack1': 0}),
+            json.dumps({'type': 'delta', 'frame': 2, 'time': 33}),
+            json.dumps({'type': 'delta', 'frame': 5, 'time': 83}),
+            json.dumps({'type': 'delta', 'frame': 6, 'time': 1100}), # after a serve pause
+            json.dumps({'type': 'game_result', 'winner': 'alice', 'result': '7 - 3', 'status': 'done'}),
+        ])
+        load_test = loadtest.LoadTest([])
+        load_test.open = mock.AsyncMock(return_value=socket)
+        player = loadtest.Player(load_test, mock.Mock(user_name='alice'), seed=1)
+
+        winner = asyncio.run(player.play('1', DELTA))
+
+        stats = load_test.stats
+        self.assertEqual(winner, 'alice')
+        self.assertEqual(stats.matches, {'1'})
+        self.assertEqual(stats.frames, 4)
+        self.assertEqual(stats.dropped_frames, 2)
+        self.assertEqual(len(stats.inter_arrival_ms), 2)
+        self.assertIn(json.dumps({'action': 'resync'}), socket.sent)
+
+
+class RegistryTests(SimpleTestCase):
+    async def test_waiters_attach_when_the_game_is_created(self):
+        games = GameRegistry()
+        waiter = asyncio.create_task(games.wait_for('1', timeout=5))
+        await asyncio.sleep(0)
+        game = games.create('1', 'alice', 'bob', 'online')
+        self.assertIs(await asyncio.wait_for(waiter, 1), game)
+        self.assertIs(games.create('1', 'carol', 'dave', 'online'), game)
+        self.assertIsNone(await games.wait_for('2', timeout=0.01))
+        self.assertEqual(games._waiters, {})
+
+    def test_player_index_and_hooks(self):
+        games = GameRegistry()
+        created, removed = [], []
+        games.on_create.append(lambda game_id, game: created.append(game_id))
+        games.on_remove.append(lambda game_id, game: removed.append(game_id))
+
+        games.create('1', 'alice', 'bob', 'online')
+        games.lock('1')
+        self.assertEqual((games.game_of('alice'), games.game_of('bob')), ('1', '1'))
+        games.create('2', 'alice', 'alice', 'local')
+        self.assertEqual(games.game_of('alice'), '2')
+
+        games.remove('1')
+        self.assertEqual((games.game_of('alice'), games.game_of('bob')), ('2', None))
+        self.assertNotIn('1', games.locks)
+        self.assertIsNone(games.remove('1'))
+        self.assertEqual((created, removed), (['1', '2'], ['1']))
+
+
+@skipIf(np is None, "numpy is not installed")
+@mock.patch('gameBackend.scheduler.score_writer')
+class BotTests(SimpleTestCase):
+    async def play(self, level, count=8):
+        bots = BotController(capacity=4, seed=1)
+        scheduler = GameScheduler()
+        games = {}
+        for i in range(count):
+            game = new_game('alice', 'alice', 'ai', seed=i, ai_level=level)
+            game.online[PLAYER1] = True # present but never moving
+            games[str(i)] = game
+            bots.add(str(i), game)
+        tick = 0
+        while not all(simulation.is_finished(game) for game in games.values()):
+            tick += 1
+            bots.decide(tick)
+            for game_id, game in games.items():
+                if game_id in bots:
+                    await scheduler.advance(game_id, game)
+                    if simulation.is_finished(game):
+                        bots.remove(game_id) # swaps the last bot into its row
+        self.assertEqual(len(bots), 0)
+        return games
+
+    async def test_bots_beat_an_idle_player_and_replay(self, score_writer):
+        games = await self.play('hard')
+        for game in games.values():
+            self.assertEqual(game.scores, [0, simulation.WINNING_SCORE])
+            self.assertTrue(Replay.decode(game.replay.encode(game)).verify())
+
+    async def test_easy_bots_miss_more(self, score_writer):
+        easy = await self.play('easy')
+        self.assertGreater(sum(game.scores[PLAYER1] for game in easy.values()), 0)
+
+    async def test_bots_read_the_engine_rows_like_their_matches(self, score_writer):
+        snapshots = []
+        for engine in (None, VectorEngine(capacity=2)):
+            games = new_games(6, seed=5)
+            bots = BotController(capacity=2, seed=1)
+            scheduler = GameScheduler(engine=engine)
+            for game_id, game in games.items():
+                bots.add(game_id, game)
+            with mock.patch.dict(registry.games, games, clear=True):
+                for tick in range(1, 301):
+                    if tick == 100:
+                        # Moves the last row of both into the freed one
+                        bots.remove('1')
+                        if engine is not None:
+                            engine.remove('1')
+                    bots.decide(tick, engine)
+                    if engine is not None:
+                        scheduler.advance_vectorized(list(bots.game_ids))
+                    else:
+                        for game_id in bots.game_ids:
+                            await scheduler.advance(game_id, games[game_id])
+            snapshots.append({game_id: snapshot(game) for game_id, game in games.items()})
+        self.assertEqual(snapshots[0], snapshots[1])
+
+
+@mock.patch('gameBackend.scheduler.score_writer')
+class ClientSimulationTests(SimpleTestCase):
+    async def play(self, match_id, seed):
+        rng = random.Random(match_id)
+        game = GameState('alice', 'alice', 'local', seed=seed)
+        game.replay = ReplayRecorder()
+        game.online = [True, True]
+        scheduler = GameScheduler()
+        while not simulation.is_finished(game):
+            if rng.random() < 0.1:
+                game.queue_input(rng.choice(PADDLES), rng.choice([UP, DOWN]), rng.random() < 0.5)
+            await scheduler.advance(str(match_id), game)
+        return game.replay.encode(game)
+
+    async def test_only_the_match_the_client_really_played_is_accepted(self, score_writer):
+        match = mock.Mock(id=5, match_creation_date=timezone.now() - timedelta(hours=1))
+        data = await self.play(5, client_seed(5))
+        self.assertEqual(verify_client_replay(match, data).scores, Replay.decode(data).scores)
+
+        forged = bytearray(data)
+        forged[15], forged[16] = forged[16], forged[15] # swap the recorded scores
+        with self.assertRaisesRegex(ValueError, 'does not match'):
+            verify_client_replay(match, bytes(forged))
+        with self.assertRaisesRegex(ValueError, 'seed'):
+            verify_client_replay(match, await self.play(5, client_seed(6)))
+        match.match_creation_date = timezone.now()
+        with self.assertRaisesRegex(ValueError, 'since it was created'):
+            verify_client_replay(match, data)
+
+    async def test_replays_padded_past_the_winning_goal_are_rejected(self, score_writer):
+        match = mock.Mock(id=5, match_creation_date=timezone.now() - timedelta(hours=1))
+        data = await self.play(5, client_seed(5))
+        replay = Replay.decode(data)
+        padded = bytearray(data)
+        padded[11:15] = (replay.ticks + 3000).to_bytes(4, 'little')
+        with self.assertRaisesRegex(ValueError, 'finished at tick'):
+            verify_client_replay(match, bytes(padded))
+
+        # Stepping on does not score past the end either
+        game = replay.simulate()
+        scores = list(game.scores)
+        for _ in range(3000):
+            simulation.step(game)
+        self.assertEqual(game.scores, scores)
+
+
+@override_settings(PONG_WORKERS=3, PONG_WORKER_ID=0)
+class ShardingTests(SimpleTestCase):
+    def owned_by(self, worker):
+        return next(str(i) for i in range(100) if sharding.owner_of(i) == worker)
+
+    def test_matches_are_spread_over_the_workers(self):
+        owners = [sharding.owner_of(game_id) for game_id in range(300)]
+        self.assertTrue(all(owners.count(worker) > 60 for worker in range(3)))
+        self.assertEqual(owners[:10], [sharding.owner_of(str(game_id)) for game_id in range(10)])
+        self.assertEqual(sharding.ws_path(self.owned_by(2)), f'/ws/w2/pong/{self.owned_by(2)}/')
+        with self.settings(PONG_WORKERS=1):
+            self.assertEqual(sharding.ws_path('7'), '/ws/pong/7/')
+
+    @mock.patch('gameBackend.sharding.registry', new_callable=GameRegistry)
+    @mock.patch('gameBackend.sharding.request')
+    def test_creation_is_forwarded_to_the_owner(self, request, games):
+        local, remote = self.owned_by(0), self.owned_by(1)
+        self.assertEqual(sharding.create_game(local, 'alice', 'alice', 'local', online=True), 0)
+        self.assertEqual(games.get(local).online, [True, True])
+        self.assertEqual(sharding.create_game(remote, 'bob', 'carol', 'online'), 1)
+        self.assertNotIn(remote, games)
+        request.assert_called_once_with(1, 'POST', '/worker_game/', {
+            'game_id': remote, 'player_1': 'bob', 'player_2': 'carol', 'game_opponent': 'online',
+            'ai_level': None, 'online': False,
+        })
+
+    @mock.patch('gameBackend.sharding.registry', new_callable=GameRegistry)
+    def test_worker_only_hosts_its_own_matches(self, games):
+        def post(game_id, token):
+            body = json.dumps({'game_id': game_id, 'player_1': 'alice', 'player_2': 'bob', 'game_opponent': 'online'})
+            request = RequestFactory().post('/worker_game/', body, content_type='application/json',
+                                            HTTP_X_PONG_WORKER_TOKEN=token)
+            return views.worker_game(request).status_code
+
+        self.assertEqual(post(self.owned_by(0), 'forged'), 403)
+        self.assertEqual(post(self.owned_by(1), sharding.worker_token()), 409)
+        self.assertEqual(post(self.owned_by(0), sharding.worker_token()), 201)
+        self.assertEqual(games.get(self.owned_by(0)).players, ('alice', 'bob'))
+
+    @override_settings(SECURE_SSL_REDIRECT=True)
+    @mock.patch('gameBackend.sharding.registry', new_callable=GameRegistry)
+    @mock.patch('gameBackend.views.registry', new_callable=GameRegistry)
+    def test_workers_are_not_redirected_to_https(self, live_games, games):
+        token = {'HTTP_X_PONG_WORKER_TOKEN': sharding.worker_token()}
+        body = {'game_id': self.owned_by(0), 'player_1': 'alice', 'player_2': 'bob', 'game_opponent': 'online'}
+        self.assertEqual(self.client.post('/worker_game/', body, content_type='application/json', **token).status_code, 201)
+        self.assertEqual(self.client.get('/worker_game/?user_name=alice', **token).status_code, 404)
+        # Other paths still are
+        self.assertEqual(self.client.get('/worker_games/').status_code, 301)
+
+    @mock.patch('gameBackend.sharding.UnixHTTPConnection')
+    def test_only_2xx_answers_are_successes(self, connection):
+        response = connection.return_value.getresponse.return_value
+        response.read.return_value = b''
+        for status in (301, 404):
+            response.status = status
+            with self.assertRaises(RuntimeError):
+                sharding.request(1, 'POST', '/worker_game/', {'game_id': '1'})
+        response.status = 201
+        response.read.return_value = b'{"worker": 1}'
+        self.assertEqual(sharding.request(1, 'POST', '/worker_game/', {'game_id': '1'}), {'worker': 1})
+
+
+class PeerChannelLayerTests(SimpleTestCase):
+    async def test_messages_and_groups_cross_workers(self):
+        sockets = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sockets, ignore_errors=True)
+        path = os.path.join(sockets, 'layer-{worker}.sock')
+        first, second = (PeerChannelLayer(worker=worker, workers=2, path=path, capacity=2, expiry=0.2) for worker in (0, 1))
+        try:
+            local, remote = await first.new_channel(), await second.new_channel()
+            await first.group_add('friends', local)
+            # The second worker starts last and both learn each other's groups
+            await second.group_add('friends', remote)
+            await asyncio.sleep(0.05)
+            self.assertEqual(first.peers[1].groups, {'friends'})
+
+            await first.group_send('friends', {'type': 'hello', 'frame': b'\x00\x01'})
+            self.assertEqual(await first.receive(local), {'type': 'hello', 'frame': b'\x00\x01'})
+            self.assertEqual(await asyncio.wait_for(second.receive(remote), 1), {'type': 'hello', 'frame': b'\x00\x01'})
+
+            await first.send(remote, {'type': 'one'})
+            await first.send(remote, {'type': 'two'})
+            with self.assertRaises(ChannelFull):
+                await first.send(remote, {'type': 'three'})
+
+            # Unread messages expire and take their channel out of its groups, which the other worker hears of
+            await asyncio.sleep(0.3)
+            await second.group_send('other', {'type': 'none'})
+            await asyncio.sleep(0.05)
+            self.assertEqual((second.groups, first.peers[1].groups), ({}, set()))
+        finally:
+            await first.close()
+            await second.close()
 
-# Create your tests here.
@@ -12,4 +12,11 @@ urlpatterns = [
     path('get_game_invite_status/', views.get_game_invite_status, name='get_game_invite_status'),
     path('bulk_game_invite_status/', views.bulk_game_invite_status, name='bulk_game_invite_status'),
     path('accept_game_invite_from_user/', views.accept_game_invite_from_user, name='accept_game_invite_from_user'),
+    path('match_completion_status/', views.match_completion_status, name='match_completion_status'),
+    path('active_game/', views.active_game, name='active_game'),
+    path('match_replay/', views.match_replay, name='match_replay'),
+    path('submit_local_match/', views.submit_local_match, name='submit_local_match'),
+    path('game_profile/', views.game_profile, name='game_profile'),
+    path('game_owner/', views.game_owner, name='game_owner'),
+    path('worker_game/', views.worker_game, name='worker_game'),
 ]
\ No newline at end of file
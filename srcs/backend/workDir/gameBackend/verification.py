@@ -0,0 +1,64 @@
+"""
+Local matches simulated by the browser.
+
+Both paddles of a local match belong to the same client, so it can run the match
+itself instead of the server stepping it and streaming every frame back. The
+server only hands out a seed and the tick rate when the match is created, and
+never registers the match with the scheduler. Once the match is over the client
+uploads its input log in the replay format of ``replay.py``, and
+``verify_client_replay`` re-simulates it headless before the result is saved.
+
+The seed is derived from the match id and ``SECRET_KEY``, so nothing has to be
+stored and a client cannot pick the serves of its match.
+"""
+import hashlib
+import hmac
+from django.conf import settings
+from django.utils import timezone
+from . import simulation
+from .replay import Replay
+
+MAX_MATCH_SECONDS = 30 * 60 # longest local match accepted
+CLOCK_SLACK = 5 # seconds a client clock may run ahead of the server's
+
+
+def client_seed(match_id):
+    """The serve seed of the client-simulated match ``match_id``."""
+    digest = hmac.new(settings.SECRET_KEY.encode(), f'local-match:{match_id}'.encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], 'little')
+
+
+def verify_client_replay(match, data):
+    """
+    Re-simulate the replay a client uploaded for ``match`` and return it.
+
+    Raises ValueError when the log is not a finished match of ``match`` or when
+    its recorded score is not the one the simulation gives.
+    """
+    replay = Replay.decode(data)
+    if not replay.local:
+        raise ValueError("Not a local match")
+    if replay.seed != client_seed(match.id):
+        raise ValueError("Wrong seed")
+    if replay.tick_rate != settings.PONG_TICK_RATE:
+        raise ValueError(f"Wrong tick rate, expected {settings.PONG_TICK_RATE}")
+
+    duration = replay.ticks / replay.tick_rate
+    if duration > MAX_MATCH_SECONDS:
+        raise ValueError("Match is too long")
+    # A match cannot have lasted longer than the time since it was created
+    if duration > (timezone.now() - match.match_creation_date).total_seconds() + CLOCK_SLACK:
+        raise ValueError("Match is longer than the time since it was created")
+
+    # The match ends at its winning goal, a log padded past it could score on
+    game = replay.new_game()
+    for _ in replay.steps(game):
+        if simulation.is_finished(game):
+            break
+    if not simulation.is_finished(game):
+        raise ValueError("Match is not finished")
+    if game.ticks != replay.ticks:
+        raise ValueError(f"Match is finished at tick {game.ticks}, not at the recorded tick {replay.ticks}")
+    if tuple(game.scores) != replay.scores:
+        raise ValueError(f"Recorded score {replay.scores[0]}-{replay.scores[1]} does not match the simulated one")
+    return replay
@@ -1,52 +1,34 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpRequest
-from .models import Match, GameInvites
+from django.http import JsonResponse, HttpRequest, HttpResponse, StreamingHttpResponse
+from .models import Match, MatchReplay, GameInvites
 from authentication.decorators import check_auth
 from authentication.models import Users
 from django.views.decorators.csrf import csrf_exempt
 from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from authentication.utils import update_ppp_ratings
+from . import ai, heartbeat, sharding
+from .registry import registry
+from .scheduler import scheduler
+from .replay import Replay
+from .completion import complete_match
+from .verification import client_seed, verify_client_replay
+from .state import PLAYER1, PLAYER2
+from django.conf import settings
 import time
 import asyncio
+import hmac
 import random
 import json
 
-games = {}
-
-
-def create_new_game(player_1, player_2=None, game_opponent='local'):
-    return {
-        'ball_x': 0.5,
-        'ball_y': 0.5,
-        'ball_bounds': 0.01,
-        'ball_speed_x': random.choice([-0.011, 0.011]),
-        'ball_speed_y': random.choice([-0.007, 0.007]),
-        'paddle1_x': 0.02,
-        'paddle2_x': 0.98,
-        'paddle1_y': 0.5,
-        'paddle2_y': 0.5,
-        'paddle_bounds_x': 0.02,
-        'paddle_bounds_y': 0.1,
-        'paddle_speed': 0.02,
-        'last_score1': 0,
-        'last_score2': 0,
-        'score1': 0,
-        'score2': 0,
-        'player_1': player_1,
-        'player_2': player_2,
-        'player1_status': 'offline', # offline, online
-        'player2_status': 'offline', # offline, online
-        'game_opponent': game_opponent,
-        'status': 'Playing' # Playing, Done
-    }
-
 @csrf_exempt
 @check_auth
 def create_game(request):
-    global games
     if request.method == 'POST':
         player = request.POST.get('player')
+        opponent = request.POST.get('opponent')
+        difficulty = request.POST.get('difficulty') or ai.DEFAULT_LEVEL
+        client_simulated = request.POST.get('simulation') == 'client'
         user_id = Users.objects.get(id=request.user_id)
 
         if not player:
@@ -62,6 +44,13 @@ def create_game(request):
                 game_opponent = 'online'
             except:
                 return JsonResponse({'error': 'Player 2 not found'}, status=404)
+        elif opponent == 'ai':
+            if ai.np is None:
+                return JsonResponse({'error': 'AI opponents are not available'}, status=503)
+            if difficulty not in ai.LEVELS:
+                return JsonResponse({'error': f'Invalid difficulty, expected one of {", ".join(ai.LEVELS)}'}, status=400)
+            player = user_id
+            game_opponent = 'ai'
         else:
             player = user_id
             game_opponent = 'local'
@@ -75,14 +64,21 @@ def create_game(request):
             )
             user_id.matches_played += 1
             user_id.save()
-            if game_opponent != 'local':
+            if game_opponent == 'online':
                 player.matches_played += 1
                 user_id.matches_played += 1
                 player.save()
                 user_id.save()
             game_id = str(game.id) 
-            games[game_id] = create_new_game(user_id.user_name, player.user_name, game_opponent)
-            return JsonResponse({'message': 'Game created successfully', 'game_id': game_id, 'user': player.user_name}, status=201)
+            if game_opponent == 'local' and client_simulated:
+                # The browser runs the match and uploads it to submit_local_match
+                return JsonResponse({'message': 'Game created successfully', 'game_id': game_id, 'user': player.user_name,
+                                     'game_opponent': game_opponent, 'simulation': 'client', 'seed': client_seed(game.id),
+                                     'tick_rate': settings.PONG_TICK_RATE}, status=201)
+            ai_level = difficulty if game_opponent == 'ai' else None
+            sharding.create_game(game_id, user_id.user_name, player.user_name, game_opponent, ai_level=ai_level)
+            return JsonResponse({'message': 'Game created successfully', 'game_id': game_id, 'user': player.user_name,
+                                 'game_opponent': game_opponent, 'difficulty': ai_level}, status=201)
         except Exception as e:
             return JsonResponse({'error': f'Failed to create game: {str(e)}'}, status=500)
     
@@ -185,7 +181,6 @@ def cancel_game_invite(request):
 @csrf_exempt
 @check_auth
 def accept_game_invite(request):
-    global games
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
@@ -218,7 +213,7 @@ def accept_game_invite(request):
                 game_opponent=game_opponent
             )
             game_id = str(game.id)
-            games[game_id] = create_new_game(to_user.user_name, from_user.user_name, game_opponent)
+            sharding.create_game(game_id, to_user.user_name, from_user.user_name, game_opponent)
         except Exception as e:
             return JsonResponse({'error': f'Failed to create game: {str(e)}'}, status=500)
 
@@ -452,6 +447,228 @@ def accept_game_invite_from_user(request):
 
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
+# Match Completion Status
+@csrf_exempt
+@check_auth
+def match_completion_status(request):
+    if request.method == 'GET':
+        game_id = request.GET.get('game_id', '').strip()
+        if not game_id:
+            return JsonResponse({'error': 'Missing game_id'}, status=400)
+
+        try:
+            match = Match.objects.select_related('completion_job').get(id=game_id)
+        except (Match.DoesNotExist, ValueError):
+            return JsonResponse({'error': 'Match not found'}, status=404)
+
+        if request.user_id not in (match.player_1_id, match.player_2_id):
+            return JsonResponse({'error': 'Not authorized to view this match'}, status=403)
+
+        job = getattr(match, 'completion_job', None)
+        if job is None:
+            status = 'playing' if game_id in registry else match.match_status
+            return JsonResponse({'game_id': game_id, 'status': status}, status=200)
+
+        return JsonResponse({
+            'game_id': game_id,
+            'status': job.status,
+            'outcome': job.outcome,
+            'attempts': job.attempts,
+            'score_player_1': job.score_player_1,
+            'score_player_2': job.score_player_2,
+            'updated_at': job.updated_at.isoformat()
+        }, status=200)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+# Live match of the current user, for clients reconnecting after a reload
+@csrf_exempt
+@check_auth
+def active_game(request):
+    if request.method == 'GET':
+        user = Users.objects.get(id=request.user_id)
+        game_id = registry.game_of(user.user_name)
+        game = registry.get(game_id) if game_id else None
+        if game is not None:
+            return JsonResponse(live_game(game_id, game), status=200)
+
+        # The match may be hosted by another worker
+        found = sharding.find_game(user.user_name) if sharding.workers() > 1 else None
+        if found is None:
+            return JsonResponse({'error': 'No active game'}, status=404)
+        return JsonResponse(found, status=200)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+# Replay of a finished match: the raw log with format=log, otherwise its frames as JSON lines,
+# simulated while they are streamed
+@csrf_exempt
+@check_auth
+def match_replay(request):
+    if request.method == 'GET':
+        game_id = request.GET.get('game_id', '').strip()
+        if not game_id:
+            return JsonResponse({'error': 'Missing game_id'}, status=400)
+
+        try:
+            stored = MatchReplay.objects.select_related('match__player_1', 'match__player_2').get(match_id=game_id)
+        except (MatchReplay.DoesNotExist, ValueError):
+            return JsonResponse({'error': 'Replay not found'}, status=404)
+
+        data = bytes(stored.data)
+        if request.GET.get('format') == 'log':
+            response = HttpResponse(data, content_type='application/octet-stream')
+            response['Content-Disposition'] = f'attachment; filename="match-{game_id}.pongreplay"'
+            return response
+
+        try:
+            send_rate = min(max(int(request.GET.get('rate', 30)), 1), 120)
+            replay = Replay.decode(data)
+        except ValueError as e:
+            return JsonResponse({'error': f'Invalid replay: {str(e)}'}, status=400)
+
+        players = (stored.match.player_1.user_name, stored.match.player_2.user_name)
+        header = dict(replay.new_game(players).initial_state(), type='replay', game_id=game_id, tick_rate=replay.tick_rate,
+                      send_rate=send_rate, duration=replay.ticks * 1000 // replay.tick_rate, result=list(replay.scores))
+
+        def lines():
+            yield json.dumps(header) + '\n'
+            for frame in replay.frames(send_rate, players):
+                yield json.dumps(frame) + '\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+# Result of a local match simulated by the browser: the body is its replay log,
+# re-simulated here before the match is saved
+MAX_REPLAY_SIZE = 256 * 1024
+
+@csrf_exempt
+@check_auth
+def submit_local_match(request):
+    if request.method == 'POST':
+        game_id = request.GET.get('game_id', '').strip()
+        if not game_id:
+            return JsonResponse({'error': 'Missing game_id'}, status=400)
+
+        try:
+            match = Match.objects.get(id=game_id)
+        except (Match.DoesNotExist, ValueError):
+            return JsonResponse({'error': 'Match not found'}, status=404)
+
+        if match.player_1_id != request.user_id:
+            return JsonResponse({'error': 'Not authorized to submit this match'}, status=403)
+        if match.game_opponent != Match.GameOpponentChoices.LOCAL or game_id in registry:
+            return JsonResponse({'error': 'Match is not simulated by the client'}, status=400)
+        if match.match_status != Match.MatchStatusChoices.PENDING:
+            return JsonResponse({'error': 'Match is already over'}, status=409)
+
+        data = request.body
+        if len(data) > MAX_REPLAY_SIZE:
+            return JsonResponse({'error': 'Replay is too large'}, status=413)
+        try:
+            replay = verify_client_replay(match, data)
+        except ValueError as e:
+            logger.warning(f"[{game_id}] Rejected local match: {e}")
+            return JsonResponse({'error': f'Invalid match: {str(e)}'}, status=400)
+
+        if not complete_match(game_id, replay.scores, bytes(data)):
+            return JsonResponse({'error': 'Match is already over'}, status=409)
+        return JsonResponse({
+            'game_id': game_id,
+            'status': 'done',
+            'score_player_1': replay.scores[PLAYER1],
+            'score_player_2': replay.scores[PLAYER2]
+        }, status=200)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+# Internal: tick phase histograms of the game loop, see GameScheduler.profiler.
+# Async so the histograms are read on the event loop that writes them
+@csrf_exempt
+async def game_profile(request):
+    token = getattr(settings, 'PONG_PROFILE_TOKEN', '')
+    if not token:
+        return JsonResponse({'error': 'Profiling endpoint is disabled'}, status=404)
+    if not hmac.compare_digest(request.headers.get('X-Profile-Token', ''), token):
+        return JsonResponse({'error': 'Invalid profile token'}, status=403)
+
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        if action in ('enable', 'reset'):
+            scheduler.enable_profiling()
+        elif action == 'disable':
+            scheduler.disable_profiling()
+        else:
+            return JsonResponse({'error': 'Invalid action, expected enable, reset or disable'}, status=400)
+    elif request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    profiler = scheduler.profiler
+    if profiler is None:
+        return JsonResponse({'enabled': False, 'flow': scheduler.flow.summary(), 'heartbeat': heartbeat.summary()},
+                            status=200)
+
+    game_id = request.GET.get('game_id', '').strip()
+    if game_id:
+        phases = profiler.summary(game_id)
+        if phases is None:
+            return JsonResponse({'error': 'No profile for this game'}, status=404)
+        return JsonResponse({'enabled': True, 'game_id': game_id, 'phases': phases}, status=200)
+    return JsonResponse(dict(profiler.summary(), enabled=True, tick=scheduler.stats.summary(),
+                             flow=scheduler.flow.summary(), heartbeat=heartbeat.summary()), status=200)
+
+# Worker hosting a live match and the path of its match socket, see sharding.py
+@csrf_exempt
+@check_auth
+def game_owner(request):
+    if request.method == 'GET':
+        game_id = request.GET.get('game_id', '').strip()
+        if not game_id:
+            return JsonResponse({'error': 'Missing game_id'}, status=400)
+
+        return JsonResponse({
+            'game_id': game_id,
+            'worker': sharding.owner_of(game_id),
+            'workers': sharding.workers(),
+            'ws_path': sharding.ws_path(game_id)
+        }, status=200)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+# Internal: the other workers create the matches this worker owns with a POST,
+# and look up the live match of a user with a GET
+@csrf_exempt
+def worker_game(request):
+    if not sharding.check_worker_token(request.headers.get(sharding.WORKER_TOKEN_HEADER)):
+        return JsonResponse({'error': 'Invalid worker token'}, status=403)
+
+    if request.method == 'GET':
+        game_id = registry.game_of(request.GET.get('user_name', ''))
+        game = registry.get(game_id) if game_id else None
+        if game is None:
+            return JsonResponse({'error': 'No active game'}, status=404)
+        return JsonResponse(live_game(game_id, game), status=200)
+
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            game_id = str(data['game_id'])
+            player_1 = data['player_1']
+        except (json.JSONDecodeError, KeyError, TypeError):
+            return JsonResponse({'error': 'Invalid request format'}, status=400)
+        if not sharding.is_local(game_id):
+            return JsonResponse({'error': f'Game is owned by worker {sharding.owner_of(game_id)}'}, status=409)
+
+        sharding.host_game(game_id, player_1, data.get('player_2'), data.get('game_opponent', 'local'),
+                           data.get('ai_level'), bool(data.get('online')))
+        return JsonResponse({'game_id': game_id, 'worker': sharding.worker_id()}, status=201)
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+def live_game(game_id, game):
+    return {
+        'game_id': game_id,
+        'game_opponent': game.game_opponent,
+        'player_1': game.players[PLAYER1],
+        'player_2': game.players[PLAYER2],
+        'status': game.status
+    }
 
 
 
@@ -478,145 +695,8 @@ def accept_game_invite_from_user(request):
 
 import random
 import asyncio
-from django.db.models import Q
 from asgiref.sync import sync_to_async as database_sync_to_async
-from .models import Match, Tournament
-from blockchain.blockchainInterface import TournamentBlockchain
-
-async def game_update(game_id):
-    global games
-    game_id = str(game_id)
-    game_info = games[game_id]
-
-    # Initialize game state
-    if 'score1' not in game_info:
-        game_info['score1'] = 0
-    if 'score2' not in game_info:
-        game_info['score2'] = 0
-    if 'last_score1' not in game_info:
-        game_info['last_score1'] = game_info['score1']
-    if 'last_score2' not in game_info:
-        game_info['last_score2'] = game_info['score2']
-
-    # Update ball position
-    game_info['ball_x'] += game_info['ball_speed_x']
-    game_info['ball_y'] += game_info['ball_speed_y']
-
-    # Scoring
-    if game_info['ball_x'] < game_info['paddle1_x'] - game_info['paddle_bounds_x']:
-        game_info['score2'] += 1
-        await game_reset(game_id)
-    elif game_info['ball_x'] > game_info['paddle2_x'] + game_info['paddle_bounds_x']:
-        game_info['score1'] += 1
-        await game_reset(game_id)
-
-    # Check for game completion and update database
-    if game_info['score1'] >= 7 or game_info['score2'] >= 7:
-        def sync_save_match_completion():
-            # Initialize blockchain instance
-            blockchain = TournamentBlockchain()
-
-            pongMatch = Match.objects.select_related('player_1', 'player_2', 'match_winner', 'match_loser').get(id=game_id)
-            pongMatch.score_player_1 = game_info['score1']
-            pongMatch.score_player_2 = game_info['score2']
-            if game_info['score1'] >= 7:
-                pongMatch.match_winner = pongMatch.player_1
-                pongMatch.match_loser = pongMatch.player_2
-            else:
-                pongMatch.match_winner = pongMatch.player_2
-                pongMatch.match_loser = pongMatch.player_1
-            if pongMatch.game_opponent != 'local':
-                winner = pongMatch.match_winner
-                loser = pongMatch.match_loser
-                winner.matches_played += 1
-                loser.matches_played += 1
-                winner.matches_won += 1
-                winner.win_ratio = (winner.matches_won / winner.matches_played) * 100 if winner.matches_played > 0 else 0
-                loser.win_ratio = (loser.matches_won / loser.matches_played) * 100 if loser.matches_played > 0 else 0
-                update_ppp_ratings(winner, loser, 1)
-                winner.save()
-                loser.save()
-
-            pongMatch.match_status = Match.MatchStatusChoices.DONE
-            pongMatch.save()
-            game_info['status'] = 'Done'
-
-            tournament = Tournament.objects.filter(
-                Q(semifinal_1=pongMatch) | Q(semifinal_2=pongMatch) | Q(final=pongMatch)
-            ).first()
-            if tournament:
-                # Only update blockchain if blockchain_match_id exists
-                if pongMatch.blockchain_match_id is not None:
-                    try:
-                        blockchain.updateMatchScore(
-                            tournament.blockchain_tournament_id,
-                            pongMatch.blockchain_match_id,
-                            pongMatch.score_player_1,
-                            pongMatch.score_player_2
-                        )
-                        logger.info(f"[{game_id}] Blockchain updated: Tournament {tournament.blockchain_tournament_id}, Match {pongMatch.blockchain_match_id}, Scores: {pongMatch.score_player_1}-{pongMatch.score_player_2}")
-                    except Exception as e:
-                        logger.error(f"[{game_id}] Failed to update blockchain: {e}")
-                else:
-                    logger.warning(f"[{game_id}] Skipping blockchain update: Match {pongMatch.id} has no blockchain_match_id")
-
-                game_info['tournament_id'] = str(tournament.id)
-                game_info['report_result'] = True
-
-            print(f"[{game_id}] Saved match: Winner={pongMatch.match_winner}, Status={pongMatch.match_status}")
-
-        try:
-            await database_sync_to_async(sync_save_match_completion)()
-        except Exception as e:
-            print(f"[{game_id}] Failed to save match completion: {e}")
-        return game_info
-
-    # Update scores to DB if changed
-    if game_info['score1'] != game_info['last_score1'] or game_info['score2'] != game_info['last_score2']:
-        def sync_save_scores():
-            pongMatch = Match.objects.select_related('player_1', 'player_2').get(id=game_id)
-            pongMatch.score_player_1 = game_info['score1']
-            pongMatch.score_player_2 = game_info['score2']
-            pongMatch.save(update_fields=['score_player_1', 'score_player_2'])  # Limit fields to avoid signal triggers
-            game_info['last_score1'] = game_info['score1']
-            game_info['last_score2'] = game_info['score2']
+from .models import Match
+import logging
 
-        try:
-            await database_sync_to_async(sync_save_scores)()
-            await asyncio.sleep(1)  # Brief pause for intermediate scores
-        except Exception as e:
-            print(f"[{game_id}] Failed to update intermediate scores: {e}")
-
-    # Wall collision
-    if game_info['ball_y'] < game_info['ball_bounds']:
-        game_info['ball_y'] = game_info['ball_bounds']
-        game_info['ball_speed_y'] = -abs(game_info['ball_speed_y']) if game_info['ball_speed_y'] > 0 else 0.007
-        return game_info
-    elif game_info['ball_y'] > 1 - game_info['ball_bounds']:
-        game_info['ball_y'] = 1 - game_info['ball_bounds']
-        game_info['ball_speed_y'] = -abs(game_info['ball_speed_y']) if game_info['ball_speed_y'] < 0 else -0.007
-        return game_info
-    
-    # Paddle collision
-    if (game_info['ball_x'] >= game_info['paddle1_x'] and 
-        game_info['ball_x'] < game_info['paddle1_x'] + game_info['paddle_bounds_x'] and 
-        game_info['paddle1_y'] - game_info['paddle_bounds_y'] < game_info['ball_y'] < game_info['paddle1_y'] + game_info['paddle_bounds_y']):
-        game_info['ball_speed_x'] = -game_info['ball_speed_x']
-        game_info['ball_speed_y'] = (game_info['ball_y'] - game_info['paddle1_y']) * 0.2
-        return game_info
-    elif (game_info['ball_x'] <= game_info['paddle2_x'] and 
-          game_info['ball_x'] > game_info['paddle2_x'] - game_info['paddle_bounds_x'] and 
-          game_info['paddle2_y'] - game_info['paddle_bounds_y'] < game_info['ball_y'] < game_info['paddle2_y'] + game_info['paddle_bounds_y']):
-        game_info['ball_speed_x'] = -game_info['ball_speed_x']
-        game_info['ball_speed_y'] = (game_info['ball_y'] - game_info['paddle2_y']) * 0.2
-
-    return game_info
-
-async def game_reset(game_id):
-    game_info = games[str(game_id)]
-    game_info['ball_x'] = 0.5
-    game_info['ball_y'] = 0.5
-    game_info['ball_speed_x'] = random.choice([-0.011, 0.011])
-    game_info['ball_speed_y'] = random.choice([-0.007, 0.007])
-    game_info['paddle1_y'] = 0.5
-    game_info['paddle2_y'] = 0.5
\ No newline at end of file
+logger = logging.getLogger(__name__)
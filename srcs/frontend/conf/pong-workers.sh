@@ -0,0 +1,26 @@
+#!/bin/sh
+# Writes the backend workers nginx.conf proxies to, from the PONG_WORKERS of .env that the backend's
+# entrypoint.sh also starts: worker i listens on port 8000 + i. Run by the nginx image before it starts.
+
+WORKERS=${PONG_WORKERS:-1}
+CONF=/etc/nginx/pong-workers.conf
+
+{
+    echo "upstream backend_workers {"
+    i=0
+    while [ "$i" -lt "$WORKERS" ]; do
+        echo "    server backend:$((8000 + i));"
+        i=$((i + 1))
+    done
+    echo "}"
+    echo "map \$pong_worker \$pong_worker_port {"
+    echo "    default \"\";"
+    i=0
+    while [ "$i" -lt "$WORKERS" ]; do
+        echo "    $i $((8000 + i));"
+        i=$((i + 1))
+    done
+    echo "}"
+} > "$CONF"
+
+echo "$0: proxying to $WORKERS backend worker(s)"
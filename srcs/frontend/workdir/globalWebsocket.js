@@ -69,6 +69,11 @@ function initializeWebSocket() {
         friendshipSocket.onmessage = (event) => {
             try {
                 const data = JSON.parse(event.data);
+                if (data.type === 'ping') {
+                    // Heartbeat, the server closes the socket after a few unanswered pings
+                    friendshipSocket.send(JSON.stringify({ type: 'pong', id: data.id }));
+                    return;
+                }
                 if (data.type && (data.type.includes('notification') || data.type.includes('pending'))) {
                     pendingNotifications.push(data);
                     processNotifications();
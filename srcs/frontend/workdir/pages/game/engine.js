@@ -0,0 +1,202 @@
+// frontend/engine.js
+// Port of the server's Pong simulation (gameBackend/simulation.py) for local matches run in the browser.
+// Every step must do the same floating point operations in the same order as the server,
+// which re-simulates the uploaded input log to verify the score.
+
+const PLAYER1 = 0;
+const PLAYER2 = 1;
+const IDLE = 0;
+const UP = -1;
+const DOWN = 1;
+
+const BASE_TICK_RATE = 60;
+const SERVE_SPEED_X = 0.011;
+const SERVE_SPEED_Y = 0.007;
+const PADDLE_SPEED = 0.02;
+const PADDLE_SPIN = 0.2;
+const SERVE_DELAY = 1;
+export const WINNING_SCORE = 7;
+
+// Replay log format, see gameBackend/replay.py
+const MAGIC = [0x50, 0x47, 0x52, 0x4C]; // 'PGRL'
+const VERSION = 1;
+const HEADER_SIZE = 18;
+const EVENT_SIZE = 3;
+const MAX_DELTA = 0xFFFF;
+const FLAG_LOCAL = 0x01;
+const ONLINE = 0x10;
+const WAIT = 0xF0;
+const FLAG_BIT = 0x02;
+const DOWN_BIT = 0x04;
+
+function mulberry32(seed) {
+    let state = seed >>> 0;
+    return function () {
+        state = (state + 0x6D2B79F5) >>> 0;
+        let t = Math.imul(state ^ (state >>> 15), state | 1);
+        t ^= t + Math.imul(t ^ (t >>> 7), t | 61);
+        return (t ^ (t >>> 14)) >>> 0;
+    };
+}
+
+export class LocalMatch {
+    constructor(seed, tickRate = BASE_TICK_RATE) {
+        this.seed = seed >>> 0;
+        this.nextRandom = mulberry32(this.seed);
+        this.tickRate = tickRate;
+        this.tickScale = BASE_TICK_RATE / tickRate;
+        this.serveTicks = Math.round(SERVE_DELAY * tickRate);
+        this.ticks = 0;
+        this.ball_x = 0.5;
+        this.ball_y = 0.5;
+        [this.ball_speed_x, this.ball_speed_y] = this.serveSpeed();
+        this.ball_bounds = 0.01;
+        this.paddle_x = [0.02, 0.98];
+        this.paddle_y = [0.5, 0.5];
+        this.paddle_bounds_x = 0.02;
+        this.paddle_bounds_y = 0.1;
+        this.paddle_speed = PADDLE_SPEED * this.tickScale;
+        this.moving = [IDLE, IDLE];
+        this.scores = [0, 0];
+        this.serveDelay = 0;
+        this.inputs = [];
+        this.events = [];
+        this.lastEventTick = 0;
+        // Both paddles are played here, the log starts with both players online like a server match
+        this.record(1, ONLINE | PLAYER1 | FLAG_BIT);
+        this.record(1, ONLINE | PLAYER2 | FLAG_BIT);
+    }
+
+    choice(values) {
+        return values[this.nextRandom() % values.length];
+    }
+
+    serveSpeed() {
+        return [this.choice([-SERVE_SPEED_X, SERVE_SPEED_X]) * this.tickScale,
+                this.choice([-SERVE_SPEED_Y, SERVE_SPEED_Y]) * this.tickScale];
+    }
+
+    isFinished() {
+        return this.scores[PLAYER1] >= WINNING_SCORE || this.scores[PLAYER2] >= WINNING_SCORE;
+    }
+
+    // paddle is 'player1' or 'player2', direction 'up' or 'down', applied at the start of the next tick
+    queueInput(paddle, direction, pressed) {
+        this.inputs.push([paddle === 'player2' ? PLAYER2 : PLAYER1, direction === 'down' ? DOWN : UP, pressed]);
+    }
+
+    record(tick, code) {
+        let delta = tick - this.lastEventTick;
+        while (delta > MAX_DELTA) {
+            this.events.push([MAX_DELTA, WAIT]);
+            delta -= MAX_DELTA;
+        }
+        this.events.push([delta, code]);
+        this.lastEventTick = tick;
+    }
+
+    drainInputs() {
+        for (const [paddle, direction, pressed] of this.inputs) {
+            this.record(this.ticks + 1, paddle | (pressed ? FLAG_BIT : 0) | (direction === DOWN ? DOWN_BIT : 0));
+            if (pressed) {
+                this.moving[paddle] = direction;
+            } else if (this.moving[paddle] === direction) {
+                this.moving[paddle] = IDLE;
+            }
+        }
+        this.inputs.length = 0;
+    }
+
+    reset() {
+        this.ball_x = 0.5;
+        this.ball_y = 0.5;
+        [this.ball_speed_x, this.ball_speed_y] = this.serveSpeed();
+        this.paddle_y[PLAYER1] = 0.5;
+        this.paddle_y[PLAYER2] = 0.5;
+    }
+
+    // One tick, returns false during the serve pause when nothing moved
+    step() {
+        this.drainInputs();
+        this.ticks += 1;
+
+        // A finished match stands still, it cannot score again
+        if (this.isFinished()) return false;
+
+        if (this.serveDelay > 0) {
+            this.serveDelay -= 1;
+            return false;
+        }
+
+        const paddle_y = this.paddle_y;
+        for (const paddle of [PLAYER1, PLAYER2]) {
+            if (this.moving[paddle] === UP) {
+                paddle_y[paddle] = Math.max(0 + this.paddle_bounds_y, paddle_y[paddle] - this.paddle_speed);
+            } else if (this.moving[paddle] === DOWN) {
+                paddle_y[paddle] = Math.min(1 - this.paddle_bounds_y, paddle_y[paddle] + this.paddle_speed);
+            }
+        }
+
+        const paddle_x = this.paddle_x;
+        const bounds_x = this.paddle_bounds_x;
+        const bounds_y = this.paddle_bounds_y;
+
+        this.ball_x += this.ball_speed_x;
+        this.ball_y += this.ball_speed_y;
+
+        let scorer = null;
+        if (this.ball_x < paddle_x[PLAYER1] - bounds_x) {
+            scorer = PLAYER2;
+        } else if (this.ball_x > paddle_x[PLAYER2] + bounds_x) {
+            scorer = PLAYER1;
+        }
+        if (scorer !== null) {
+            this.scores[scorer] += 1;
+            this.reset();
+            if (!this.isFinished()) this.serveDelay = this.serveTicks;
+            return true;
+        }
+
+        if (this.ball_y < this.ball_bounds) {
+            this.ball_y = this.ball_bounds;
+            this.ball_speed_y = this.ball_speed_y > 0 ? -Math.abs(this.ball_speed_y) : SERVE_SPEED_Y * this.tickScale;
+            return true;
+        } else if (this.ball_y > 1 - this.ball_bounds) {
+            this.ball_y = 1 - this.ball_bounds;
+            this.ball_speed_y = this.ball_speed_y < 0 ? -Math.abs(this.ball_speed_y) : -SERVE_SPEED_Y * this.tickScale;
+            return true;
+        }
+
+        if (this.ball_x >= paddle_x[PLAYER1] &&
+            this.ball_x < paddle_x[PLAYER1] + bounds_x &&
+            paddle_y[PLAYER1] - bounds_y < this.ball_y && this.ball_y < paddle_y[PLAYER1] + bounds_y) {
+            this.ball_speed_x = -this.ball_speed_x;
+            this.ball_speed_y = (this.ball_y - paddle_y[PLAYER1]) * PADDLE_SPIN * this.tickScale;
+        } else if (this.ball_x <= paddle_x[PLAYER2] &&
+                   this.ball_x > paddle_x[PLAYER2] - bounds_x &&
+                   paddle_y[PLAYER2] - bounds_y < this.ball_y && this.ball_y < paddle_y[PLAYER2] + bounds_y) {
+            this.ball_speed_x = -this.ball_speed_x;
+            this.ball_speed_y = (this.ball_y - paddle_y[PLAYER2]) * PADDLE_SPIN * this.tickScale;
+        }
+        return true;
+    }
+
+    // The input log in the server's replay format, for submit_local_match
+    encodeReplay() {
+        const bytes = new Uint8Array(HEADER_SIZE + this.events.length * EVENT_SIZE);
+        const view = new DataView(bytes.buffer);
+        bytes.set(MAGIC, 0);
+        view.setUint8(4, VERSION);
+        view.setUint32(5, this.seed, true);
+        view.setUint16(9, this.tickRate, true);
+        view.setUint32(11, this.ticks, true);
+        view.setUint8(15, this.scores[PLAYER1]);
+        view.setUint8(16, this.scores[PLAYER2]);
+        view.setUint8(17, FLAG_LOCAL);
+        this.events.forEach(([delta, code], i) => {
+            view.setUint16(HEADER_SIZE + i * EVENT_SIZE, delta, true);
+            view.setUint8(HEADER_SIZE + i * EVENT_SIZE + 2, code);
+        });
+        return bytes;
+    }
+}
@@ -1,4 +1,6 @@
 // frontend/game.js
+import { LocalMatch } from './engine.js';
+
 async function fetchLogin() {
     try {
         const response = await fetch('api/profile/', {
@@ -27,6 +29,14 @@ export async function game() {
     let reconnectionAttempts = 0;
     const maxReconnectionAttempts = 5;
     let opponentName = null;
+    let frameState = {};
+    let lastFrame = null;
+    let latency = null; // round trip time to the server in ms, measured by its heartbeats
+    let ackEvery = 0; // frames between acknowledgements, the server stops sending past a window of unacknowledged frames
+    let resyncRequested = false;
+    let inputSeq = 0; // echoed back as ack1/ack2 once the server applied the input
+    let localMatch = null; // set when this browser simulates a local match itself
+    let localFrame = null;
 
     if (!player) {
         player = await fetchLogin();
@@ -179,6 +189,10 @@ export async function game() {
         ctx.fillStyle = "white";
         ctx.fillText(score1, width / 4, 50);
         ctx.fillText(score2, (width * 3) / 4, 50);
+        if (latency !== null) {
+            ctx.font = "12px Arial";
+            ctx.fillText(`${latency} ms`, width / 2 - 20, 20);
+        }
     }
 
     function drawGame(game, ctx, canvas, offScreenCanvas) {
@@ -201,28 +215,38 @@ export async function game() {
         drawGame(game, ctx, canvas, offScreenCanvas);
     }
 
+    // Inputs of a local match simulated here go to the local engine instead of the server
+    function sendInput(message) {
+        if (localMatch) {
+            const direction = message.action.startsWith('w') || message.action.startsWith('up') ? 'up' : 'down';
+            localMatch.queueInput(message.paddle, direction, message.action.endsWith('Start'));
+        } else if (websocket && websocket.readyState === WebSocket.OPEN) {
+            websocket.send(JSON.stringify(message));
+        }
+    }
+
     function handleKeyDown(event) {
         if (gameMode === 'local') {
             if (event.key === 'w' && !keyState['w']) {
                 keyState['w'] = true;
-                websocket.send(JSON.stringify({ 'action': 'wStart', 'player_id': player, 'paddle': 'player1' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'wStart', 'player_id': player, 'paddle': 'player1' });
             } else if (event.key === 's' && !keyState['s']) {
                 keyState['s'] = true;
-                websocket.send(JSON.stringify({ 'action': 'sStart', 'player_id': player, 'paddle': 'player1' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'sStart', 'player_id': player, 'paddle': 'player1' });
             } else if (event.key === 'ArrowUp' && !keyState['ArrowUp']) {
                 keyState['ArrowUp'] = true;
-                websocket.send(JSON.stringify({ 'action': 'upStart', 'player_id': player, 'paddle': 'player2' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'upStart', 'player_id': player, 'paddle': 'player2' });
             } else if (event.key === 'ArrowDown' && !keyState['ArrowDown']) {
                 keyState['ArrowDown'] = true;
-                websocket.send(JSON.stringify({ 'action': 'downStart', 'player_id': player, 'paddle': 'player2' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'downStart', 'player_id': player, 'paddle': 'player2' });
             }
         } else {
             if (event.key === 'ArrowUp' && !keyState['ArrowUp']) {
                 keyState['ArrowUp'] = true;
-                websocket.send(JSON.stringify({ 'action': 'upStart', 'player_id': player }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'upStart', 'player_id': player });
             } else if (event.key === 'ArrowDown' && !keyState['ArrowDown']) {
                 keyState['ArrowDown'] = true;
-                websocket.send(JSON.stringify({ 'action': 'downStart', 'player_id': player }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'downStart', 'player_id': player });
             }
         }
     }
@@ -231,24 +255,24 @@ export async function game() {
         if (gameMode === 'local') {
             if (event.key === 'w' && keyState['w']) {
                 keyState['w'] = false;
-                websocket.send(JSON.stringify({ 'action': 'wStop', 'player_id': player, 'paddle': 'player1' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'wStop', 'player_id': player, 'paddle': 'player1' });
             } else if (event.key === 's' && keyState['s']) {
                 keyState['s'] = false;
-                websocket.send(JSON.stringify({ 'action': 'sStop', 'player_id': player, 'paddle': 'player1' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'sStop', 'player_id': player, 'paddle': 'player1' });
             } else if (event.key === 'ArrowUp' && keyState['ArrowUp']) {
                 keyState['ArrowUp'] = false;
-                websocket.send(JSON.stringify({ 'action': 'upStop', 'player_id': player, 'paddle': 'player2' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'upStop', 'player_id': player, 'paddle': 'player2' });
             } else if (event.key === 'ArrowDown' && keyState['ArrowDown']) {
                 keyState['ArrowDown'] = false;
-                websocket.send(JSON.stringify({ 'action': 'downStop', 'player_id': player, 'paddle': 'player2' }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'downStop', 'player_id': player, 'paddle': 'player2' });
             }
         } else {
             if (event.key === 'ArrowUp' && keyState['ArrowUp']) {
                 keyState['ArrowUp'] = false;
-                websocket.send(JSON.stringify({ 'action': 'upStop', 'player_id': player }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'upStop', 'player_id': player });
             } else if (event.key === 'ArrowDown' && keyState['ArrowDown']) {
                 keyState['ArrowDown'] = false;
-                websocket.send(JSON.stringify({ 'action': 'downStop', 'player_id': player }));
+                sendInput({ 'seq': ++inputSeq, 'action': 'downStop', 'player_id': player });
             }
         }
     }
@@ -274,6 +298,7 @@ export async function game() {
         gameMode = null;
         reconnectionAttempts = 0;
         opponentName = null;
+        stopLocalMatch();
 
         document.removeEventListener('keydown', handleKeyDown);
         document.removeEventListener('keyup', handleKeyUp);
@@ -297,6 +322,8 @@ export async function game() {
         document.removeEventListener('keydown', handleKeyDown);
         document.removeEventListener('keyup', handleKeyUp);
         keyState = {};
+        const clientSimulated = localMatch !== null;
+        stopLocalMatch();
 
         if (websocket) {
             if (websocket.readyState === WebSocket.OPEN || websocket.readyState === WebSocket.CONNECTING) {
@@ -330,14 +357,18 @@ export async function game() {
                     method: 'POST',
                     credentials: 'include',
                     headers: { 'Content-Type': 'application/x-www-form-urlencoded' },
-                    body: ''
+                    body: clientSimulated ? 'simulation=client' : ''
                 })
                     .then(response => response.json().then(data => ({ ok: response.ok, data })))
                     .then(({ ok, data }) => {
                         if (ok && data.game_id) {
                             gameId = data.game_id;
                             resetGame();
-                            connectWebSocket();
+                            if (data.simulation === 'client') {
+                                startLocalMatch(data.seed, data.tick_rate);
+                            } else {
+                                connectWebSocket();
+                            }
                         } else {
                             console.error("Game creation failed:", data);
                             window.location.hash = '#play';
@@ -351,19 +382,42 @@ export async function game() {
         }
     }
 
-    function connectWebSocket() {
-        if (websocket && (websocket.readyState === WebSocket.OPEN || websocket.readyState === WebSocket.CONNECTING)) {
+    // The match socket is served by the backend worker hosting the match
+    async function fetchSocketPath() {
+        try {
+            const response = await fetch(`api/game_owner/?game_id=${gameId}`, { credentials: 'include' });
+            if (response.ok) {
+                const data = await response.json();
+                if (data.ws_path) return data.ws_path;
+            }
+        } catch (error) {
+            console.error("Failed to look up the game's worker:", error);
+        }
+        return `/ws/pong/${gameId}/`;
+    }
+
+    function socketBusy() {
+        return websocket && (websocket.readyState === WebSocket.OPEN || websocket.readyState === WebSocket.CONNECTING);
+    }
+
+    async function connectWebSocket() {
+        if (socketBusy()) {
             console.warn("Existing WebSocket detected, skipping new connection");
             return;
         }
 
-        const wsUrl = `wss://${window.location.host}/ws/pong/${gameId}/`;
+        const socketPath = await fetchSocketPath();
+        if (socketBusy()) return; // connected while the path was looked up
+
+        const wsUrl = `wss://${window.location.host}${socketPath}`;
         console.log("Attempting to connect to WebSocket at:", wsUrl);
-        websocket = new WebSocket(wsUrl);
+        websocket = new WebSocket(wsUrl, ['pong.delta']);
 
         websocket.onopen = function () {
             console.log('WebSocket opened for player:', player);
             reconnectionAttempts = 0;
+            lastFrame = null;
+            latency = null;
             preGame.textContent = "Connected, waiting for game state...";
             websocket.send(JSON.stringify({ 'action': 'connect', 'player_id': player }));
             attachKeyListeners();
@@ -371,6 +425,12 @@ export async function game() {
 
         websocket.onmessage = function (event) {
             let game_state = JSON.parse(event.data);
+            if (game_state.type === 'ping') {
+                // Heartbeat, the server closes the socket after a few unanswered pings
+                latency = game_state.rtt_ms;
+                websocket.send(JSON.stringify({ 'action': 'pong', 'id': game_state.id }));
+                return;
+            }
             console.log("WebSocket message:", game_state); // Debug incoming messages
 
             if (game_state.error) {
@@ -385,6 +445,27 @@ export async function game() {
                 preGame.textContent = game_state.message;
             }
 
+            if (game_state.type === 'keyframe' || game_state.type === 'delta') {
+                // pong.delta frames only carry the fields that changed, merge them into the last frame
+                if (game_state.type === 'delta' && game_state.frame !== lastFrame + 1) {
+                    if (!resyncRequested) {
+                        websocket.send(JSON.stringify({ 'action': 'resync' }));
+                        resyncRequested = true;
+                    }
+                    return;
+                }
+                resyncRequested = false;
+                lastFrame = game_state.frame;
+                if (ackEvery && lastFrame % ackEvery === 0) {
+                    websocket.send(JSON.stringify({ 'action': 'ack', 'frame': lastFrame }));
+                }
+                game_state = Object.assign(frameState, game_state);
+            }
+
+            if (game_state.type === 'initial_state') {
+                ackEvery = game_state.ack_every || 0;
+            }
+
             if (game_state.type === 'initial_state' && !initialStateReceived) {
                 paddle1_x = game_state.paddle1_x;
                 paddle2_x = game_state.paddle2_x;
@@ -393,6 +474,7 @@ export async function game() {
                 paddle_bounds_y = game_state.paddle_bounds_y;
                 gameMode = game_state.game_opponent;
                 opponentName = game_state.player_1 === player ? game_state.player_2 : game_state.player_1;
+                if (gameMode === 'ai') opponentName = `AI (${game_state.ai_level})`;
                 initialStateReceived = true;
                 preGame.style.display = "none";
                 canvas.style.display = "flex";
@@ -450,7 +532,77 @@ export async function game() {
         };
     }
 
-    connectWebSocket();
+    // Local matches simulated by the browser: the server only verifies the uploaded input log at the end
+    function startLocalMatch(seed, tickRate) {
+        localMatch = new LocalMatch(seed, tickRate);
+        paddle1_x = localMatch.paddle_x[0];
+        paddle2_x = localMatch.paddle_x[1];
+        ball_bounds = localMatch.ball_bounds;
+        paddle_bounds_x = localMatch.paddle_bounds_x;
+        paddle_bounds_y = localMatch.paddle_bounds_y;
+        gameMode = 'local';
+        initialStateReceived = true;
+        preGame.style.display = "none";
+        canvas.style.display = "flex";
+        attachKeyListeners();
+
+        const tickDuration = 1000 / tickRate;
+        let last = performance.now();
+        let pending = 0;
+        const loop = (now) => {
+            const match = localMatch;
+            if (!match) return;
+            // At most a few ticks per frame: a hidden tab pauses the match rather than fast-forwarding it
+            pending = Math.min(pending + now - last, tickDuration * 5);
+            last = now;
+            while (pending >= tickDuration && !match.isFinished()) {
+                match.step();
+                pending -= tickDuration;
+            }
+            score_1 = match.scores[0];
+            score_2 = match.scores[1];
+            updateAndDrawGame({
+                'ball_x': match.ball_x,
+                'ball_y': match.ball_y,
+                'paddle1_y': match.paddle_y[0],
+                'paddle2_y': match.paddle_y[1],
+            });
+            if (match.isFinished()) {
+                submitLocalMatch(match);
+                return;
+            }
+            localFrame = requestAnimationFrame(loop);
+        };
+        localFrame = requestAnimationFrame(loop);
+    }
+
+    function stopLocalMatch() {
+        if (localFrame !== null) cancelAnimationFrame(localFrame);
+        localFrame = null;
+        localMatch = null;
+    }
+
+    function submitLocalMatch(match) {
+        const winner = match.scores[0] >= 7 ? 'player1' : 'player2';
+        fetch(`api/submit_local_match/?game_id=${gameId}`, {
+            method: 'POST',
+            credentials: 'include',
+            headers: { 'Content-Type': 'application/octet-stream' },
+            body: match.encodeReplay()
+        })
+            .then(response => response.json().then(data => ({ ok: response.ok, data })))
+            .then(({ ok, data }) => {
+                if (!ok) console.error("Local match was not accepted:", data);
+            })
+            .catch(error => console.error("Error submitting local match:", error));
+        cleanup(winner);
+    }
+
+    if (history.state?.simulation === 'client') {
+        startLocalMatch(history.state.seed, history.state.tick_rate);
+    } else {
+        connectWebSocket();
+    }
 
     setTimeout(() => {
         if (!initialStateReceived && (!websocket || websocket.readyState !== WebSocket.OPEN)) {
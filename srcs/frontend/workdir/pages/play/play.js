@@ -68,14 +68,15 @@ export async function setupMatchModes() {
     }
 
     // --- Local Match Logic ---
-    const startLocalBtn = document.querySelector('.start-local-btn');
+    const startLocalBtn = document.querySelector('.start-local-btn:not(.start-ai-btn)');
     if (startLocalBtn) {
         const localHandler = (e) => {
             e.stopPropagation();
             if (friendshipSocket.readyState === WebSocket.OPEN) {
                 sendWebSocketMessage({
                     type: 'create_local_game',
-                    user: currentUsername
+                    user: currentUsername,
+                    simulation: 'client'
                 });
             } else {
                 alert('Connection error: Please try again later');
@@ -85,6 +86,27 @@ export async function setupMatchModes() {
         cleanupFunctions.push(() => startLocalBtn.removeEventListener('click', localHandler));
     }
 
+    // --- AI Match Logic ---
+    const startAiBtn = document.querySelector('.start-ai-btn');
+    const aiDifficulty = document.querySelector('.ai-difficulty');
+    if (startAiBtn) {
+        const aiHandler = (e) => {
+            e.stopPropagation();
+            if (friendshipSocket.readyState === WebSocket.OPEN) {
+                sendWebSocketMessage({
+                    type: 'create_local_game',
+                    user: currentUsername,
+                    opponent: 'ai',
+                    difficulty: aiDifficulty ? aiDifficulty.value : 'medium'
+                });
+            } else {
+                alert('Connection error: Please try again later');
+            }
+        };
+        startAiBtn.addEventListener('click', aiHandler);
+        cleanupFunctions.push(() => startAiBtn.removeEventListener('click', aiHandler));
+    }
+
     // --- 1v1 Logic ---
     const start1v1Btn = document.querySelector('.start-1v1-btn');
     const friendSearch = document.querySelector('#friendSearch');
@@ -662,7 +662,8 @@ async function syncStateWithWebSocket() {
                     break;
                 case 'local_game_created':
                     if (data.user === currentUsername) {
-                        history.pushState({ game_id: data.game_id, user: currentUsername, from_username: currentUsername, to_username: null, game_mode: 'local' }, "", "#game");
+                        history.pushState({ game_id: data.game_id, user: currentUsername, from_username: currentUsername, to_username: null, game_mode: data.game_opponent || 'local',
+                                            simulation: data.simulation, seed: data.seed, tick_rate: data.tick_rate }, "", "#game");
                         window.routeToPage('game');
                     }
                     break;